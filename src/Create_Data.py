@@ -20,7 +20,25 @@ from channelLocationMap import channelLocationMap
 
 from fNIRSdatagen import fNIRSSignalGenerator
 
-def Create_Data(Iterations=1):
+# Noise sources of each noise type: [Breath, Vaso, Heart, Gauss, Experi]
+NOISE_TYPES = [[0,0,0,0,0],
+               [0,0,0,1,0],
+               [1,0,0,0,0],
+               [0,1,0,0,0],
+               [0,0,1,0,0],
+               [1,1,1,0,0],
+               [1,1,1,1,0],
+               [0,0,0,0,1]]
+
+# Variabilities: [boxVar, chanVar]; NoVar, BoxVar, ChanVar and AllVar
+VARIABILITIES = [[0,0], [1,0], [0,1], [1,1]]
+
+
+def createGenerator():
+    '''
+    Creates the fNIRSSignalGenerator of the dataset; 4 channels of a
+    HITACHI ETG-4000 2x2 optode array and 3000 samples.
+    '''
     newId = 3
     newDescription = 'First New Config'
     newNChannels = 4
@@ -58,23 +76,14 @@ def Create_Data(Iterations=1):
                               optodesSurfacePositions = newOptodesSurfacePositions,
                               chOptodeArrays = newChOptodeArrays, optodesOptodeArrays = newOptodesOptodeArrays,
                               pairings = newPairings, optodeArrays = newOptodeArrays)
-    round0 = [0,0,0,0,0]
-    round1 = [0,0,0,1,0]
-    round2 = [1,0,0,0,0]
-    round3 = [0,1,0,0,0]
-    round4 = [0,0,1,0,0]
-    round5 = [1,1,1,0,0]
-    round6 = [1,1,1,1,0]
-    round7 = [0,0,0,0,1]
-    
-    NoiseType = [round0, round1, round2, round3, round4, round5, round6, round7]
-    
-    NoVar = [0,0]
-    BoxVar = [1,0]
-    ChanVar = [0,1]
-    AllVar = [1,1]
-    
-    Var = [NoVar, BoxVar, ChanVar, AllVar]
+    return sg
+#end createGenerator()
+
+
+def Create_Data(Iterations=1):
+    sg = createGenerator()
+    NoiseType = NOISE_TYPES
+    Var = VARIABILITIES
     
     #imported_datas, Exertion = 0, boxVar=0, chanVar=0, type3 = 0, indv = 0, session = 0, Breath=0, Vaso=0, Heart=0, Gauss=0, Experi=0, Plot=0
     distsVecList = sg.import_distsVec()
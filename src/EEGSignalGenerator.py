@@ -40,6 +40,12 @@ from optodeArrayInfo import optodeArrayInfo
 
 from channelLocationMap import channelLocationMap
 
+from rngStreams import getGenerator, seedSequence, sourceGenerators, EEG_SOURCES
+
+from timebase import timebase
+
+import signalFilters
+
 # Class EEGSignalGenerator is a subclass of channelLocationMap
 class EEGSignalGenerator(channelLocationMap):
     '''
@@ -322,7 +328,7 @@ class EEGSignalGenerator(channelLocationMap):
 
     def addFrequencyBand(self, channelsList=list(), initSample=0, endSample=-1, \
                          freqBand='alpha', amplitudeScalingFactor=1, \
-                         frequencyResolutionStep=0.1):
+                         frequencyResolutionStep=0.1, rng=None):
         '''
 		Adds a frequency band to the data tensor.
 
@@ -356,6 +362,9 @@ class EEGSignalGenerator(channelLocationMap):
 			within the interval of frequencies of the band to be simulated.
 			Optional. Default is 0.1.
 		:type frequencyResolutionStep: float (positive)
+		:param rng: Random generator or seed. See module :mod:`rngStreams`.
+			Optional. Default is None (fresh unpredictable stream).
+		:type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
 
 		:return: None
 		:rtype: NoneType
@@ -396,7 +405,7 @@ class EEGSignalGenerator(channelLocationMap):
         if endSample <= initSample:  # Ensure the endSample is posterior to the initSample
             msg = self.getClassName() + ':addFrequencyBand: Unexpected parameter value for parameter ''endSample''.'
             raise ValueError(msg)
-        # No need to type check freqBand, amplitudeScalingFactor and frequencyResolutionStep as these
+        # No need to type check freqBand, amplitudeScalingFactor, frequencyResolutionStep and rng as these
         # are passed to method generateFrequencyBand.
 
         channelsList = list(set(channelsList))  # Unique and sort elements
@@ -407,16 +416,17 @@ class EEGSignalGenerator(channelLocationMap):
                                              nSamples=nSamples, \
                                              nChannels=nChannels, \
                                              amplitudeScalingFactor=amplitudeScalingFactor, \
-                                             frequencyResolutionStep=frequencyResolutionStep)
+                                             frequencyResolutionStep=frequencyResolutionStep, \
+                                             rng=rng)
         self.__data[initSample:endSample, channelsList, :] = \
             self.__data[initSample:endSample, channelsList, :] + tmpData
 
         return
-    # end addFrequencyBand(self,channelsList = list(), initSample = 0, ... , frequencyResolutionStep = 0.1)
+    # end addFrequencyBand(self,channelsList = list(), initSample = 0, ... , frequencyResolutionStep = 0.1, rng=None)
 
     def generateFrequencyBand(self, freqBand='alpha', nSamples=100, \
                               nChannels=1, amplitudeScalingFactor=1, \
-                              frequencyResolutionStep=0.1):
+                              frequencyResolutionStep=0.1, rng=None):
         '''
 		Generates synthetic data with energy in the chosen frequency band
 
@@ -443,6 +453,9 @@ class EEGSignalGenerator(channelLocationMap):
 			within the interval of frequencies of the band to be simulated.
 			Optional. Default is 0.1.
 		:type frequencyResolutionStep: float (positive)
+		:param rng: Random generator or seed. See module :mod:`rngStreams`.
+			Optional. Default is None (fresh unpredictable stream).
+		:type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
 
 		:return: A data tensor.
 		:rtype: numpy.ndarray
@@ -496,21 +509,17 @@ class EEGSignalGenerator(channelLocationMap):
             raise ValueError(msg)
 
         freqBand.sort()  # Ensure the min frequency is the first element.
-        timestamps = np.arange(0, nSamples / self.samplingRate, \
-                               1 / self.samplingRate, dtype=float)
-        timestamps = timestamps.reshape(-1, 1)  # Reshape to column vector
-        timestamps = np.tile(timestamps, nChannels)
+        timestamps = timebase(nSamples, self.samplingRate)[:, None]  # Column vector; broadcast over channels
         synthData = np.zeros((nSamples, nChannels, 1))  # The synthetic data tensor
 
         frequencySet = np.arange(freqBand[0], freqBand[1] + frequencyResolutionStep, \
                                  frequencyResolutionStep, dtype=float)
+        rng = getGenerator(rng)
         for freq in frequencySet:
             # Amplitude. One random amplitude per channel
-            A = amplitudeScalingFactor * np.random.rand(1, nChannels)
-            A = np.tile(A, [nSamples, 1])
+            A = amplitudeScalingFactor * rng.random((1, nChannels))
             # Phase [rad]. One random phase per channel
-            theta = 2 * math.pi * np.random.rand(1, nChannels) - math.pi
-            theta = np.tile(theta, [nSamples, 1])
+            theta = 2 * math.pi * rng.random((1, nChannels)) - math.pi
             # Generate the fundamental signal
             tmpSin = A * np.sin(2 * math.pi * freq * timestamps + theta)
             # Elment-wise multiplication with the amplitude
@@ -523,11 +532,11 @@ class EEGSignalGenerator(channelLocationMap):
         # synthData[:,:,0] = synthData[:,:,0] + (1/pow(freq, 2)) * tmpSin
 
         return synthData
-    # end generateFrequencyBand(self,freqBand = 'alpha',nSamples = 100, ... , frequencyResolutionStep = 0.1)
+    # end generateFrequencyBand(self,freqBand = 'alpha',nSamples = 100, ... , frequencyResolutionStep = 0.1, rng=None)
 
     def addBackgroundNoise(self, channelsList: object = list(), initSample: object = 0, endSample: object = -1, \
 						   allFreqBands: object = [0.5, 40], exp_alpha: object = -2, amplitudeScalingFactor: object = 1, \
-						   frequencyResolutionStep: object = 0.1) -> object:
+						   frequencyResolutionStep: object = 0.1, rng: object = None) -> object:
         '''
 		Adds background noise to the data tensor.
 		The generated noise is added to the class :attr:`data`.
@@ -562,6 +571,9 @@ class EEGSignalGenerator(channelLocationMap):
 			within the interval of frequencies of the band to be simulated.
 			Optional. Default is 0.1.
 		:type frequencyResolutionStep: float (positive)
+		:param rng: Random generator or seed. See module :mod:`rngStreams`.
+			Optional. Default is None (fresh unpredictable stream).
+		:type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
 
 		:return: None
 		:rtype: NoneType
@@ -631,20 +643,16 @@ class EEGSignalGenerator(channelLocationMap):
         nSamples = endSample - initSample
 
         allFreqBands.sort()  # Ensure the min frequency is the first element.
-        timestamps = np.arange(0, nSamples / self.samplingRate, \
-                               1 / self.samplingRate, dtype=float)
-        timestamps = timestamps.reshape(-1, 1)  # Reshape to column vector
-        timestamps = np.tile(timestamps, nChannels)
+        timestamps = timebase(nSamples, self.samplingRate)[:, None]  # Column vector; broadcast over channels
 
         frequencySet = np.arange(allFreqBands[0], allFreqBands[1] + frequencyResolutionStep, \
                                  frequencyResolutionStep, dtype=float)
+        rng = getGenerator(rng)
         for freq in frequencySet:
             # Amplitude. One random amplitude per channel
-            A = amplitudeScalingFactor * np.random.rand(1, nChannels)
-            A = np.tile(A, [nSamples, 1])
+            A = amplitudeScalingFactor * rng.random((1, nChannels))
             # Phase [rad]. One random phase per channel
-            theta = 2 * math.pi * np.random.rand(1, nChannels) - math.pi
-            theta = np.tile(theta, [nSamples, 1])
+            theta = 2 * math.pi * rng.random((1, nChannels)) - math.pi
             # Generate the fundamental signal
             tmpSin = A * np.sin(2 * math.pi * freq * timestamps + theta)
             # Elment-wise multiplication with the amplitude
@@ -657,21 +665,28 @@ class EEGSignalGenerator(channelLocationMap):
                 self.__data[initSample:endSample, channelsList, 0] + pow(freq, exp_alpha) * tmpSin
 
         return
-    # end addBackgroundNoise(self, channelsList=list(), initSample=0, endSample=-1, ..., frequencyResolutionStep = 0.1):
+    # end addBackgroundNoise(self, channelsList=list(), initSample=0, endSample=-1, ..., frequencyResolutionStep = 0.1, rng=None):
 
-    def execute(self):
+    def execute(self, rng=None):
         '''
 		Generates the synthetic EEG data from the properties
 		information.
 
+		:param rng: Random generator or seed. One independent child stream
+			is derived per band (see :data:`rngStreams.EEG_SOURCES`).
+			Optional. Default is None (fresh unpredictable stream).
+		:type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+
 		:return: A 3D data tensor
 		:rtype: numpy.ndarray
 		'''
 
+        streams = sourceGenerators(rng, EEG_SOURCES)
+
         self.addBackgroundNoise(channelsList=list(range(0, self.nChannels)), \
 								initSample=0, endSample=-1, \
 								allFreqBands=[0.5,40], exp_alpha=-2, amplitudeScalingFactor=1, \
-								frequencyResolutionStep=0.1)
+								frequencyResolutionStep=0.1, rng=streams['background'])
 
         #for freqBandValue in self.frequency_bands:
         #    self.addFrequencyBand(channelsList=list(range(0, self.nChannels)), \
@@ -680,22 +695,80 @@ class EEGSignalGenerator(channelLocationMap):
 
         self.addFrequencyBand(channelsList=list(range(0, self.nChannels)), \
         				  initSample=0, endSample=-1, \
-        				  freqBand='alpha')
+        				  freqBand='alpha', rng=streams['alpha'])
         self.addFrequencyBand(channelsList=[0, 1, 2, 3], \
         				  initSample=round(self.nSamples / 2), endSample=-1, \
-        				  freqBand='theta')
+        				  freqBand='theta', rng=streams['theta'])
         self.addFrequencyBand(channelsList=[0, 1, 2, 3], \
         				  initSample=round(self.nSamples / 4), \
         				  endSample=round(3 * self.nSamples / 4), \
-        				  freqBand='delta')
+        				  freqBand='delta', rng=streams['delta'])
         self.addFrequencyBand(channelsList=[0, 1, 2, 3], \
         				  initSample=158, \
         				  endSample=846, \
         				  freqBand='gamma', \
-        				  amplitudeScalingFactor=2.2)
+        				  amplitudeScalingFactor=2.2, rng=streams['gamma'])
 
         return copy.deepcopy(self.data)
-    # end execute(self)
+    # end execute(self, rng=None)
+
+    def filterData(self, band=signalFilters.EEG_BAND, order=4, btype=None):
+        '''
+		Zero-phase filters the data tensor along time, all channels at
+		once. See :func:`signalFilters.filtfilt`.
+
+		:param band: Cut-off frequency [Hz], or (low, high) for a band.
+			Default is :data:`signalFilters.EEG_BAND`.
+		:type band: float or tuple
+		:param order: The filter order. Default is 4.
+		:type order: int (positive)
+		:param btype: The filter type. Optional. See :func:`signalFilters.designFilter`.
+		:type btype: str or NoneType
+
+		:return: The filtered data tensor (also stored in :attr:`data`).
+		:rtype: numpy.ndarray
+		'''
+
+        self.data = signalFilters.filtfilt(self.data, band, self.samplingRate, order=order, btype=btype)
+
+        return self.data
+    # end filterData(self, band=signalFilters.EEG_BAND, order=4, btype=None)
+
+    def streamChunks(self, chunkSize=128, nRecordings=None, rng=None):
+        '''
+		Generates synthetic EEG data in streaming mode; back to back
+		recordings of :attr:`nSamples` samples, each synthesized (see
+		:meth:`execute`) from a fresh child stream of rng, and yielded
+		in chunks of chunkSize samples.
+
+		:param chunkSize: Number of samples per chunk; the last chunk of a
+			recording may be shorter. Default is 128.
+		:type chunkSize: int (positive)
+		:param nRecordings: Number of recordings. Optional. Default is None (endless).
+		:type nRecordings: int or NoneType
+		:param rng: Random generator or seed. Optional. Default is None
+			(fresh unpredictable stream).
+		:type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+
+		:return: An iterator of chunks <chunkSize x nChannels x 1>.
+		:rtype: generator
+		'''
+
+        # Check parameters
+        if type(chunkSize) is not int or chunkSize <= 0:
+            msg = self.getClassName() + ':streamChunks: Unexpected parameter value for parameter ''chunkSize''.'
+            raise ValueError(msg)
+
+        seeds = seedSequence(rng)
+        nDone = 0
+        while nRecordings is None or nDone < nRecordings:
+            # execute adds to the data tensor; start each recording from zeros
+            self.data = np.zeros((self.nSamples, self.nChannels, 1), dtype=float)
+            recording = self.execute(rng=seeds.spawn(1)[0])
+            for start in range(0, recording.shape[0], chunkSize):
+                yield recording[start:start + chunkSize]
+            nDone += 1
+    # end streamChunks(self, chunkSize=128, nRecordings=None, rng=None)
 
 #class EEGSignalGenerator
 
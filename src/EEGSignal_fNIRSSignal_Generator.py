@@ -43,6 +43,12 @@ from EEGSignalGenerator import EEGSignalGenerator
 
 from fNIRSSignalGenerator import fNIRSSignalGenerator
 
+from edfWriter import writeEDF
+
+from syntheticTextFormat import writeSyntheticText
+
+from syntheticBinaryFormat import writeSyntheticBinary
+
 
 #from scipy import stats
 
@@ -141,46 +147,20 @@ def main():
 
         # Creation of the output file for the EEG synthetic data
         fileName = "synthetic{:03d}_EEG_{}Chs_{:.0f}Hz_{}secs.txt"
-        fileOut = open(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime), "w")
-        fileOut.write(f'File: {fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)}\n')
-        fileOut.write(f'Run ID:       \t\t{iD_Run:03d}\n')
-        fileOut.write(f'Number of samples:\t{sgEEG.nSamples}\n')
-        fileOut.write(f'Number of channels:\t{sgEEG.nChannels}\n')
-        fileOut.write(f'Sampling rate:\t\t{sgEEG.samplingRate:.0f} Hz\n')
-        fileOut.write(f'Sampling time:\t\t{samplingTime} secs\n')
-
-        nChs = sgEEG.nChannels
-        for i in range(sgEEG.nSamples):
-            sgEEG_list = sgEEG.data[i,:,0].tolist()
-            for j in range(nChs-1):
-                fileOut.write(f'{sgEEG_list[j]}, ')
-            fileOut.write(f'{sgEEG_list[-1]}\n')
-
-        fileOut.close()
+        writeSyntheticText(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime), sgEEG.data, iD_Run, \
+                           sgEEG.samplingRate, samplingTime, nSamples=sgEEG.nSamples)
+        writeSyntheticBinary(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)[:-4] + '.bin', sgEEG.data, iD_Run, \
+                             sgEEG.samplingRate, samplingTime)
+
+        # EDF+ export of the (not interpolated) EEG synthetic data, for standard EEG tools
+        writeEDF(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)[:-4] + '.edf', sgEEG)
 
         # Creation of the output file for the fNIRs synthetic data
         fileName = "synthetic{:03d}_fNIRs_{}Chs_{:.0f}Hz_{}secs.txt"
-        fileOut = open(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime), "w")
-        fileOut.write(f'File: {fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime)}\n')
-        fileOut.write(f'Run ID:       \t\t{iD_Run:03d}\n')
-        fileOut.write(f'Number of samples:\t{sgfNIRS.nSamples} \tNumber of samples after interpolation:\t{sgEEG.nSamples}\n')
-        fileOut.write(f'Number of channels:\t{sgfNIRS.nChannels}\n')
-        fileOut.write(f'Sampling rate:\t\t{sgfNIRS.samplingRate:.0f} Hz\n')
-        fileOut.write(f'Sampling time:\t\t{samplingTime} secs\n')
-
-        nChs = sgfNIRS.nChannels
-        for i in range(sgEEG.nSamples):
-            sgfNIRS_list = sgfNIRS_NewData[i, :, 0].tolist()
-            for j in range(nChs - 1):
-                fileOut.write(f'{sgfNIRS_list[j]}, ')
-            fileOut.write(f'{sgfNIRS_list[-1]}\n')
-
-            sgfNIRS_list = sgfNIRS_NewData[i, :, 1].tolist()
-            for j in range(nChs - 1):
-                fileOut.write(f'{sgfNIRS_list[j]}, ')
-            fileOut.write(f'{sgfNIRS_list[-1]}\n')
-
-        fileOut.close()
+        writeSyntheticText(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime), sgfNIRS_NewData, iD_Run, \
+                           sgfNIRS.samplingRate, samplingTime, nSamples=sgfNIRS.nSamples, nSamplesInterpolated=sgEEG.nSamples)
+        writeSyntheticBinary(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime)[:-4] + '.bin', sgfNIRS_NewData, iD_Run, \
+                             sgEEG.samplingRate, samplingTime) # interpolated to the EEG sampling rate
 
     else:   # sgEEG.nSamples <= sgfNIRS.nSamples
         sgEEG_NewData = np.zeros((sgfNIRS.nSamples, sgEEG.nChannels, 1),dtype=float)
@@ -198,46 +178,20 @@ def main():
 
         # Creation of the output file for the EEG synthetic data
         fileName = "synthetic{:03d}_EEG_{}Chs_{:.0f}Hz_{}secs.txt"
-        fileOut = open(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime), "w")
-        fileOut.write(f'File: {fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)}\n')
-        fileOut.write(f'Run ID:       \t\t{iD_Run:03d}\n')
-        fileOut.write(f'Number of samples:\t{sgEEG.nSamples} \tNumber of samples after interpolation:\t{sgfNIRS.nSamples}\n')
-        fileOut.write(f'Number of channels:\t{sgEEG.nChannels}\n')
-        fileOut.write(f'Sampling rate:\t\t{sgEEG.samplingRate:.0f} Hz\n')
-        fileOut.write(f'Sampling time:\t\t{samplingTime} secs\n')
-
-        nChs = sgEEG.nChannels
-        for i in range(sgfNIRS.nSamples):
-            sgEEG_list = sgEEG_NewData[i,:,0].tolist()
-            for j in range(nChs-1):
-                fileOut.write(f'{sgEEG_list[j]}, ')
-            fileOut.write(f'{sgEEG_list[-1]}\n')
-
-        fileOut.close()
+        writeSyntheticText(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime), sgEEG_NewData, iD_Run, \
+                           sgEEG.samplingRate, samplingTime, nSamples=sgEEG.nSamples, nSamplesInterpolated=sgfNIRS.nSamples)
+        writeSyntheticBinary(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)[:-4] + '.bin', sgEEG_NewData, iD_Run, \
+                             sgfNIRS.samplingRate, samplingTime) # interpolated to the fNIRS sampling rate
+
+        # EDF+ export of the (not interpolated) EEG synthetic data, for standard EEG tools
+        writeEDF(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime)[:-4] + '.edf', sgEEG)
 
         # Creation of the output file for the fNIRs synthetic data
         fileName = "synthetic{:03d}_fNIRs_{}Chs_{:.0f}Hz_{}secs.txt"
-        fileOut = open(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime), "w")
-        fileOut.write(f'File: {fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime)}\n')
-        fileOut.write(f'Run ID:       \t\t{iD_Run:03d}\n')
-        fileOut.write(f'Number of samples:\t{sgfNIRS.nSamples}\n')
-        fileOut.write(f'Number of channels:\t{sgfNIRS.nChannels}\n')
-        fileOut.write(f'Sampling rate:\t\t{sgfNIRS.samplingRate:.0f} Hz\n')
-        fileOut.write(f'Sampling time:\t\t{samplingTime} secs\n')
-
-        nChs = sgfNIRS.nChannels
-        for i in range(sgfNIRS.nSamples):
-            sgfNIRS_list = sgfNIRS.data[i, :, 0].tolist()
-            for j in range(nChs - 1):
-                fileOut.write(f'{sgfNIRS_list[j]}, ')
-            fileOut.write(f'{sgfNIRS_list[-1]}\n')
-
-            sgfNIRS_list = sgfNIRS.data[i, :, 1].tolist()
-            for j in range(nChs - 1):
-                fileOut.write(f'{sgfNIRS_list[j]}, ')
-            fileOut.write(f'{sgfNIRS_list[-1]}\n')
-
-        fileOut.close()
+        writeSyntheticText(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime), sgfNIRS.data, iD_Run, \
+                           sgfNIRS.samplingRate, samplingTime, nSamples=sgfNIRS.nSamples)
+        writeSyntheticBinary(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime)[:-4] + '.bin', sgfNIRS.data, iD_Run, \
+                             sgfNIRS.samplingRate, samplingTime)
 
 # end main()
 
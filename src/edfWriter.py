@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+#File: edfWriter.py
+#
+'''
+Module ***edfWriter***
+
+Streaming EDF+ (16 bit) and BDF+ (24 bit) export of synthetic EEG data.
+
+:class:`edfWriter` takes chunks <nSamples x nChannels x 1> (or
+<nSamples x nChannels>) of :class:`EEGSignalGenerator` data, e.g. from
+:meth:`EEGSignalGenerator.execute`, scales them to integers in one
+vectorized operation, and writes whole data records, each with its
+"EDF Annotations" time-keeping signal, with a single buffered write per
+chunk. Samples short of a full record are carried over to the next chunk,
+so memory use is bounded by the chunk size. On :meth:`edfWriter.close` the
+last record is padded with zeros and the number of data records in the
+header is patched.
+
+The files are EDF+C/BDF+C (continuous), readable by the standard EEG
+tools. Values outside the physical range are clipped; see
+:attr:`edfWriter.nClipped`.
+'''
+
+import datetime
+
+import numpy as np
+
+
+EDF_HEADER_BYTES = 256 # Bytes of the fixed header and per signal
+ANNOTATION_BYTES = 60 # Bytes of the annotation signal per data record
+
+
+def _field(value, width):
+    #An ASCII header field, left aligned and space padded
+    text = str(value)
+    if len(text) > width:
+        text = text[0:width]
+    return text.ljust(width).encode('ascii', errors='replace')
+#end _field(value, width)
+
+
+def _number(value, width):
+    #A header number in at most width characters
+    for precision in range(width, 0, -1):
+        text = ('%.' + str(precision) + 'g') % value
+        if len(text) <= width:
+            break
+    return _field(text, width)
+#end _number(value, width)
+
+
+class edfWriter:
+    '''
+    Streaming EDF+/BDF+ writer. Use as a context manager, or call :meth:`close`.
+    '''
+
+    def __init__(self, fileName, nChannels, samplingRate, labels=None, bdf=False, \
+                 physicalRange=(-200.0, 200.0), physicalDimension='uV', recordDuration=1.0, \
+                 patientID='X X X X', recordingID=None, startTime=None):
+        '''
+        :Parameters:
+        :param fileName: The file to create (overwritten); .edf or .bdf.
+        :type fileName: str
+        :param nChannels: Number of channels.
+        :type nChannels: int (positive)
+        :param samplingRate: The sampling rate [Hz].
+        :type samplingRate: float (positive)
+        :param labels: The channel labels. Optional. Default is None ('EEG 1', ...).
+        :type labels: list, tuple or NoneType
+        :param bdf: Write BDF+ (24 bit) rather than EDF+ (16 bit). Default is False.
+        :type bdf: bool
+        :param physicalRange: Physical (min, max) mapped to the digital range. Default is (-200, 200).
+        :type physicalRange: tuple
+        :param physicalDimension: Unit of the data. Default is 'uV'.
+        :type physicalDimension: str
+        :param recordDuration: Duration [s] of a data record; samplingRate *
+            recordDuration must be an integer. Default is 1.
+        :type recordDuration: float (positive)
+        :param patientID: EDF+ patient identification. Default is 'X X X X'.
+        :type patientID: str
+        :param recordingID: EDF+ recording identification. Optional.
+            Default is None ('Startdate <date> X X EEGSignalGenerator').
+        :type recordingID: str or NoneType
+        :param startTime: Start of the recording. Optional. Default is None (now).
+        :type startTime: datetime.datetime or NoneType
+        '''
+
+        #Check parameters
+        if type(nChannels) is not int or nChannels <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nChannels''.'
+            raise ValueError(msg)
+        if samplingRate <= 0 or recordDuration <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameters ''samplingRate'' or ''recordDuration''.'
+            raise ValueError(msg)
+        samplesPerRecord = samplingRate * recordDuration
+        if abs(samplesPerRecord - round(samplesPerRecord)) > 1e-9 or round(samplesPerRecord) < 1:
+            msg = self.getClassName() + ':__init__: samplingRate * recordDuration must be an integer.'
+            raise ValueError(msg)
+        if physicalRange[0] >= physicalRange[1]:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''physicalRange''.'
+            raise ValueError(msg)
+        if labels is None:
+            labels = ['EEG ' + str(k+1) for k in range(nChannels)]
+        if len(labels) != nChannels:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''labels''.'
+            raise ValueError(msg)
+        if startTime is None:
+            startTime = datetime.datetime.now()
+        if recordingID is None:
+            recordingID = 'Startdate ' + startTime.strftime('%d-%b-%Y').upper() + ' X X EEGSignalGenerator'
+
+        self.__nChannels = nChannels
+        self.__samplesPerRecord = int(round(samplesPerRecord))
+        self.__recordDuration = recordDuration
+        self.__bytesPerSample = 3 if bdf else 2
+        self.__digitalRange = (-8388608, 8388607) if bdf else (-32768, 32767)
+        self.__physicalRange = (float(physicalRange[0]), float(physicalRange[1]))
+        self.__annotationSamples = ANNOTATION_BYTES // self.__bytesPerSample
+        self.__nRecords = 0
+        self.__nClipped = 0
+        self.__pending = np.empty((0, nChannels)) #Samples short of a record
+
+        #Fixed header and signal headers
+        annotationLabel = ('BDF' if bdf else 'EDF') + ' Annotations'
+        nSignals = nChannels + 1
+        header = [b'\xffBIOSEMI' if bdf else _field('0', 8), _field(patientID, 80), _field(recordingID, 80), \
+                  _field(startTime.strftime('%d.%m.%y'), 8), _field(startTime.strftime('%H.%M.%S'), 8), \
+                  _field(EDF_HEADER_BYTES * (nSignals + 1), 8), _field('BDF+C' if bdf else 'EDF+C', 44), \
+                  _field(-1, 8), _number(recordDuration, 8), _field(nSignals, 4)]
+        signals = list(labels) + [annotationLabel]
+        digitalMin, digitalMax = self.__digitalRange
+        for fields, width in ((signals, 16), \
+                              ([''] * nSignals, 80), \
+                              ([physicalDimension] * nChannels + [''], 8), \
+                              ([_number(physicalRange[0], 8)] * nChannels + [_field(-1, 8)], 8), \
+                              ([_number(physicalRange[1], 8)] * nChannels + [_field(1, 8)], 8), \
+                              ([digitalMin] * nSignals, 8), \
+                              ([digitalMax] * nSignals, 8), \
+                              ([''] * nSignals, 80), \
+                              ([self.__samplesPerRecord] * nChannels + [self.__annotationSamples], 8), \
+                              ([''] * nSignals, 32)):
+            header.extend(elem if isinstance(elem, bytes) else _field(elem, width) for elem in fields)
+
+        self.__file = open(fileName, 'wb')
+        self.__file.write(b''.join(header))
+    #end __init__(self, fileName, nChannels, samplingRate, ...)
+
+
+    @property
+    def nRecords(self): #nRecords getter
+        '''
+        Number of data records written so far.
+
+        :getter: Gets the number of records.
+        :type: int
+        '''
+
+        return self.__nRecords
+    #end nRecords(self)
+
+
+    @property
+    def nClipped(self): #nClipped getter
+        '''
+        Number of samples clipped to the physical range so far.
+
+        :getter: Gets the number of clipped samples.
+        :type: int
+        '''
+
+        return self.__nClipped
+    #end nClipped(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def append(self, chunk):
+        '''
+        Appends a chunk of samples; all complete data records are written
+        at once.
+
+        :param chunk: The data <nSamples x nChannels x 1> or <nSamples x nChannels>.
+        :type chunk: numpy.ndarray
+        :return: None
+        :rtype: NoneType
+        '''
+
+        #Check parameters
+        if self.__file is None:
+            msg = self.getClassName() + ':append: The file is closed.'
+            raise ValueError(msg)
+        chunk = np.asarray(chunk, dtype=float)
+        if chunk.ndim == 3 and chunk.shape[2] == 1:
+            chunk = chunk[:, :, 0]
+        if chunk.ndim != 2 or chunk.shape[1] != self.__nChannels:
+            msg = self.getClassName() + ':append: Unexpected parameter value for parameter ''chunk''. Expected <nSamples x ' \
+                  + str(self.__nChannels) + ' x 1>.'
+            raise ValueError(msg)
+
+        if len(self.__pending) > 0:
+            chunk = np.concatenate((self.__pending, chunk), axis=0)
+        nRecords = chunk.shape[0] // self.__samplesPerRecord
+        self.__pending = chunk[nRecords * self.__samplesPerRecord:].copy()
+        if nRecords > 0:
+            self.__writeRecords(chunk[0:nRecords * self.__samplesPerRecord])
+    #end append(self, chunk)
+
+
+    def __writeRecords(self, samples):
+        nRecords = samples.shape[0] // self.__samplesPerRecord
+        physicalMin, physicalMax = self.__physicalRange
+        digitalMin, digitalMax = self.__digitalRange
+
+        #Vectorized scaling to the digital range
+        self.__nClipped += int(np.count_nonzero((samples < physicalMin) | (samples > physicalMax)))
+        gain = (digitalMax - digitalMin) / (physicalMax - physicalMin)
+        digital = np.rint((np.clip(samples, physicalMin, physicalMax) - physicalMin) * gain + digitalMin)
+        #<nRecords x nChannels x samplesPerRecord>; each record holds the channels one after the other
+        digital = digital.reshape(nRecords, self.__samplesPerRecord, self.__nChannels).transpose(0, 2, 1)
+        if self.__bytesPerSample == 2:
+            signalBytes = digital.astype('<i2', order='C').view(np.uint8).reshape(nRecords, -1)
+        else:
+            signalBytes = digital.astype('<i4', order='C').view(np.uint8).reshape(nRecords, -1, 4)[:, :, 0:3].reshape(nRecords, -1)
+
+        #Time-keeping annotation of each record; '+onset' followed by two 0x14 and a 0x00
+        annotations = np.zeros((nRecords, ANNOTATION_BYTES), dtype=np.uint8)
+        for k in range(nRecords):
+            onset = ('%.6f' % ((self.__nRecords + k) * self.__recordDuration)).rstrip('0').rstrip('.')
+            tal = ('+' + onset + '\x14\x14\x00').encode('ascii')
+            annotations[k, 0:len(tal)] = np.frombuffer(tal, dtype=np.uint8)
+
+        self.__file.write(np.concatenate((signalBytes, annotations), axis=1).tobytes())
+        self.__nRecords += nRecords
+    #end __writeRecords(self, samples)
+
+
+    def close(self):
+        '''
+        Writes the last record (zero padded), patches the number of data
+        records in the header and closes the file.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__file is None:
+            return
+        if len(self.__pending) > 0:
+            padded = np.zeros((self.__samplesPerRecord, self.__nChannels))
+            padded[0:len(self.__pending)] = self.__pending
+            self.__pending = np.empty((0, self.__nChannels))
+            self.__writeRecords(padded)
+        self.__file.seek(236)
+        self.__file.write(_field(self.__nRecords, 8))
+        self.__file.close()
+        self.__file = None
+    #end close(self)
+
+
+    def __enter__(self):
+        return self
+    #end __enter__(self)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    #end __exit__(self, excType, excValue, traceback)
+
+#class edfWriter
+
+
+def writeEDF(fileName, generator, data=None, bdf=False, chunkSize=65536, **kwargs):
+    '''
+    Writes the data of an :class:`EEGSignalGenerator` to an EDF+ or BDF+
+    file, chunk by chunk. The channel labels are the surface positions of
+    the channels, if known. See :class:`edfWriter` for the other parameters.
+
+    :param fileName: The file to create (overwritten).
+    :type fileName: str
+    :param generator: The generator.
+    :type generator: EEGSignalGenerator
+    :param data: The data <nSamples x nChannels x 1>. Optional. Default is
+        None (generator.data).
+    :type data: numpy.ndarray or NoneType
+    :param bdf: Write BDF+ (24 bit) rather than EDF+ (16 bit). Default is False.
+    :type bdf: bool
+    :param chunkSize: Number of samples per append. Default is 65536.
+    :type chunkSize: int (positive)
+    :return: The number of clipped samples.
+    :rtype: int
+    '''
+
+    if data is None:
+        data = generator.data
+    labels = kwargs.pop('labels', None)
+    if labels is None:
+        positions = tuple(getattr(generator, 'chSurfacePositions', ()))
+        if len(positions) == data.shape[1] and all(isinstance(elem, str) for elem in positions):
+            labels = ['EEG ' + elem for elem in positions]
+
+    with edfWriter(fileName, data.shape[1], generator.samplingRate, labels=labels, bdf=bdf, **kwargs) as writer:
+        for start in range(0, data.shape[0], chunkSize):
+            writer.append(data[start:start + chunkSize])
+
+    return writer.nClipped
+#end writeEDF(fileName, generator, data=None, bdf=False, chunkSize=65536, ...)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+#File: epochs.py
+#
+'''
+Module ***epochs***
+
+Epoching of synthetic data tensors around the stimulus blocks.
+
+:func:`extractEpochs` cuts a window of pre + post seconds around each block
+onset of data tensors <... x nSamples x nChannels x 2> (e.g. from
+:meth:`fNIRSSignalGenerator.execute`, or a stack of subjects from
+:func:`fNIRSCohort.generateCohort`) and returns them as a tensor
+<... x nEpochs x window x nChannels x 2>.
+
+When the onsets are evenly spaced in samples (as the default paradigm,
+boxCarList_OnsetDurations = [(35, 20), (105, 20), (175, 20), (245, 20)])
+the epochs are a strided view of the data
+(numpy.lib.stride_tricks.sliding_window_view); nothing is copied. Otherwise
+the epochs are gathered with a single fancy index.
+
+:func:`baselineCorrect` and :func:`blockAverage` are vectorized over all
+the epochs and subjects. As the epochs may be a view of the data, they are
+never modified in place unless asked for.
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def blockOnsets(boxCarList):
+    '''
+    Gets the onsets [s] of the blocks of a boxcar.
+
+    :param boxCarList: List of tuples (xi, yi) [s] of the blocks.
+    :type boxCarList: list
+    :return: The onsets <nBlocks>.
+    :rtype: numpy.ndarray
+    '''
+
+    return np.array([elem[0] for elem in boxCarList], dtype=float)
+#end blockOnsets(boxCarList)
+
+
+def epochSamples(onsets, samplingRate, pre, post):
+    '''
+    Gets the first sample of the epochs and the window length.
+
+    :param onsets: Onsets [s] of the epochs.
+    :type onsets: list or numpy.ndarray
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float (positive)
+    :param pre: Time [s] before each onset.
+    :type pre: float (non negative)
+    :param post: Time [s] after each onset.
+    :type post: float (positive)
+    :return: The first samples <nEpochs>, the number of samples before the
+        onset and the window length [samples].
+    :rtype: tuple
+    '''
+
+    #Check parameters
+    if samplingRate <= 0:
+        msg = 'epochSamples: Unexpected parameter value for parameter ''samplingRate''.'
+        raise ValueError(msg)
+    if pre < 0 or post <= 0:
+        msg = 'epochSamples: Unexpected parameter value for parameters ''pre'' or ''post''.'
+        raise ValueError(msg)
+
+    preSamples = int(round(pre * samplingRate))
+    window = preSamples + int(round(post * samplingRate))
+    starts = np.round(np.asarray(onsets, dtype=float).ravel() * samplingRate).astype(int) - preSamples
+
+    return starts, preSamples, window
+#end epochSamples(onsets, samplingRate, pre, post)
+
+
+def extractEpochs(data, onsets, samplingRate=10.0, pre=5.0, post=30.0):
+    '''
+    Cuts the epochs around the onsets.
+
+    Epochs not fully inside the data are dropped. If the kept epochs are
+    evenly spaced, the result is a (read only) view of data; otherwise it
+    is a copy.
+
+    :param data: The data <... x nSamples x nChannels x 2>.
+    :type data: numpy.ndarray
+    :param onsets: Onsets [s] of the epochs; see :func:`blockOnsets`.
+    :type onsets: list or numpy.ndarray
+    :param samplingRate: The sampling rate [Hz]. Default is 10.
+    :type samplingRate: float (positive)
+    :param pre: Time [s] before each onset. Default is 5.
+    :type pre: float (non negative)
+    :param post: Time [s] after each onset. Default is 30.
+    :type post: float (positive)
+    :return: The epochs <... x nEpochs x window x nChannels x 2> and the
+        mask of the kept onsets.
+    :rtype: tuple
+    '''
+
+    #Check parameters
+    data = np.asarray(data)
+    if data.ndim < 3:
+        msg = 'extractEpochs: Unexpected parameter value for parameter ''data''. Expected <... x nSamples x nChannels x 2>.'
+        raise ValueError(msg)
+
+    starts, preSamples, window = epochSamples(onsets, samplingRate, pre, post)
+    nSamples = data.shape[-3]
+    kept = (starts >= 0) & (starts + window <= nSamples)
+    starts = starts[kept]
+    if window > nSamples:
+        return np.empty(data.shape[:-3] + (0, window) + data.shape[-2:], dtype=data.dtype), kept
+
+    #<... x nSamples-window+1 x nChannels x 2 x window>; a view
+    windows = sliding_window_view(data, window, axis=-3)
+    steps = np.diff(starts)
+    if len(starts) > 0 and (len(steps) == 0 or (steps[0] > 0 and np.all(steps == steps[0]))):
+        step = int(steps[0]) if len(steps) > 0 else 1
+        selected = windows[..., starts[0]:starts[-1] + 1:step, :, :, :]
+    else:
+        selected = windows[..., starts, :, :, :] #Gather; a copy
+
+    return np.moveaxis(selected, -1, -3), kept
+#end extractEpochs(data, onsets, samplingRate=10.0, pre=5.0, post=30.0)
+
+
+def baselineCorrect(epochs, preSamples, out=None):
+    '''
+    Subtracts from each epoch the mean of its first preSamples samples.
+
+    :param epochs: The epochs <... x window x nChannels x 2>.
+    :type epochs: numpy.ndarray
+    :param preSamples: Number of baseline samples (see :func:`epochSamples`).
+    :type preSamples: int (positive)
+    :param out: Output buffer; may be epochs itself if it is writeable and
+        not a view of the data. Optional. Default is None (a new array).
+    :type out: numpy.ndarray or NoneType
+    :return: The baseline corrected epochs.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if type(preSamples) is not int or not (0 < preSamples <= epochs.shape[-3]):
+        msg = 'baselineCorrect: Unexpected parameter value for parameter ''preSamples''.'
+        raise ValueError(msg)
+
+    baseline = epochs[..., 0:preSamples, :, :].mean(axis=-3, keepdims=True)
+
+    return np.subtract(epochs, baseline, out=out)
+#end baselineCorrect(epochs, preSamples, out=None)
+
+
+def blockAverage(epochs, preSamples=0, axes=None):
+    '''
+    Averages the epochs, e.g. across blocks and subjects.
+
+    The baseline correction is linear, so it is applied to the average
+    rather than to every epoch; the epochs are not copied.
+
+    :param epochs: The epochs <... x nEpochs x window x nChannels x 2>.
+    :type epochs: numpy.ndarray
+    :param preSamples: Number of baseline samples; 0 for no baseline
+        correction. Default is 0.
+    :type preSamples: int (non negative)
+    :param axes: Axes to average over. Optional. Default is None (all the
+        axes before the window; i.e. epochs and subjects).
+    :type axes: int, tuple or NoneType
+    :return: The block average.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if epochs.ndim < 4:
+        msg = 'blockAverage: Unexpected parameter value for parameter ''epochs''. Expected <... x nEpochs x window x nChannels x 2>.'
+        raise ValueError(msg)
+    if axes is None:
+        axes = tuple(range(epochs.ndim - 3))
+
+    average = epochs.mean(axis=axes)
+    if preSamples > 0:
+        average = baselineCorrect(average, preSamples, out=average)
+
+    return average
+#end blockAverage(epochs, preSamples=0, axes=None)
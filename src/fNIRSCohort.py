@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+#File: fNIRSCohort.py
+#
+'''
+Module ***fNIRSCohort***
+
+Vectorized virtual cohorts for the score-based (type3) expert/novice model.
+
+In the type3 model of :meth:`fNIRSSignalGenerator.execute` (and
+:func:`score_dists`), the amplitudes of subject i in session j are
+
+* boxcar_amp = [1, 1, 1, 1] + A, with A ~ N([0, 0.1, 0.2, 0.3], 0.06)
+* channel_amp = base + e*[1, -1, -1, 1], with e ~ N(score[i, j]/10, 0.06)
+
+where base is [1, 0.5, 0.5, 1] for experts and [1, 1.2, 1.2, 1] for
+novices. Here the score table can have any size (subjects x sessions), and
+all the amplitudes are drawn in one vectorized call; :func:`generateCohort`
+then feeds them to a compiled plan (see :mod:`fNIRSSynthesis`), which adds
+the stimulus response of each subject from its block intervals.
+'''
+
+import numpy as np
+import pandas as pd
+
+import fNIRSSynthesis
+from fNIRSSynthesis import fNIRSConfig
+from rngStreams import cellSeedSequence, getGenerator, seedSequence
+
+
+# Parameters of the type3 model
+EXPERTS_BOX = np.array([1, 1, 1, 1])
+EXPERTS_CHAN = np.array([1, 0.5, 0.5, 1])
+NOVICES_BOX = np.array([1, 1, 1, 1])
+NOVICES_CHAN = np.array([1, 1.2, 1.2, 1])
+BOX_OFFSETS = np.array([0, 0.1, 0.2, 0.3]) # Means of a, b, c and d
+CHAN_PATTERN = np.array([1, -1, -1, 1]) # Signs of e per channel
+AMPLITUDE_SD = 0.06
+
+
+def loadScores(fileName, index_col=0):
+    '''
+    Loads a score table from a CSV file; one row per subject and one
+    column per session, e.g. as saved by pd.DataFrame(Scores).to_csv(fileName).
+
+    :param fileName: The CSV file.
+    :type fileName: str
+    :param index_col: Column holding the row labels, or None. Default is 0.
+    :type index_col: int or NoneType
+    :return: The score table <nSubjects x nSessions>.
+    :rtype: numpy.ndarray
+    '''
+
+    return pd.read_csv(fileName, index_col=index_col).to_numpy(dtype=float)
+#end loadScores(fileName, index_col=0)
+
+
+def _checkScores(scores, experts):
+    scores = np.asarray(scores, dtype=float)
+    if scores.ndim != 2 or scores.size == 0:
+        msg = 'fNIRSCohort: Unexpected parameter value for parameter ''scores''. Expected <nSubjects x nSessions>.'
+        raise ValueError(msg)
+    nSubjects = scores.shape[0]
+    if experts is None:
+        experts = np.arange(nSubjects) >= nSubjects // 2 # As in execute, the second half are experts
+    experts = np.asarray(experts, dtype=bool)
+    if experts.shape != (nSubjects,):
+        msg = 'fNIRSCohort: Unexpected parameter value for parameter ''experts''.'
+        raise ValueError(msg)
+
+    return scores, experts
+#end _checkScores(scores, experts)
+
+
+def cohortAmplitudes(scores, experts=None, rng=None):
+    '''
+    Draws the boxcar and channel amplitudes of every subject and session
+    of a score table in one vectorized call.
+
+    :param scores: The score table <nSubjects x nSessions>; see :func:`loadScores`.
+    :type scores: numpy.ndarray
+    :param experts: Mask of the expert subjects <nSubjects>.
+        Optional. Default is None (the second half of the subjects).
+    :type experts: numpy.ndarray or NoneType
+    :param rng: Random generator or seed. See module :mod:`rngStreams`.
+    :return: boxcarAmp and channelAmp, both <nSubjects x nSessions x 4>.
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    scores, experts = _checkScores(scores, experts)
+    rng = getGenerator(rng)
+
+    A = rng.normal(BOX_OFFSETS, AMPLITUDE_SD, scores.shape + (4,))
+    e = rng.normal(scores / 10, AMPLITUDE_SD)
+
+    baseBox = np.where(experts[:, None], EXPERTS_BOX, NOVICES_BOX)[:, None, :]
+    baseChan = np.where(experts[:, None], EXPERTS_CHAN, NOVICES_CHAN)[:, None, :]
+    boxcarAmp = baseBox + A
+    channelAmp = baseChan + e[..., None] * CHAN_PATTERN
+
+    return boxcarAmp, channelAmp
+#end cohortAmplitudes(scores, experts=None, rng=None)
+
+
+def generateCohort(scores, config=None, experts=None, rng=None, out=None, imported_data=None, noiseIndex=None):
+    '''
+    Generates the synthetic data of a whole cohort.
+
+    The amplitudes are drawn with :func:`cohortAmplitudes`; the stimulus
+    response of each subject and session is added from the block intervals
+    of the compiled plan (see :meth:`fNIRSSynthesis.fNIRSPlan.blocksResponse`),
+    written in place into out.
+    The noises of subject i in session j are drawn from their own stream
+    (cellSeedSequence(rng, i, j)), so each cell is reproducible.
+
+    :param scores: The score table <nSubjects x nSessions>.
+    :type scores: numpy.ndarray
+    :param config: The configuration; its amplitudes are ignored. It must
+        have 4 blocks and 4 channels. Optional. Default is None (the
+        configuration of :meth:`fNIRSSignalGenerator.execute` without noises).
+    :type config: fNIRSSynthesis.fNIRSConfig or NoneType
+    :param experts: Mask of the expert subjects <nSubjects>. Optional.
+    :type experts: numpy.ndarray or NoneType
+    :param rng: Random generator or seed. See module :mod:`rngStreams`.
+    :param out: Output buffer <nSubjects x nSessions x nSamples x nChannels x 2>
+        (e.g. a np.memmap). It is overwritten. Optional. Default is None.
+    :type out: numpy.ndarray or NoneType
+    :param imported_data: The experimental noise bank, if config.experimental.
+    :type imported_data: numpy.ndarray or NoneType
+    :param noiseIndex: Index over the noise bank. Optional. Default is None.
+    :type noiseIndex: noiseBank.noiseBankIndex or NoneType
+    :return: The data, boxcarAmp and channelAmp.
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    scores, experts = _checkScores(scores, experts)
+    if config is None:
+        config = fNIRSConfig()
+    plan = fNIRSSynthesis.compile(config)
+    nBlocks = plan.nBlocks
+    nChannels = plan.channelMasks.shape[1]
+    if nBlocks != 4 or nChannels != 4:
+        msg = 'generateCohort: Unexpected parameter value for parameter ''config''. The type3 model has 4 blocks and 4 channels.'
+        raise ValueError(msg)
+    shape = scores.shape + (config.nSamples, config.nChannels, 2)
+    if out is None:
+        out = np.zeros(shape)
+    else:
+        if out.shape != shape:
+            msg = 'generateCohort: Unexpected parameter value for parameter ''out''.'
+            raise ValueError(msg)
+        out[...] = 0
+
+    root = seedSequence(rng)
+    boxcarAmp, channelAmp = cohortAmplitudes(scores, experts, cellSeedSequence(root, 'amplitudes'))
+
+    #Stimulus response of each cell: <nSamples x 2> by <nChannels x 2>
+    nSamples = plan.endSample - plan.initSample
+    rowsEnd = plan.endSample + 1 if config.experimental else plan.endSample
+    cellBoxcarAmp = boxcarAmp.reshape(-1, nBlocks)
+    events = plan.eventResponse[:, None] * [1, -1/3]
+    channelScale = plan.channelMasks.T[None] * channelAmp.reshape(-1, nChannels)[:, :, None]
+    contiguous = isinstance(plan.channelIndex, slice)
+    for k, cell in enumerate(np.ndindex(scores.shape)):
+        if contiguous:
+            target = out[cell][plan.initSample:rowsEnd, plan.channelIndex]
+        else:
+            target = np.zeros((rowsEnd - plan.initSample, nChannels, 2))
+        response = plan.blocksResponse(cellBoxcarAmp[k]).T + events
+        np.multiply(response[:, None, :], channelScale[k][None], out=target[:nSamples])
+        plan.composeNoise(target, cellSeedSequence(root, *cell), \
+                          imported_data=imported_data, noiseIndex=noiseIndex)
+        if not contiguous:
+            out[cell][plan.initSample:rowsEnd, plan.channelIndex] += target
+
+    return out, boxcarAmp, channelAmp
+#end generateCohort(scores, config=None, experts=None, rng=None, ...)
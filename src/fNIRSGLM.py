@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+#File: fNIRSGLM.py
+#
+'''
+Module ***fNIRSGLM***
+
+Batched general linear model (GLM) for validating synthetic fNIRS data.
+
+The design matrix of a paradigm holds one regressor per block of the
+boxcar (the block convolved with the double gamma HRF, as generated by
+:mod:`fNIRSSynthesis`), an optional regressor for the brief events, and
+a polynomial drift. It is built and factorized (pseudo-inverse) once per
+paradigm; :meth:`fNIRSGLM.fit` then solves all channels, both chromophores
+and any number of subjects with a single matrix product.
+
+As the generated HbO2 response of channel c to block b is
+channel_amp[c] * boxcar_amp[b] * regressor_b (and -1/3 of it for HHb),
+the block betas of a subject form a rank-1 matrix. The amplitudes are
+recovered from its leading singular vectors.
+'''
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+import fNIRSSynthesis
+from timebase import timebase
+
+
+HBO2 = fNIRSSynthesis.HBO2
+HHB = fNIRSSynthesis.HHB
+
+
+@dataclass(frozen=True)
+class glmResult:
+    '''
+    Result of a GLM fit. Leading dimensions (e.g. subjects) of the fitted
+    data are kept in all the attributes.
+
+    :Attributes:
+
+    * betas: Betas <... x nRegressors x nChannels x 2>.
+    * tValues: t-values of the betas <... x nRegressors x nChannels x 2>.
+    * boxcarAmp: Recovered block amplitudes <... x nBlocks>.
+    * channelAmp: Recovered channel amplitudes <... x nChannels>. The split
+      of scale between blocks and channels is not identifiable; channelAmp
+      is normalized to unit mean.
+    '''
+
+    betas: np.ndarray
+    tValues: np.ndarray
+    boxcarAmp: np.ndarray
+    channelAmp: np.ndarray
+
+#class glmResult
+
+
+class fNIRSGLM:
+    '''
+    GLM of a paradigm, with the design matrix built and factorized once.
+    Use :func:`glmFor` to share instances among callers.
+    '''
+
+    def __init__(self, boxCarList, nSamples, samplingRate=10.0, \
+                 tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, \
+                 eventOnsets=(), driftOrder=0):
+        '''
+        :Parameters:
+        :param boxCarList: List of tuples (xi, yi) [s] of the blocks.
+        :type boxCarList: list
+        :param nSamples: Number of temporal samples of the data.
+        :type nSamples: int (positive)
+        :param samplingRate: The sampling rate [Hz]. Default is 10.
+        :type samplingRate: float (positive)
+        :param tau_p, tau_d, amplitudeScalingFactor: HRF parameters.
+            See :func:`fNIRSSynthesis.double_gamma_function`.
+        :param eventOnsets: Onsets [s] of brief events; modelled by a single
+            regressor. Default is () (no events).
+        :type eventOnsets: tuple, list or numpy.ndarray
+        :param driftOrder: Order of the polynomial drift regressors; 0 is
+            the intercept only, -1 none. Default is 0.
+        :type driftOrder: int
+        '''
+
+        #Check parameters
+        if type(nSamples) is not int or nSamples <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nSamples''.'
+            raise ValueError(msg)
+        if samplingRate <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''samplingRate''.'
+            raise ValueError(msg)
+        if type(driftOrder) is not int or driftOrder < -1:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''driftOrder''.'
+            raise ValueError(msg)
+        for elem in boxCarList:
+            if len(elem) != 2 or not (0 <= elem[0] <= elem[1]):
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''boxCarList''.'
+                raise ValueError(msg)
+
+        timestamps = timebase(nSamples, samplingRate)
+        cumulativeKernel = fNIRSSynthesis.cumulativeHRF(samplingRate, tau_p, tau_d, amplitudeScalingFactor)
+        nBlocks = len(boxCarList)
+
+        regressors = list()
+        starts, stops, blocks = fNIRSSynthesis.blockIntervals(list(boxCarList), timestamps)
+        for iBlock in range(nBlocks):
+            inBlock = blocks == iBlock
+            regressors.append(fNIRSSynthesis.addIntervalResponses(np.zeros(nSamples), starts[inBlock], stops[inBlock], \
+                                                                  np.ones(np.count_nonzero(inBlock)), cumulativeKernel))
+        nEvents = len(eventOnsets)
+        if nEvents > 0:
+            samples, kept = fNIRSSynthesis.eventSamples(eventOnsets, timestamps)
+            regressors.append(fNIRSSynthesis.addEventResponses(np.zeros(nSamples), samples, np.ones(len(samples)), \
+                              fNIRSSynthesis.hrfKernel(samplingRate, tau_p, tau_d, amplitudeScalingFactor)))
+        drift = np.linspace(-1, 1, nSamples)
+        for order in range(driftOrder + 1):
+            regressors.append(drift**order)
+
+        X = np.column_stack(regressors) #<nSamples x nRegressors>
+        pinvX = np.linalg.pinv(X)
+        #Unscaled variance of the betas; diag((X'X)^+)
+        unscaledVariance = np.einsum('ij,ij->i', pinvX, pinvX)
+
+        for array in (X, pinvX, unscaledVariance):
+            array.flags.writeable = False
+        self.__X = X
+        self.__pinvX = pinvX
+        self.__unscaledVariance = unscaledVariance
+        self.__nBlocks = nBlocks
+        self.__dof = nSamples - np.linalg.matrix_rank(X)
+    #end __init__(self, boxCarList, nSamples, ...)
+
+
+    @property
+    def designMatrix(self): #designMatrix getter
+        '''
+        The (read only) design matrix <nSamples x nRegressors>; the block
+        regressors first, then the events regressor (if any) and the drift.
+
+        :getter: Gets the design matrix.
+        :type: numpy.ndarray
+        '''
+
+        return self.__X
+    #end designMatrix(self)
+
+
+    @property
+    def nBlocks(self): #nBlocks getter
+        '''
+        Number of block regressors.
+
+        :getter: Gets the number of blocks.
+        :type: int
+        '''
+
+        return self.__nBlocks
+    #end nBlocks(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def fit(self, data):
+        '''
+        Fits the GLM to one or many data tensors at once.
+
+        :param data: The data <... x nSamples x nChannels x 2>; e.g. a single
+            tensor from :meth:`fNIRSSignalGenerator.execute` or a stack of
+            subjects <nSubjects x nSamples x nChannels x 2>.
+        :type data: numpy.ndarray
+        :return: The betas, t-values and recovered amplitudes.
+        :rtype: glmResult
+        '''
+
+        #Check parameters
+        data = np.asarray(data, dtype=float)
+        nSamples = self.__X.shape[0]
+        if data.ndim < 3 or data.shape[-3] != nSamples or data.shape[-1] != 2:
+            msg = self.getClassName() + ':fit: Unexpected parameter value for parameter ''data''.'
+            raise ValueError(msg)
+
+        #Channels and chromophores are columns of the right hand side; subjects are
+        #batched by matmul over a view of the data
+        nChannels = data.shape[-2]
+        Y = data.reshape(data.shape[:-2] + (nChannels*2,)) #<... x nSamples x 2nChannels>
+        betas = np.matmul(self.__pinvX, Y) #<... x nRegressors x 2nChannels>
+        #Residual sum of squares from the residuals themselves; Y'Y - beta'X'Y
+        #cancels catastrophically when the fit explains most of the data
+        residuals = Y - np.matmul(self.__X, betas)
+        rss = np.einsum('...ij,...ij->...j', residuals, residuals)
+        del residuals
+        sigma2 = rss / max(self.__dof, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tValues = betas / np.sqrt(self.__unscaledVariance[:, None] * sigma2[..., None, :])
+
+        shape = betas.shape[:-1] + (nChannels, 2)
+        betas = betas.reshape(shape)
+        tValues = tValues.reshape(shape)
+        boxcarAmp, channelAmp = self.recoverAmplitudes(betas)
+
+        return glmResult(betas=betas, tValues=tValues, boxcarAmp=boxcarAmp, channelAmp=channelAmp)
+    #end fit(self, data)
+
+
+    def recoverAmplitudes(self, betas):
+        '''
+        Recovers the block and channel amplitudes from the block betas.
+
+        The HbO2 betas and -3 times the HHb betas of a subject form a
+        <nBlocks x 2nChannels> matrix, ideally boxcar_amp * channel_amp^T;
+        its rank-1 approximation (leading singular vectors; batched over
+        subjects) gives both amplitudes, channelAmp normalized to unit mean.
+
+        :param betas: Betas <... x nRegressors x nChannels x 2>.
+        :type betas: numpy.ndarray
+        :return: boxcarAmp <... x nBlocks> and channelAmp <... x nChannels>.
+        :rtype: tuple
+        '''
+
+        nBlocks = self.__nBlocks
+        nChannels = betas.shape[-2]
+        if nBlocks == 0:
+            return np.empty(betas.shape[:-3] + (0,)), np.full(betas.shape[:-3] + (nChannels,), np.nan)
+
+        blockBetas = betas[..., 0:nBlocks, :, :]
+        B = np.concatenate((blockBetas[..., HBO2], -3*blockBetas[..., HHB]), axis=-1)
+        U, S, Vt = np.linalg.svd(B, full_matrices=False)
+        boxcarAmp = U[..., :, 0] * S[..., 0:1]
+        channelAmp = 0.5 * (Vt[..., 0, 0:nChannels] + Vt[..., 0, nChannels:])
+
+        #Fix the sign and the scale split: channelAmp has unit mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.mean(channelAmp, axis=-1, keepdims=True)
+            channelAmp = channelAmp / scale
+            boxcarAmp = boxcarAmp * scale
+
+        return boxcarAmp, channelAmp
+    #end recoverAmplitudes(self, betas)
+
+#class fNIRSGLM
+
+
+@lru_cache(maxsize=16)
+def _glmFor(boxCarList, nSamples, samplingRate, tau_p, tau_d, amplitudeScalingFactor, eventOnsets, driftOrder):
+    return fNIRSGLM(boxCarList, nSamples, samplingRate, tau_p, tau_d, amplitudeScalingFactor, eventOnsets, driftOrder)
+#end _glmFor(...)
+
+
+def glmFor(boxCarList, nSamples, samplingRate=10.0, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, \
+           eventOnsets=(), driftOrder=0):
+    '''
+    Gets the GLM of a paradigm. GLMs are cached per paradigm, so the design
+    matrix is built and factorized only once. See :class:`fNIRSGLM` for
+    the parameters.
+
+    :return: The GLM.
+    :rtype: fNIRSGLM
+    '''
+
+    return _glmFor(tuple(tuple(elem) for elem in boxCarList), int(nSamples), float(samplingRate), \
+                   tau_p, tau_d, float(amplitudeScalingFactor), \
+                   tuple(np.asarray(eventOnsets, dtype=float).ravel().tolist()), driftOrder)
+#end glmFor(boxCarList, nSamples, samplingRate=10.0, ...)
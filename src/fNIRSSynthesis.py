@@ -0,0 +1,1029 @@
+# -*- coding: utf-8 -*-
+#
+#File: fNIRSSynthesis.py
+#
+'''
+Module ***fNIRSSynthesis***
+
+Stateless functional core of the synthetic fNIRS generation.
+
+This module implements the immutable configuration
+:class:`fNIRSConfig <fNIRSConfig>` and the pure function :func:`generate`,
+together with the kernels it is built from (stimulus response and noise
+sources). Nothing here keeps state between calls: a kernel only reads its
+arguments, draws from the random generator it is given, and writes into the
+output it returns. Hence a single configuration can be shared by any number
+of threads, each calling :func:`generate` with its own generator and output
+buffer. NumPy releases the GIL in the heavy kernels, so a thread pool scales.
+
+The methods of :class:`fNIRSSignalGenerator` are thin wrappers over these
+kernels which add the parameter checking and write into the generator
+:attr:`data` tensor.
+'''
+
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal
+
+from rngStreams import getGenerator, seedSequence, sourceGenerators
+from timebase import timebase
+
+
+HBO2 = 0 # Index of HbO2 (Oxi) in the signal dimension of the data tensor
+HHB  = 1 # Index of HHb (Desoxi) in the signal dimension of the data tensor
+
+# Physiological noises [Hz] as (frequencyMean, frequencySD). From paper (Elwell et al., 1999)
+PHYSIOLOGICAL_NOISES = {'breathing':  (0.22, 0.07),
+                        'heart':      (1.08, 0.16),
+                        'vasomotion': (0.082, 0.016)}
+
+# Relative magnitude of the HRF tail truncated by cumulativeHRF
+HRF_TOLERANCE = 1e-12
+
+# Number of samples of the sinusoid bases of the physiological noises built at once
+NOISE_CHUNK_SIZE = 4096
+
+
+def _asTuple(value):
+    '''Converts lists and arrays to (hashable) tuples of Python scalars.'''
+
+    if isinstance(value, np.ndarray):
+        return tuple(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(_asTuple(v) if isinstance(v, (list, tuple, np.ndarray)) else v for v in value)
+    return (value,)
+#end _asTuple(value)
+
+
+@dataclass(frozen=True)
+class fNIRSConfig:
+    '''
+    Immutable configuration of a synthetic fNIRS recording.
+
+    Sequences given as lists or arrays are stored as tuples, so a
+    configuration is hashable and can be safely shared between threads.
+
+    :Attributes:
+
+    * nSamples, nChannels: Size of the data tensor <nSamples x nChannels x 2>.
+    * samplingRate: Sampling rate [Hz].
+    * channelsList: Channels affected. Default is None (all channels).
+    * initSample, endSample: Temporal window, with the same semantics as
+      in :meth:`fNIRSSignalGenerator.addStimulusResult`.
+    * boxCarList: Tuple of (xi, yi) intervals [s] where the boxcar is 1.
+    * boxcarAmp, channelAmp: Block and channel amplitudes. A single
+      value is applied to all blocks/channels.
+    * eventOnsets: Onsets [s] of brief events (event-related design).
+      Default is () (no events). Blocks and events can be combined.
+    * eventAmp: Event amplitudes. A single value is applied to all events.
+    * enableHbO2Channels, enableHHbChannels, enableHbO2Blocks, enableHHbBlocks:
+      0/1 enable masks. A single value is applied to all channels/blocks.
+    * tau_p, tau_d, amplitudeScalingFactor: Double gamma HRF parameters.
+    * breathing, heart, vasomotion, gaussian, experimental: Enabled noise sources.
+    * frequencyResolutionStep: Frequency step of the physiological noises [Hz].
+    * noiseRatio: Scaling factor of the experimental noise.
+    * noiseProfile: Target profile of the experimental noise segments as
+      a tuple of (feature, value) pairs. See :class:`noiseBank.noiseBankIndex`.
+    '''
+
+    nSamples: int = 3000
+    nChannels: int = 4
+    samplingRate: float = 10.0
+    channelsList: tuple = None
+    initSample: int = 0
+    endSample: int = -1
+    boxCarList: tuple = ((35, 55), (105, 125), (175, 195), (245, 265))
+    boxcarAmp: tuple = (1.0,)
+    eventOnsets: tuple = ()
+    eventAmp: tuple = (1.0,)
+    channelAmp: tuple = (1.0,)
+    enableHbO2Channels: tuple = (1,)
+    enableHHbChannels: tuple = (1,)
+    enableHbO2Blocks: tuple = (1,)
+    enableHHbBlocks: tuple = (1,)
+    tau_p: int = 6
+    tau_d: int = 10
+    amplitudeScalingFactor: float = 6.0
+    breathing: bool = False
+    heart: bool = False
+    vasomotion: bool = False
+    gaussian: bool = False
+    experimental: bool = False
+    frequencyResolutionStep: float = 0.01
+    noiseRatio: float = 3.0
+    noiseProfile: tuple = None
+
+    def __post_init__(self):
+        #Normalize sequences to tuples
+        for name in ('boxCarList', 'boxcarAmp', 'eventOnsets', 'eventAmp', 'channelAmp', 'enableHbO2Channels', 'enableHHbChannels',
+                     'enableHbO2Blocks', 'enableHHbBlocks'):
+            object.__setattr__(self, name, _asTuple(getattr(self, name)))
+        if self.channelsList is not None:
+            object.__setattr__(self, 'channelsList', tuple(sorted(set(_asTuple(self.channelsList)))))
+        if isinstance(self.noiseProfile, dict):
+            object.__setattr__(self, 'noiseProfile', tuple(sorted(self.noiseProfile.items())))
+
+        #Check parameters
+        if type(self.nSamples) is not int or self.nSamples <= 0:
+            msg = 'fNIRSConfig: Unexpected parameter value for parameter ''nSamples''.'
+            raise ValueError(msg)
+        if type(self.nChannels) is not int or self.nChannels <= 0:
+            msg = 'fNIRSConfig: Unexpected parameter value for parameter ''nChannels''.'
+            raise ValueError(msg)
+        if self.samplingRate <= 0:
+            msg = 'fNIRSConfig: Unexpected parameter value for parameter ''samplingRate''.'
+            raise ValueError(msg)
+        if self.channelsList is not None:
+            for elem in self.channelsList:
+                if type(elem) is not int or elem < 0 or elem >= self.nChannels:
+                    msg = 'fNIRSConfig: Unexpected parameter value for parameter ''channelsList''.'
+                    raise ValueError(msg)
+        initSample, endSample = self.window()
+        if initSample < 0 or endSample <= initSample or endSample >= self.nSamples:
+            msg = 'fNIRSConfig: Unexpected parameter value for parameters ''initSample'' and ''endSample''.'
+            raise ValueError(msg)
+        for elem in self.boxCarList:
+            if len(elem) != 2 or not (0 <= elem[0] < elem[1] < self.nSamples / self.samplingRate):
+                msg = 'fNIRSConfig: Unexpected parameter value for parameter ''boxCarList''.'
+                raise ValueError(msg)
+        for elem in self.eventOnsets:
+            if elem < 0:
+                msg = 'fNIRSConfig: Unexpected parameter value for parameter ''eventOnsets''.'
+                raise ValueError(msg)
+    #end __post_init__(self)
+
+
+    def channels(self):
+        '''
+        The affected channels.
+
+        :return: The channels list.
+        :rtype: list
+        '''
+
+        if self.channelsList is None:
+            return list(range(self.nChannels))
+        return list(self.channelsList)
+    #end channels(self)
+
+
+    def window(self):
+        '''
+        The temporal window [initSample, endSample) affected by the
+        stimulus and the synthetic noises.
+
+        :return: initSample and endSample (exclusive).
+        :rtype: tuple
+        '''
+
+        endSample = self.nSamples - 1 if self.endSample == -1 else self.endSample
+        return self.initSample, endSample
+    #end window(self)
+
+#class fNIRSConfig
+
+
+def double_gamma_function(timestamps, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0):
+    '''
+    Double gamma function in the domain of timestamps.
+    See :meth:`fNIRSSignalGenerator.double_gamma_function`.
+    '''
+
+    HRF = ( pow(timestamps, tau_p) * np.exp(-1 * timestamps) ) / math.factorial(tau_p)
+    HRF = HRF - ( pow(timestamps, tau_p+tau_d) * np.exp(-1 * timestamps) ) / ( amplitudeScalingFactor * math.factorial(tau_p+tau_d) )
+
+    return HRF
+#end double_gamma_function(timestamps, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0)
+
+
+@lru_cache(maxsize=32)
+def _hrfKernel(samplingRate, tau_p, tau_d, amplitudeScalingFactor, tolerance):
+    #The HRF decays as t^(tau_p+tau_d) exp(-t); evaluate it well past the undershoot
+    duration = max(120.0, 10.0*(tau_p+tau_d))
+    HRF = double_gamma_function(timebase(int(math.ceil(duration*samplingRate)), samplingRate), \
+                                tau_p, tau_d, amplitudeScalingFactor)
+    support = np.flatnonzero(np.abs(HRF) > tolerance*np.abs(HRF).max())
+    HRF = HRF[0:support[-1]+1]
+    HRF.flags.writeable = False
+    return HRF
+#end _hrfKernel(samplingRate, tau_p, tau_d, amplitudeScalingFactor, tolerance)
+
+
+@lru_cache(maxsize=32)
+def _cumulativeHRF(samplingRate, tau_p, tau_d, amplitudeScalingFactor, tolerance):
+    cumulative = np.cumsum(_hrfKernel(samplingRate, tau_p, tau_d, amplitudeScalingFactor, tolerance))
+    cumulative.flags.writeable = False
+    return cumulative
+#end _cumulativeHRF(samplingRate, tau_p, tau_d, amplitudeScalingFactor, tolerance)
+
+
+def hrfKernel(samplingRate, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, tolerance=HRF_TOLERANCE):
+    '''
+    Gets the sampled double gamma HRF, truncated after the last sample
+    whose magnitude exceeds tolerance times its peak. Results are cached
+    and read only.
+
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float (positive)
+    :param tau_p, tau_d, amplitudeScalingFactor: See :func:`double_gamma_function`.
+    :param tolerance: Relative magnitude of the truncated HRF tail.
+        Optional. Default is :data:`HRF_TOLERANCE`.
+    :type tolerance: float (positive)
+    :return: The HRF <kernel length>.
+    :rtype: numpy.ndarray
+    '''
+
+    return _hrfKernel(float(samplingRate), tau_p, tau_d, float(amplitudeScalingFactor), float(tolerance))
+#end hrfKernel(samplingRate, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, tolerance=HRF_TOLERANCE)
+
+
+def cumulativeHRF(samplingRate, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, tolerance=HRF_TOLERANCE):
+    '''
+    Gets the cumulative sum (step response) of the sampled double gamma HRF.
+
+    The HRF is truncated as in :func:`hrfKernel`; past the kernel the step
+    response is constant. Results are cached and read only.
+
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float (positive)
+    :param tau_p, tau_d, amplitudeScalingFactor: See :func:`double_gamma_function`.
+    :param tolerance: Relative magnitude of the truncated HRF tail.
+        Optional. Default is :data:`HRF_TOLERANCE`.
+    :type tolerance: float (positive)
+    :return: The step response <kernel length>.
+    :rtype: numpy.ndarray
+    '''
+
+    return _cumulativeHRF(float(samplingRate), tau_p, tau_d, float(amplitudeScalingFactor), float(tolerance))
+#end cumulativeHRF(samplingRate, tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, tolerance=HRF_TOLERANCE)
+
+
+def blockIntervals(boxCarList, timestamps, enableBlocks=(1,)):
+    '''
+    Converts the boxcar to disjoint sample intervals.
+
+    Block (xi, yi) covers samples [searchsorted(xi), searchsorted(yi)+1),
+    as in the dense boxcar of :meth:`fNIRSSignalGenerator.generateStimulusResult`.
+    Where enabled blocks overlap, the last one prevails.
+
+    :param boxCarList: List of tuples (xi, yi) [s].
+    :type boxCarList: list
+    :param timestamps: The timebase of the recording.
+    :type timestamps: numpy.ndarray
+    :param enableBlocks: 0/1 per block. Default is (1,) (all enabled).
+    :type enableBlocks: tuple, list or numpy.ndarray
+    :return: The starts, stops (exclusive) and block of each interval.
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    nBlocks = len(boxCarList)
+    enableBlocks = np.broadcast_to(np.asarray(enableBlocks).ravel(), (nBlocks,))
+    intervals = list()
+    for iBlock, elem in enumerate(boxCarList):
+        if enableBlocks[iBlock] != 1:
+            continue
+        i = int(np.searchsorted(timestamps, elem[0]))
+        j = min(int(np.searchsorted(timestamps, elem[1])) + 1, len(timestamps))
+        clipped = list()
+        for (a, b, block) in intervals: #Later blocks overwrite earlier ones
+            if b <= i or a >= j:
+                clipped.append((a, b, block))
+                continue
+            if a < i:
+                clipped.append((a, i, block))
+            if b > j:
+                clipped.append((j, b, block))
+        clipped.append((i, j, iBlock))
+        intervals = clipped
+    intervals.sort()
+
+    intervals = np.array(intervals, dtype=int).reshape(-1, 3)
+    return intervals[:, 0], intervals[:, 1], intervals[:, 2]
+#end blockIntervals(boxCarList, timestamps, enableBlocks=(1,))
+
+
+def addIntervalResponses(out, starts, stops, amplitudes, cumulativeKernel):
+    '''
+    Adds in place the HRF response to constant amplitude intervals.
+
+    The response to a unit boxcar over samples [i, j) is C[t-i] - C[t-j],
+    with C the step response of the HRF (C[m] = 0 for m < 0 and C[m] = C[-1]
+    past the kernel). Only samples [i, j+len(C)-1) are touched, so the cost
+    scales with the number of intervals times the interval plus kernel
+    length, regardless of the recording length.
+
+    :param out: The response <nSamples>.
+    :type out: numpy.ndarray
+    :param starts, stops: Samples where the intervals start and stop (exclusive).
+    :type starts, stops: numpy.ndarray
+    :param amplitudes: Amplitude of each interval.
+    :type amplitudes: numpy.ndarray
+    :param cumulativeKernel: The step response; see :func:`cumulativeHRF`.
+    :type cumulativeKernel: numpy.ndarray
+    :return: out
+    :rtype: numpy.ndarray
+    '''
+
+    nSamples = len(out)
+    kernelLength = len(cumulativeKernel)
+    for i, j, amplitude in zip(starts, stops, amplitudes):
+        if i >= nSamples or amplitude == 0:
+            continue
+        stop = min(nSamples, j + kernelLength - 1)
+        lags = np.arange(stop - i)
+        response = cumulativeKernel[np.minimum(lags, kernelLength - 1)]
+        response[j-i:] -= cumulativeKernel[lags[j-i:] - (j-i)]
+        response *= amplitude
+        out[i:stop] += response
+
+    return out
+#end addIntervalResponses(out, starts, stops, amplitudes, cumulativeKernel)
+
+
+def stimulusResponse(boxCarList, nSamples, nChannels, samplingRate, \
+                     tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, \
+                     enableHbO2Channels=(1,), enableHHbChannels=(1,), \
+                     enableHbO2Blocks=(1,), enableHHbBlocks=(1,), \
+                     boxcar_amp=(1,), channel_amp=(1,)):
+    '''
+    Synthetic data for the stimulus whose times of occurrence are on the boxcar.
+    See :meth:`fNIRSSignalGenerator.generateStimulusResult` for the parameters.
+
+    :return: A data tensor <nSamples x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    nBlocks = len(boxCarList)
+    boxcar_amp = np.broadcast_to(np.asarray(boxcar_amp, dtype=float).ravel(), (nBlocks,))
+    channel_amp = np.broadcast_to(np.asarray(channel_amp, dtype=float).ravel(), (nChannels,))
+
+    #The blocks are added as intervals of the HRF step response; no dense boxcar nor convolution
+    timestamps = timebase(nSamples, samplingRate)
+    cumulativeKernel = cumulativeHRF(samplingRate, tau_p, tau_d, amplitudeScalingFactor)
+    HbO2 = np.zeros(nSamples)
+    HHb = np.zeros(nSamples)
+    for response, enableBlocks in ((HbO2, enableHbO2Blocks), (HHb, enableHHbBlocks)):
+        starts, stops, blocks = blockIntervals(boxCarList, timestamps, enableBlocks)
+        addIntervalResponses(response, starts, stops, boxcar_amp[blocks], cumulativeKernel)
+    HHb *= -1/3
+
+    synthData = np.empty((nSamples, nChannels, 2)) #The synthetic data tensor
+    synthData[:, :, HBO2] = HbO2[:, None] * (np.asarray(enableHbO2Channels) * channel_amp)
+    synthData[:, :, HHB]  = HHb[:, None] * (np.asarray(enableHHbChannels) * channel_amp)
+
+    return synthData
+#end stimulusResponse(boxCarList, nSamples, nChannels, samplingRate, ...)
+
+
+def eventSamples(onsets, timestamps):
+    '''
+    Converts event onsets [s] to samples, with the same rule as the
+    start of the boxcar blocks. Events past the recording are dropped.
+
+    :param onsets: Event onsets [s].
+    :type onsets: list, tuple or numpy.ndarray
+    :param timestamps: The timebase of the recording.
+    :type timestamps: numpy.ndarray
+    :return: The samples and a mask of the kept events.
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    samples = np.searchsorted(timestamps, np.asarray(onsets, dtype=float))
+    kept = samples < len(timestamps)
+
+    return samples[kept], kept
+#end eventSamples(onsets, timestamps)
+
+
+def addEventResponses(out, samples, amplitudes, kernel, method='auto'):
+    '''
+    Adds in place the HRF response to a train of brief events (impulses).
+
+    Two paths are available:
+
+    * 'scatter': the kernel is scatter-added at each event; the cost is
+      nEvents x kernel length.
+    * 'fft': the impulse train is convolved with the kernel by FFT; the
+      cost is about (nSamples + kernel length) log(nSamples + kernel length).
+
+    With 'auto' the cheaper path is chosen from these estimates, so sparse
+    designs are scattered and dense (rapid) designs go through the FFT.
+
+    :param out: The response <nSamples>.
+    :type out: numpy.ndarray
+    :param samples: Sample of each event.
+    :type samples: numpy.ndarray
+    :param amplitudes: Amplitude of each event.
+    :type amplitudes: numpy.ndarray
+    :param kernel: The HRF; see :func:`hrfKernel`.
+    :type kernel: numpy.ndarray
+    :param method: 'auto', 'scatter' or 'fft'. Default is 'auto'.
+    :type method: str
+    :return: out
+    :rtype: numpy.ndarray
+    '''
+
+    nSamples = len(out)
+    nEvents = len(samples)
+    kernelLength = len(kernel)
+    if nEvents == 0:
+        return out
+    if method == 'auto':
+        fftLength = nSamples + kernelLength
+        #A scattered element costs about 8 times an element of the FFT pass
+        method = 'scatter' if 8*nEvents*kernelLength <= fftLength*math.log2(fftLength) else 'fft'
+
+    if method == 'scatter':
+        #bincount sums the overlapping responses; events are chunked to bound the index matrix
+        lags = np.arange(kernelLength)
+        chunk = max(1, 2**20 // kernelLength)
+        for k in range(0, nEvents, chunk):
+            index = samples[k:k+chunk, None] + lags
+            weights = amplitudes[k:k+chunk, None] * kernel
+            inside = index < nSamples
+            out += np.bincount(index[inside], weights=weights[inside], minlength=nSamples)
+    elif method == 'fft':
+        train = np.bincount(samples, weights=amplitudes, minlength=nSamples)
+        out += scipy.signal.fftconvolve(train, kernel, mode='full')[0:nSamples]
+    else:
+        msg = 'addEventResponses: Unexpected parameter value for parameter ''method''.'
+        raise ValueError(msg)
+
+    return out
+#end addEventResponses(out, samples, amplitudes, kernel, method='auto')
+
+
+def jitteredOnsets(nEvents, isi, jitter=0.0, firstOnset=0.0, rng=None):
+    '''
+    Onsets of an event-related design with jittered inter stimulus intervals.
+
+    :param nEvents: Number of events.
+    :type nEvents: int (positive)
+    :param isi: Mean inter stimulus interval [s].
+    :type isi: float (positive)
+    :param jitter: Each interval is drawn uniformly in [isi-jitter, isi+jitter] [s].
+        Default is 0 (fixed intervals).
+    :type jitter: float (non negative, lower than isi)
+    :param firstOnset: Onset of the first event [s]. Default is 0.
+    :type firstOnset: float
+    :param rng: Random generator or seed. See module :mod:`rngStreams`.
+    :return: The onsets [s] <nEvents>.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if type(nEvents) is not int or nEvents <= 0:
+        msg = 'jitteredOnsets: Unexpected parameter value for parameter ''nEvents''.'
+        raise ValueError(msg)
+    if isi <= 0 or jitter < 0 or jitter >= isi:
+        msg = 'jitteredOnsets: Unexpected parameter value for parameters ''isi'' and ''jitter''.'
+        raise ValueError(msg)
+
+    intervals = getGenerator(rng).uniform(isi - jitter, isi + jitter, nEvents - 1)
+
+    return firstOnset + np.concatenate(([0.0], np.cumsum(intervals)))
+#end jitteredOnsets(nEvents, isi, jitter=0.0, firstOnset=0.0, rng=None)
+
+
+def eventResponse(onsets, nSamples, nChannels, samplingRate, amplitudes=(1,), \
+                  tau_p=6, tau_d=10, amplitudeScalingFactor=6.0, \
+                  enableHbO2Channels=(1,), enableHHbChannels=(1,), channel_amp=(1,), method='auto'):
+    '''
+    Synthetic data for an event-related design; the HRF is placed at each
+    event onset, scaled by the event amplitude.
+
+    :return: A data tensor <nSamples x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    onsets = np.asarray(onsets, dtype=float).ravel()
+    amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=float).ravel(), onsets.shape)
+    channel_amp = np.broadcast_to(np.asarray(channel_amp, dtype=float).ravel(), (nChannels,))
+
+    samples, kept = eventSamples(onsets, timebase(nSamples, samplingRate))
+    HbO2 = np.zeros(nSamples)
+    addEventResponses(HbO2, samples, amplitudes[kept], \
+                      hrfKernel(samplingRate, tau_p, tau_d, amplitudeScalingFactor), method)
+
+    synthData = np.empty((nSamples, nChannels, 2)) #The synthetic data tensor
+    synthData[:, :, HBO2] = HbO2[:, None] * (np.asarray(enableHbO2Channels) * channel_amp)
+    synthData[:, :, HHB]  = (-1/3) * HbO2[:, None] * (np.asarray(enableHHbChannels) * channel_amp)
+
+    return synthData
+#end eventResponse(onsets, nSamples, nChannels, samplingRate, ...)
+
+
+def gaussianNoise(nSamples, nChannels, rng=None, sd=0.3):
+    '''
+    Gaussian noise for HbO2 and HHb.
+
+    :return: A data tensor <nSamples x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    rng = getGenerator(rng)
+    noise = np.empty((nSamples, nChannels, 2))
+    noise[:, :, HBO2] = rng.normal(0, sd, (nSamples, nChannels))
+    noise[:, :, HHB] = rng.normal(0, sd, (nSamples, nChannels))
+
+    return noise
+#end gaussianNoise(nSamples, nChannels, rng=None, sd=0.3)
+
+
+def physiologicalNoise(nSamples, nChannels, samplingRate, frequencyMean=0.22, frequencySD=0.07, \
+                       frequencyResolutionStep=0.01, rng=None):
+    '''
+    Physiological noise as a sum of sinusoids with random amplitudes and
+    phases over the band frequencyMean +/- 2*frequencySD. The HHb noise is
+    -1/3 of the HbO2 noise.
+    See :meth:`fNIRSSignalGenerator.addPhysiologicalNoise` for the parameters.
+
+    :return: A data tensor <nSamples x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    rng = getGenerator(rng)
+    timestamps = timebase(nSamples, samplingRate)[:, None] #Column vector; broadcast over channels
+
+    frequencySet = np.arange(frequencyMean-2*frequencySD, \
+                             frequencyMean+2*frequencySD+frequencyResolutionStep, \
+                             frequencyResolutionStep, dtype = float)   # From paper (Elwell et al., 1999)
+    amplitudeScalingFactor = 1
+    tmpHbO2 = np.zeros((nSamples, nChannels))
+    for freq in frequencySet:
+        #Amplitude and phase [rad]. One random amplitude and phase per channel
+        A = amplitudeScalingFactor*rng.random((1,nChannels))
+        theta = 2* math.pi * rng.random((1,nChannels)) - math.pi
+        tmpHbO2 += A * np.sin(2*math.pi*freq*timestamps+theta)
+
+    tmpData = np.empty((nSamples, nChannels, 2))
+    tmpData[:, :, HBO2] = tmpHbO2
+    tmpData[:, :, HHB] = (-1/3)*tmpHbO2
+
+    return tmpData
+#end physiologicalNoise(nSamples, nChannels, samplingRate, ...)
+
+
+def sampleSegments(imported_data, nChannels, rng=None, noiseIndex=None, targetProfile=None):
+    '''
+    Draws the segments of the noise bank used as experimental noise;
+    one segment per channel. With an index, only the segments that passed
+    its screening are drawn; the plain uniform draw over all the segments
+    is kept for banks that were never indexed. See :func:`experimentalNoise`
+    for the parameters.
+
+    :return: The indices of the segments <nChannels>.
+    :rtype: numpy.ndarray
+    '''
+
+    rng = getGenerator(rng)
+    if noiseIndex is not None:
+        if noiseIndex.nSegments != imported_data.shape[1]:
+            msg = 'sampleSegments: Unexpected parameter value for parameter ''noiseIndex''. It indexes another bank.'
+            raise ValueError(msg)
+        if targetProfile is None:
+            return noiseIndex.sample(size = nChannels, rng = rng)
+        return noiseIndex.query(targetProfile, size = nChannels, rng = rng)
+
+    if targetProfile is not None:
+        msg = 'sampleSegments: A noise index is required for parameter ''targetProfile''.'
+        raise ValueError(msg)
+    return rng.integers(imported_data.shape[1], size = nChannels)
+#end sampleSegments(imported_data, nChannels, rng=None, noiseIndex=None, targetProfile=None)
+
+
+def experimentalNoise(imported_data, nChannels, rng=None, noiseIndex=None, targetProfile=None):
+    '''
+    Experimental noise; one segment of the noise bank per channel.
+    See :meth:`fNIRSSignalGenerator.addExperimentalNoise`.
+
+    :param imported_data: The noise bank <temporal, segment, signal>.
+    :type imported_data: numpy.ndarray
+    :param nChannels: Number of channels.
+    :type nChannels: int
+    :param rng: Random generator or seed.
+    :param noiseIndex: Index over the bank. If given, only screened segments
+        are drawn and targetProfile can be used. Optional. Default is None.
+    :type noiseIndex: noiseBank.noiseBankIndex or NoneType
+    :param targetProfile: Target noise profile. Optional. Default is None.
+    :type targetProfile: dict or NoneType
+    :return: A data tensor <nSamples(bank) x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    sampled = sampleSegments(imported_data, nChannels, rng, noiseIndex, targetProfile)
+
+    return imported_data[:, sampled, :]
+#end experimentalNoise(imported_data, nChannels, rng=None, noiseIndex=None, targetProfile=None)
+
+
+def channelIndex(channelsList):
+    '''
+    Gets the index of a sorted channels list in the channel dimension of the
+    data tensor. Channels forming a range are indexed with a slice, so
+    that the indexed tensor is a view rather than a copy.
+
+    :param channelsList: The sorted list of channels.
+    :type channelsList: list
+    :return: The index.
+    :rtype: slice or numpy.ndarray
+    '''
+
+    if len(channelsList) > 0 and list(channelsList) == list(range(channelsList[0], channelsList[-1]+1)):
+        return slice(channelsList[0], channelsList[-1]+1)
+
+    return np.array(channelsList, dtype=int)
+#end channelIndex(channelsList)
+
+
+def accumulate(out, tmpData, channelsList, initSample=0):
+    '''
+    Adds tmpData in place to out[initSample:initSample+len(tmpData), channelsList, :].
+
+    If the channels form a range, the sum is written straight into the view
+    of out; otherwise a single read-add-scatter is done.
+
+    :param out: The data tensor <nSamples x nChannels x nSignals>.
+    :type out: numpy.ndarray
+    :param tmpData: The data to add <nSamples' x len(channelsList) x nSignals>.
+    :type tmpData: numpy.ndarray
+    :param channelsList: The sorted list of channels, or its :func:`channelIndex`.
+    :type channelsList: list, slice or numpy.ndarray
+    :param initSample: Initial temporal sample. Default is 0.
+    :type initSample: int (positive)
+    :return: out
+    :rtype: numpy.ndarray
+    '''
+
+    index = channelsList if isinstance(channelsList, (slice, np.ndarray)) else channelIndex(channelsList)
+    rows = slice(initSample, initSample + tmpData.shape[0])
+    if isinstance(index, slice):
+        view = out[rows, index]
+        np.add(view, tmpData, out=view)
+    else:
+        out[rows, index] += tmpData
+
+    return out
+#end accumulate(out, tmpData, channelsList, initSample=0)
+
+
+def _readOnly(array):
+    '''Flags an array as read only, so a plan cannot be altered after compilation.'''
+
+    array.flags.writeable = False
+    return array
+#end _readOnly(array)
+
+
+class fNIRSPlan:
+    '''
+    Compiled execution plan of a :class:`fNIRSConfig`.
+
+    A plan is built once with :func:`compile`, which carries out all the
+    parameter validation and setup: the channel index, the temporal window,
+    the timebase, the HRF step response, the block intervals and the
+    frequency sets of the physiological noises. :meth:`run` then only draws
+    the random amplitudes and phases and accumulates the precomputed terms,
+    with no further checking. Plans are immutable (all arrays are read only),
+    so one plan can be run concurrently from several threads.
+
+    Since the convolution with the HRF is linear, the stimulus response for
+    any set of block amplitudes is the sum of the scaled responses to the
+    block intervals, each added into the samples it touches (see
+    :func:`addIntervalResponses`); the cost scales with the number of blocks
+    times the block plus kernel length, not with the recording length. Likewise, each sinusoid with random amplitude A and phase
+    theta is A*cos(theta)*sin(wt) + A*sin(theta)*cos(wt), so the physiological
+    noise is a product with the sin/cos bases. The bases are not kept in the
+    plan; they are built chunk by chunk (:data:`NOISE_CHUNK_SIZE` samples) as
+    they are used, so a (cached) plan holds no <nSamples x nFrequencies> matrix.
+
+    All the enabled noise sources are accumulated in place into the
+    output by :meth:`composeNoise`, with a contiguous view of the output when
+    the channels form a range; no per source tensor is allocated.
+    '''
+
+    __slots__ = ('config', 'channelIndex', 'initSample', 'endSample', 'timestamps', 'cumulativeHRF',
+                 'nBlocks', 'blockIntervals', 'eventSamples', 'eventResponse', 'channelMasks', 'frequencySets')
+
+    def __init__(self, config):
+        #Parameters are checked by fNIRSConfig and compile
+        initSample, endSample = config.window()
+        nSamples = endSample - initSample
+        channelsList = config.channels()
+        nChannels = len(channelsList)
+        nBlocks = len(config.boxCarList)
+
+        object.__setattr__(self, 'config', config)
+        index = channelIndex(channelsList) #A slice (view, no copies) if channels form a range
+        object.__setattr__(self, 'channelIndex', index if isinstance(index, slice) else _readOnly(index))
+        object.__setattr__(self, 'initSample', initSample)
+        object.__setattr__(self, 'endSample', endSample)
+
+        timestamps = timebase(nSamples, config.samplingRate)
+        object.__setattr__(self, 'timestamps', timestamps)
+        cumulativeKernel = cumulativeHRF(config.samplingRate, config.tau_p, config.tau_d, config.amplitudeScalingFactor)
+        object.__setattr__(self, 'cumulativeHRF', cumulativeKernel)
+
+        #Block intervals (starts, stops, blocks) of HbO2 and HHb. As in stimulusResponse,
+        #a sample covered by several enabled blocks takes the amplitude of the last one.
+        object.__setattr__(self, 'nBlocks', nBlocks)
+        intervals = list()
+        for enableBlocks in (config.enableHbO2Blocks, config.enableHHbBlocks):
+            intervals.append(tuple(_readOnly(elem) for elem in blockIntervals(config.boxCarList, timestamps, enableBlocks)))
+        object.__setattr__(self, 'blockIntervals', tuple(intervals))
+
+        #Response to the events <nSamples>, for the configured event amplitudes
+        samples, kept = eventSamples(config.eventOnsets, timestamps)
+        object.__setattr__(self, 'eventSamples', (_readOnly(samples), _readOnly(kept)))
+        object.__setattr__(self, 'eventResponse', _readOnly(self.eventsResponse(config.eventAmp)))
+
+        channelMasks = np.empty((2, nChannels))
+        channelMasks[HBO2] = np.asarray(config.enableHbO2Channels, dtype=float)
+        channelMasks[HHB] = np.asarray(config.enableHHbChannels, dtype=float)
+        object.__setattr__(self, 'channelMasks', _readOnly(channelMasks))
+
+        frequencySets = dict()
+        for source, (frequencyMean, frequencySD) in PHYSIOLOGICAL_NOISES.items():
+            if not getattr(config, source):
+                continue
+            frequencySet = np.arange(frequencyMean-2*frequencySD, \
+                                     frequencyMean+2*frequencySD+config.frequencyResolutionStep, \
+                                     config.frequencyResolutionStep, dtype = float)
+            frequencySets[source] = _readOnly(frequencySet)
+        object.__setattr__(self, 'frequencySets', frequencySets)
+    #end __init__(self, config)
+
+
+    def __setattr__(self, name, value):
+        msg = 'fNIRSPlan: Plans are immutable.'
+        raise AttributeError(msg)
+    #end __setattr__(self, name, value)
+
+
+    def blocksResponse(self, boxcarAmp):
+        '''
+        Response to the blocks of the plan for the given block amplitudes.
+        See :func:`addIntervalResponses`.
+
+        :param boxcarAmp: Block amplitudes.
+        :type boxcarAmp: list, tuple or numpy.ndarray
+        :return: The HbO2 and HHb responses <2 x nSamples>.
+        :rtype: numpy.ndarray
+        '''
+
+        boxcarAmp = np.broadcast_to(np.asarray(boxcarAmp, dtype=float).ravel(), (self.nBlocks,))
+        response = np.zeros((2, len(self.timestamps)))
+        for signal in (HBO2, HHB):
+            starts, stops, blocks = self.blockIntervals[signal]
+            addIntervalResponses(response[signal], starts, stops, boxcarAmp[blocks], self.cumulativeHRF)
+        response[HHB] *= -1/3
+
+        return response
+    #end blocksResponse(self, boxcarAmp)
+
+
+    def eventsResponse(self, eventAmp):
+        '''
+        Response to the events of the plan for the given event amplitudes.
+        See :func:`addEventResponses`.
+
+        :param eventAmp: Event amplitudes.
+        :type eventAmp: list, tuple or numpy.ndarray
+        :return: The HbO2 response <nSamples>.
+        :rtype: numpy.ndarray
+        '''
+
+        samples, kept = self.eventSamples
+        eventAmp = np.broadcast_to(np.asarray(eventAmp, dtype=float).ravel(), kept.shape)
+        config = self.config
+
+        return addEventResponses(np.zeros(len(self.timestamps)), samples, eventAmp[kept], \
+                                 hrfKernel(config.samplingRate, config.tau_p, config.tau_d, config.amplitudeScalingFactor))
+    #end eventsResponse(self, eventAmp)
+
+
+    def run(self, rng=None, out=None, boxcarAmp=None, channelAmp=None, imported_data=None, \
+            noiseIndex=None, targetProfile=None, eventAmp=None):
+        '''
+        Runs the plan. Parameters are not checked.
+
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :param out: Output buffer <nSamples x nChannels x 2>. It is overwritten.
+            Optional. Default is None (a new tensor is allocated).
+        :type out: numpy.ndarray or NoneType
+        :param boxcarAmp: Block amplitudes; overrides config.boxcarAmp. Optional.
+        :type boxcarAmp: list or NoneType
+        :param channelAmp: Channel amplitudes; overrides config.channelAmp. Optional.
+        :type channelAmp: list or NoneType
+        :param imported_data: The experimental noise bank. Required if
+            config.experimental is set.
+        :type imported_data: numpy.ndarray or NoneType
+        :param noiseIndex: Index over the noise bank. Optional. Default is None.
+        :type noiseIndex: noiseBank.noiseBankIndex or NoneType
+        :param targetProfile: Target noise profile; overrides config.noiseProfile. Optional.
+        :type targetProfile: dict or NoneType
+        :param eventAmp: Event amplitudes; overrides config.eventAmp. Optional.
+        :type eventAmp: list or NoneType
+        :return: The data tensor (out, if given).
+        :rtype: numpy.ndarray
+        '''
+
+        config = self.config
+        if out is None:
+            out = np.zeros((config.nSamples, config.nChannels, 2))
+        else:
+            out[...] = 0
+        if boxcarAmp is None:
+            boxcarAmp = config.boxcarAmp
+        if channelAmp is None:
+            channelAmp = config.channelAmp
+        nChannels = self.channelMasks.shape[1]
+        nSamples = self.endSample - self.initSample
+
+        #Target of the accumulation: a view of out if possible, a single scratch tensor otherwise
+        rowsEnd = self.endSample + 1 if config.experimental else self.endSample
+        if isinstance(self.channelIndex, slice):
+            target = out[self.initSample:rowsEnd, self.channelIndex]
+        else:
+            target = np.zeros((rowsEnd - self.initSample, nChannels, 2))
+
+        #Stimulus response
+        channelScale = self.channelMasks * np.asarray(channelAmp, dtype=float).ravel() #<2 x nChannels>
+        response = self.blocksResponse(boxcarAmp) #<2 x nSamples>
+        if len(self.eventSamples[0]) > 0:
+            events = self.eventResponse if eventAmp is None else self.eventsResponse(eventAmp)
+            response[HBO2] += events
+            response[HHB] += (-1/3)*events
+        np.multiply(response.T[:, None, :], channelScale.T[None, :, :], out=target[:nSamples])
+
+        self.composeNoise(target, seedSequence(rng), imported_data=imported_data, \
+                          noiseIndex=noiseIndex, targetProfile=targetProfile)
+
+        if not isinstance(self.channelIndex, slice):
+            out[self.initSample:rowsEnd, self.channelIndex] += target
+
+        return out
+    #end run(self, rng=None, out=None, ...)
+
+
+    def composeNoise(self, target, rng=None, imported_data=None, noiseIndex=None, targetProfile=None):
+        '''
+        Accumulates all the enabled noise sources in place into target.
+        Parameters are not checked.
+
+        A single scratch matrix <nSamples x nChannels> is reused by all the
+        sources; the sin/cos bases of the physiological noises are built
+        chunk by chunk and the experimental noise is added segment by segment.
+
+        :param target: The window of the output <nSamples(+1) x nChannels x 2>
+            for the plan channels, starting at initSample. It has one more
+            sample if the experimental noise is enabled.
+        :type target: numpy.ndarray
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :param imported_data: The experimental noise bank. Required if
+            config.experimental is set.
+        :type imported_data: numpy.ndarray or NoneType
+        :param noiseIndex: Index over the noise bank. Optional. Default is None.
+        :type noiseIndex: noiseBank.noiseBankIndex or NoneType
+        :param targetProfile: Target noise profile; overrides config.noiseProfile. Optional.
+        :type targetProfile: dict or NoneType
+        :return: target
+        :rtype: numpy.ndarray
+        '''
+
+        config = self.config
+        nChannels = self.channelMasks.shape[1]
+        nSamples = self.endSample - self.initSample
+        streams = sourceGenerators(rng)
+        window = target[:nSamples]
+        scratch = np.empty((nSamples, nChannels))
+
+        def addSignals(noise):
+            #HbO2 += noise; HHb += -1/3 noise
+            np.add(window[:, :, HBO2], noise, out=window[:, :, HBO2])
+            np.multiply(noise, -1/3, out=noise)
+            np.add(window[:, :, HHB], noise, out=window[:, :, HHB])
+
+        for source, frequencySet in self.frequencySets.items():
+            nFrequencies = len(frequencySet)
+            #Same draws as physiologicalNoise: amplitude then phase, per frequency
+            draws = streams[source].random((nFrequencies, 2, nChannels))
+            theta = 2*math.pi*draws[:, 1, :] - math.pi
+            coefficients = np.concatenate((draws[:, 0, :] * np.cos(theta), draws[:, 0, :] * np.sin(theta)))
+            #[sin | cos] basis <chunk x 2nFrequencies>, one matrix product per chunk
+            basis = np.empty((min(nSamples, NOISE_CHUNK_SIZE), 2*nFrequencies))
+            for start in range(0, nSamples, NOISE_CHUNK_SIZE):
+                stop = min(nSamples, start + NOISE_CHUNK_SIZE)
+                chunk = basis[:stop - start]
+                phase = 2*math.pi*np.outer(self.timestamps[start:stop], frequencySet)
+                np.sin(phase, out=chunk[:, :nFrequencies])
+                np.cos(phase, out=chunk[:, nFrequencies:])
+                np.matmul(chunk, coefficients, out=scratch[start:stop])
+            addSignals(scratch)
+
+        if config.gaussian:
+            #Same draws as gaussianNoise; normal(0, sd) is sd*standard_normal
+            for signal in (HBO2, HHB):
+                streams['gaussian'].standard_normal(out=scratch)
+                np.multiply(scratch, 0.3, out=scratch)
+                np.add(window[:, :, signal], scratch, out=window[:, :, signal])
+
+        if config.experimental:
+            if imported_data is None or imported_data.shape[0] != nSamples + 1:
+                msg = 'fNIRSPlan:composeNoise: Unexpected parameter value for parameter ''imported_data''. Incorrectly sampled data.'
+                raise ValueError(msg)
+            if targetProfile is None and config.noiseProfile is not None:
+                targetProfile = dict(config.noiseProfile)
+            sampled = sampleSegments(imported_data, nChannels, streams['experimental'], noiseIndex, targetProfile)
+            segment = np.empty((nSamples + 1, 2))
+            for i, elem in enumerate(sampled):
+                np.multiply(imported_data[:, elem, :], config.noiseRatio, out=segment)
+                np.add(target[:, i, :], segment, out=target[:, i, :])
+
+        return target
+    #end composeNoise(self, target, rng=None, ...)
+
+#class fNIRSPlan
+
+
+@lru_cache(maxsize=64)
+def compile(config):
+    '''
+    Compiles a configuration into an execution plan.
+
+    All validation and setup happens here, once; see :class:`fNIRSPlan`.
+    Plans are cached by configuration (configurations are hashable), so
+    compiling the same configuration again is free. A plan holds a few
+    vectors <nSamples> (timebase, event response) and the block intervals;
+    no matrix grows with the recording length times the blocks or frequencies.
+
+    :param config: The configuration.
+    :type config: fNIRSConfig
+    :return: The plan.
+    :rtype: fNIRSPlan
+    '''
+
+    #Check parameters
+    if type(config) is not fNIRSConfig:
+        msg = 'compile: Unexpected parameter type for parameter ''config''.'
+        raise ValueError(msg)
+    nBlocks = len(config.boxCarList)
+    nChannels = len(config.channels())
+    for name, n in (('boxcarAmp', nBlocks), ('enableHbO2Blocks', nBlocks), ('enableHHbBlocks', nBlocks),
+                    ('eventAmp', len(config.eventOnsets)),
+                    ('channelAmp', nChannels), ('enableHbO2Channels', nChannels), ('enableHHbChannels', nChannels)):
+        if len(getattr(config, name)) not in (1, n):
+            msg = 'compile: Unexpected parameter value for parameter config.' + name + '.'
+            raise ValueError(msg)
+
+    return fNIRSPlan(config)
+#end compile(config)
+
+
+def generate(config, rng=None, out=None, imported_data=None, noiseIndex=None):
+    '''
+    Generates a synthetic fNIRS data tensor from an immutable configuration.
+
+    This is a pure function; it does not keep nor modify any state other than
+    the out buffer and the given random generator. The configuration is
+    compiled once (see :func:`compile`) and the plan reused on later calls. One independent child
+    stream per noise source is derived from rng (see :func:`rngStreams.sourceGenerators`).
+
+    :Parameters:
+
+    :param config: The configuration.
+    :type config: fNIRSConfig
+    :param rng: Random generator or seed. See module :mod:`rngStreams`.
+        Optional. Default is None (fresh unpredictable stream).
+    :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+    :param out: Output buffer <nSamples x nChannels x 2>. It is overwritten.
+        Optional. Default is None (a new tensor is allocated).
+    :type out: numpy.ndarray or NoneType
+    :param imported_data: The experimental noise bank. Required if
+        config.experimental is set.
+    :type imported_data: numpy.ndarray or NoneType
+    :param noiseIndex: Index over the noise bank. Optional. Default is None.
+    :type noiseIndex: noiseBank.noiseBankIndex or NoneType
+
+    :return: The data tensor (out, if given).
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if type(config) is not fNIRSConfig:
+        msg = 'generate: Unexpected parameter type for parameter ''config''.'
+        raise ValueError(msg)
+    shape = (config.nSamples, config.nChannels, 2)
+    if out is not None and (type(out) is not np.ndarray or out.shape != shape):
+        msg = 'generate: Unexpected parameter value for parameter ''out''.'
+        raise ValueError(msg)
+
+    return compile(config).run(rng, out=out, imported_data=imported_data, noiseIndex=noiseIndex)
+#end generate(config, rng=None, out=None, imported_data=None, noiseIndex=None)
@@ -41,6 +41,24 @@ from optodeArrayInfo import optodeArrayInfo
 
 from channelLocationMap import channelLocationMap
 
+from noiseBank import noiseBankIndex
+
+from rngStreams import sourceGenerators, seedSequence, cellSeedSequence
+
+import fNIRSSynthesis
+from fNIRSSynthesis import fNIRSConfig
+
+import fNIRSGLM
+
+import signalFilters
+
+import resampling
+
+import mbll
+
+
+SNIRF_SAMPLING_RATE = 50 # [Hz] Sampling rate of the resting state recordings
+
 # Class fNIRSSignalGenerator is a subclass of channelLocationMap
 class fNIRSSignalGenerator(channelLocationMap):
     '''
@@ -82,6 +100,7 @@ class fNIRSSignalGenerator(channelLocationMap):
         #Ensure all properties exist
         self.__data = np.zeros((0,0,0),dtype=float)
         self.__samplingRate = 10 #[Hz]
+        self.__noiseIndex = None #Index over the experimental noise bank. See indexExperimentalNoise
 
         #Check parameters
         if type(nSamples) is not int:
@@ -458,13 +477,118 @@ class fNIRSSignalGenerator(channelLocationMap):
                                               enableHHbChannels=enableHHbChannels, \
                                               enableHbO2Blocks=enableHbO2Blocks, \
                                               enableHHbBlocks=enableHHbBlocks, boxcar_amp=boxcar_amp, channel_amp=channel_amp)
-        self.__data[initSample:endSample, channelsList, :] = \
-            self.__data[initSample:endSample, channelsList, :] + tmpData
+        fNIRSSynthesis.accumulate(self.__data, tmpData, channelsList, initSample)
 
         return
     # end addStimulusResult(self,channelsList = list(), boxCarList=list(), initSample = 0, ... , enableHHbBlocks = np.ones(1, dtype=int))
 
 
+    def addEventResponse(self, channelsList=list(), onsets=list(), amplitudes=[1], initSample=0, endSample=-1, \
+                         tau_p=6, tau_d=10, amplitudeScalingFactor=6, \
+                         enableHbO2Channels = np.ones(1, dtype=int), \
+                         enableHHbChannels = np.ones(1, dtype=int), channel_amp=[1], method='auto'):
+        '''
+        Adds the result of an event-related design to the data tensor.
+        Each event is brief (an impulse); the HRF is placed at every onset
+        and scaled by the event amplitude. Unlike :meth:`addStimulusResult`, no
+        dense boxcar is built; the responses are scatter-added or convolved
+        by FFT, whichever is cheaper (see :func:`fNIRSSynthesis.addEventResponses`).
+        Here, such newly generated data tensor is added to the class :attr:`data`.
+        :Parameters:
+        :param channelsList: List of channels affected. Default is the empty list.
+        :type channelsList: list
+        :param onsets: List of event onsets [s], relative to initSample.
+            See :func:`fNIRSSynthesis.jitteredOnsets` for jittered designs.
+            Default is the empty list.
+        :type onsets: list or numpy.ndarray
+        :param amplitudes: Amplitude of each event. A single value is applied
+            to all events. Default is [1].
+        :type amplitudes: list or numpy.ndarray
+        :param initSample: Initial temporal sample. Default is 0.
+        :type initSample: int (positive)
+        :param endSample: Last temporal sample. A positive value
+            explicitly indicates a sample. A value -1 indicates the last
+            sample of :attr:`data`. If not -1, then the endSample must be
+            greater than the initSample. Default is -1.
+        :type endSample: int (positive or -1)
+        :param tau_p: See :meth:`addStimulusResult`. Default is 6.
+        :type tau_p: int (positive)
+        :param tau_d: See :meth:`addStimulusResult`. Default is 10.
+        :type tau_d: int (positive)
+        :param amplitudeScalingFactor: See :meth:`addStimulusResult`. Default is 6.
+        :type amplitudeScalingFactor: float (positive)
+        :param enableHbO2Channels: See :meth:`addStimulusResult`.
+        :type numpy.ndarray
+        :param enableHHbChannels: See :meth:`addStimulusResult`.
+        :type numpy.ndarray
+        :param channel_amp: Amplitude of each channel. Default is [1].
+        :type channel_amp: list
+        :param method: 'auto', 'scatter' or 'fft'. Default is 'auto'.
+        :type method: str
+        :return: None
+        :rtype: NoneType
+        '''
+
+        # Check parameters
+        if type(channelsList) is not list:
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter type for parameter ''channelList''.'
+            raise ValueError(msg)
+        for elem in channelsList:
+            if type(elem) is not int:
+                msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''channelList''.'
+                raise ValueError(msg)
+            if elem < 0 or elem >= self.nChannels:  # Ensure the nChannels exist
+                msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''channelList''.'
+                raise ValueError(msg)
+
+        if type(initSample) is not int:
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter type for parameter ''initSample''.'
+            raise ValueError(msg)
+        if initSample < 0 or initSample >= self.nSamples:  # Ensure the nSamples exist
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''initSample''.'
+            raise ValueError(msg)
+
+        if type(endSample) is not int:
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter type for parameter ''endSample''.'
+            raise ValueError(msg)
+        if endSample < -1 or endSample >= self.nSamples:  # Ensure the nSamples exist
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''endSample''.'
+            raise ValueError(msg)
+        if endSample == -1:  # If -1, substitute by the maximum last sample
+            endSample = self.nSamples - 1
+        if endSample <= initSample:  # Ensure the endSample is posterior to the initSample
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''endSample''.'
+            raise ValueError(msg)
+
+        onsets = np.asarray(onsets, dtype=float).ravel()
+        if np.any(onsets < 0):
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''onsets''.'
+            raise ValueError(msg)
+        amplitudes = np.asarray(amplitudes, dtype=float).ravel()
+        if len(amplitudes) != 1 and len(amplitudes) != len(onsets):
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''amplitudes''.'
+            raise ValueError(msg)
+        if method not in ('auto', 'scatter', 'fft'):
+            msg = self.getClassName() + ':addEventResponse: Unexpected parameter value for parameter ''method''.'
+            raise ValueError(msg)
+        #The HRF parameters are checked by double_gamma_function
+        self.double_gamma_function(np.arange(1, dtype=float), tau_p, tau_d, amplitudeScalingFactor)
+
+        channelsList = list(set(channelsList))  # Unique and sort elements
+        nChannels = len(channelsList)
+        nSamples = endSample - initSample
+        tmpData = fNIRSSynthesis.eventResponse(onsets, nSamples, nChannels, self.samplingRate, \
+                                               amplitudes=amplitudes, tau_p=tau_p, tau_d=tau_d, \
+                                               amplitudeScalingFactor=amplitudeScalingFactor, \
+                                               enableHbO2Channels=enableHbO2Channels, \
+                                               enableHHbChannels=enableHHbChannels, \
+                                               channel_amp=channel_amp, method=method)
+        fNIRSSynthesis.accumulate(self.__data, tmpData, channelsList, initSample)
+
+        return
+    # end addEventResponse(self, channelsList=list(), onsets=list(), amplitudes=[1], ... , method='auto')
+
+
     def double_gamma_function(self, timestamps = np.arange(25, dtype=float), \
                                 tau_p = 6, tau_d = 10, amplitudeScalingFactor = 6):
         '''
@@ -515,10 +639,7 @@ class fNIRSSignalGenerator(channelLocationMap):
             msg = self.getClassName() + ':double_gamma_function: Unexpected parameter value for parameter ''amplitudeScalingFactor''.'
             raise ValueError(msg)
 
-        HRF = ( pow(timestamps, tau_p) * np.exp(-1 * timestamps) ) / math.factorial(tau_p)
-        HRF = HRF - ( pow(timestamps, tau_p+tau_d) * np.exp(-1 * timestamps) ) / ( amplitudeScalingFactor * math.factorial(tau_p+tau_d) )
-
-        return HRF
+        return fNIRSSynthesis.double_gamma_function(timestamps, tau_p, tau_d, amplitudeScalingFactor)
     #end double_gamma_function(self, timestamps = np.arange(25, dtype=float), tau_p=6, ... , amplitudeScalingFactor=6)
 
 
@@ -675,108 +796,18 @@ class fNIRSSignalGenerator(channelLocationMap):
             if enableHHbBlocks[i] != 1 and enableHHbBlocks[i] != 0:
                 msg = self.getClassName() + ':generateStimulusResult: Unexpected parameter type for parameter ''enableHHbBlocks''.'
                 raise ValueError(msg)
-        boxCarListSet = list(set(boxCarList))  # Unique and sort elements
-        nBlocks = len(boxCarListSet)
-        
-        if len(boxcar_amp) == 1:
-            boxcar_amp = [boxcar_amp]*nBlocks
-
-        if len(channel_amp) == 1:
-            channel_amp = [channel_amp]*nChannels
-
-        timestamps = np.arange(0, nSamples/self.samplingRate, 1/self.samplingRate, dtype = float)
-        #print(timestamps)
-        #print(self.samplingRate)
-
-        ntimestamps = len(timestamps)
-        boxCar      = np.zeros(ntimestamps) #creation of the boxcar with 0s
-        boxCarHbO2  = np.zeros(ntimestamps) #creation of the boxcar for HbO2 with 0s
-        boxCarHHb   = np.zeros(ntimestamps) #creation of the boxcar for HHb with 0s
-
-        iBlock = 0
-        for elem in boxCarList:
-            i = np.searchsorted(timestamps, elem[0])
-            j = np.searchsorted(timestamps, elem[1]) + 1
-            boxCar[i:j] = 1
-            if enableHbO2Blocks[iBlock] == 1:
-                boxCarHbO2[i:j] = boxcar_amp[iBlock]
-            if enableHHbBlocks[iBlock] == 1:
-                boxCarHHb[i:j] = boxcar_amp[iBlock]
-            iBlock+=1
-
-        #plt.plot(boxCar, color='black')
-        #plt.title('BoxCar')
-        #plt.show()
-
-        #plt.plot(boxCarHbO2, color='red')
-        #plt.title('BoxCar with the enabled blocks for HbO2 signal')
-        #plt.show()
-
-        #plt.plot(boxCarHHb, color='blue')
-        #plt.title('BoxCar with the enabled blocks for HHb signal')
-        #plt.show()
-
-        HRF = self.double_gamma_function(timestamps, tau_p, tau_d, amplitudeScalingFactor)
-
-        # This is only for visualizing the doble gamma function
-        #timestamps1 = np.arange(0, 25, 0.1, dtype=float)
-        #HRF1 = self.double_gamma_function(timestamps1, tau_p, tau_d, amplitudeScalingFactor)
-        #HRF2 = -1*(1/3)*self.double_gamma_function(timestamps1, tau_p, tau_d, amplitudeScalingFactor)
-        #plt.plot(HRF1, color='red', label='Oxygenated')
-        #plt.plot(HRF2, color='blue', label='Deoxygenated' )
-        #plt.title('HRF')
-        #plt.xlabel('Time [samples]')
-        #plt.ylabel('HRF')
-        #plt.yticks([0])
-        #plt.legend()
-        #plt.show()
-        
-
-        #HbO2 = np.convolve(boxCarHbO2, HRF)
-        HbO2 = np.convolve(boxCarHbO2, HRF, mode='full')
-        HbO2 = HbO2[0:2999]
-
-        #plt.plot(HbO2, color='red')
-        #plt.title('Result of the convolution of HRF and the BoxCar for HbO2 signal')
-        #plt.show()
-
-        HbO2 = HbO2.reshape(-1, 1) #Reshape to column vector
-        HbO2 = np.tile(HbO2, nChannels)
-
-        #HbO2forHHb = np.convolve(boxCarHHb, HRF)
-        HbO2forHHb = np.convolve(boxCarHHb, HRF, mode='full')
-        HbO2forHHb = HbO2forHHb[0:2999]
-
-        #plt.plot(HbO2forHHb, color='blue')
-        #plt.title('Result of the convolution of HRF and the BoxCar for HHb signal')
-        #plt.show()
-
-        HbO2forHHb = HbO2forHHb.reshape(-1, 1) #Reshape to column vector
-        HbO2forHHb = np.tile(HbO2forHHb, nChannels)
-
-        HHb = (-1/3) * HbO2forHHb
-
-        synthData = np.zeros((nSamples, nChannels, 2)) #The synthetic data tensor
-
-        #print(HbO2[0:nSamples, :])
-        #print(HHb[0:nSamples, :])
-
-        #print(enableHHbChannels)
-
-        #print(HHb[0:nSamples, :] * enableHHbChannels)
-
-        synthData[:, :, self.HBO2] = synthData[:, :, self.HBO2] + HbO2[0:nSamples, :] * enableHbO2Channels
-        synthData[:, :, self.HHB]  = synthData[:, :, self.HHB]  + HHb[0:nSamples, :] * enableHHbChannels
-
-        for j in range(nChannels):
-            synthData[:,j,:]=channel_amp[j]*synthData[:,j,:]
-
-
-        return synthData
+        return fNIRSSynthesis.stimulusResponse(boxCarList, nSamples, nChannels, self.samplingRate, \
+                                               tau_p=tau_p, tau_d=tau_d, \
+                                               amplitudeScalingFactor=amplitudeScalingFactor, \
+                                               enableHbO2Channels=enableHbO2Channels, \
+                                               enableHHbChannels=enableHHbChannels, \
+                                               enableHbO2Blocks=enableHbO2Blocks, \
+                                               enableHHbBlocks=enableHHbBlocks, \
+                                               boxcar_amp=boxcar_amp, channel_amp=channel_amp)
     #end generateStimulusResult(self, boxCarList=list(), nSamples = 100, nChannels = 1, ... , enableHHbChannels = np.ones(1, dtype=int))
 
 
-    def addGaussianNoise(self, channelsList=list(), initSample=0, endSample=-1):
+    def addGaussianNoise(self, channelsList=list(), initSample=0, endSample=-1, rng=None):
 
         '''
         Adds Gaussian noise to the data tensor.
@@ -791,6 +822,9 @@ class fNIRSSignalGenerator(channelLocationMap):
             sample of :attr:`data`. If not -1, then the endSample must be
             greater than the initSample. Default is -1.
         :type endSample: int (positive or -1)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
         :return: None
         :rtype: NoneType
         '''
@@ -830,38 +864,16 @@ class fNIRSSignalGenerator(channelLocationMap):
         nChannels = len(channelsList)
         nSamples = endSample - initSample
 
-        timestamps = np.arange(0, nSamples/self.samplingRate, \
-                                  1/self.samplingRate, dtype = float)
-
-        timestamps = timestamps.reshape(-1, 1) #Reshape to column vector
-        timestamps = np.tile(timestamps,nChannels)
-
-        noiseHbO2 = np.random.normal(0, 0.3, timestamps.shape)
-        #noiseHbO2 = np.random.normal(0, 0.3, timestamps.shape)
-        noiseHHb  = np.random.normal(0, 0.3, timestamps.shape)
-
-        noiseHbO2_plot = np.random.normal(0, 0.3, timestamps.shape)
-
-        #plt.plot(noiseHbO2_plot[0:nSamples,0], color='blue')
-        #plt.title('Gaussian Noise')
-        #plt.show()
-
-        #plt.plot(noiseHHb[0:nSamples,0], color='blue')
-        #plt.show()
-
-        self.__data[0:nSamples,channelsList,0] = \
-                self.__data[0:nSamples,channelsList,0] + noiseHbO2
-
-        self.__data[0:nSamples,channelsList,1] = \
-                self.__data[0:nSamples,channelsList,1] + noiseHHb
+        fNIRSSynthesis.accumulate(self.__data, fNIRSSynthesis.gaussianNoise(nSamples, nChannels, rng=rng), \
+                                  channelsList, initSample)
 
         return
-    #end addGaussianNoise(self, channelsList=list(), initSample=0, endSample=-1)
+    #end addGaussianNoise(self, channelsList=list(), initSample=0, endSample=-1, rng=None)
 
 
     def addPhysiologicalNoise(self, channelsList=list(), initSample=0, endSample=-1, \
                                frequencyMean = 0.22, frequencySD = 0.07, \
-                               frequencyResolutionStep = 0.01):
+                               frequencyResolutionStep = 0.01, rng=None):
         '''
         Adds physiological noise to the data tensor.
         The generated noise is added to the class :attr:`data`.
@@ -887,6 +899,9 @@ class fNIRSSignalGenerator(channelLocationMap):
             within the interval of frequencies of the noise to be simulated.
             Optional. Default is 0.01.
         :type frequencyResolutionStep: float (positive)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
         :return: None
         :rtype: NoneType
         '''
@@ -947,46 +962,20 @@ class fNIRSSignalGenerator(channelLocationMap):
         nChannels = len(channelsList)
         nSamples = endSample - initSample
 
-        tmpData = np.zeros((nSamples, nChannels, 2)) #The temporal data tensor for saving the generated noise
-
-        timestamps = np.arange(0, nSamples/self.samplingRate, 1/self.samplingRate, dtype = float)
-        timestamps = timestamps.reshape(-1, 1) #Reshape to column vector
-        timestamps = np.tile(timestamps,nChannels)
-
-        frequencySet = np.arange(frequencyMean-2*frequencySD, \
-                                 frequencyMean+2*frequencySD+frequencyResolutionStep, \
-                                 frequencyResolutionStep, dtype = float)   # From paper (Elwell et al., 1999)
-        amplitudeScalingFactor = 1   # estandarizada para la distribución tenga media 0 y desv 1 z-score
-        for freq in frequencySet:
-            #Amplitude. One random amplitude per channel
-            A = amplitudeScalingFactor*np.random.rand(1,nChannels)
-            A = np.tile(A,[nSamples,1])
-            #Phase [rad]. One random phase per channel
-            theta = 2* math.pi * np.random.rand(1,nChannels) - math.pi
-            theta = np.tile(theta,[nSamples,1])
-            #theta = 0
-            #Generate the fundamental signal
-            tmpSin = A * np.sin(2*math.pi*freq*timestamps+theta)
-            #Elment-wise multiplication with the amplitude
-                #NOTE: In python NumPy, a*b among ndarrays is the
-                #element-wise product. For matrix multiplication, one
-                #need to do np.matmul(a,b)
-            tmpData[:,:,self.HBO2] = tmpData[:,:,self.HBO2] + tmpSin
-            tmpData[:,:,self.HHB]  = tmpData[:,:,self.HHB]  + (-1/3)*tmpSin
-
-        #plt.plot(tmpSin[0:nSamples,0], color='blue')
-        #plt.show()
+        tmpData = fNIRSSynthesis.physiologicalNoise(nSamples, nChannels, self.samplingRate, \
+                                                    frequencyMean, frequencySD, \
+                                                    frequencyResolutionStep, rng=rng)
 
         #TODO: al tener la señal final se debe estandarizar z_score  eliminar la media y dividir por la desv. stand
 
-        self.__data[0:nSamples,channelsList,:] = self.__data[0:nSamples,channelsList,:] + tmpData
+        fNIRSSynthesis.accumulate(self.__data, tmpData, channelsList, initSample)
 
         return
-    #end addPhysiologicalNoise(self, channelsList=list(), initSample=0, ... , frequencyResolutionStep = 0.01)
+    #end addPhysiologicalNoise(self, channelsList=list(), initSample=0, ... , frequencyResolutionStep = 0.01, rng=None)
 
 
     def addHeartRateNoise(self, channelsList=list(), initSample=0, endSample=-1, \
-                          frequencyResolutionStep = 0.01):
+                          frequencyResolutionStep = 0.01, rng=None):
         '''
         Adds noise of heart rate to the data tensor.
         The generated noise is added to the class :attr:`data`.
@@ -1004,24 +993,27 @@ class fNIRSSignalGenerator(channelLocationMap):
             within the interval of frequencies of the noise to be simulated.
             Optional. Default is 0.01.
         :type frequencyResolutionStep: float (positive)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
         :return: None
         :rtype: NoneType
         '''
 
         #Check parameters
-        #No need to type check channelsList, initSample, endSample, and frequencyResolutionStep as
+        #No need to type check channelsList, initSample, endSample, frequencyResolutionStep and rng as
         #these are passed to method addPhysiologicalNoise.
 
         self.addPhysiologicalNoise(channelsList, initSample, endSample, \
                                   frequencyMean=1.08, frequencySD=0.16, \
-                                  frequencyResolutionStep=0.01)  # From paper (Elwell et al., 1999)
+                                  frequencyResolutionStep=0.01, rng=rng)  # From paper (Elwell et al., 1999)
 
         return
     #end addHeartRateNoise(self, channelsList=list(), initSample=0, ... , frequencyResolutionStep = 0.01)
 
 
     def addBreathingRateNoise(self, channelsList=list(), initSample=0, endSample=-1, \
-                              frequencyResolutionStep = 0.01):
+                              frequencyResolutionStep = 0.01, rng=None):
         '''
         Adds noise of breathing rate to the data tensor.
         The generated noise is added to the class :attr:`data`.
@@ -1039,24 +1031,27 @@ class fNIRSSignalGenerator(channelLocationMap):
             within the interval of frequencies of the noise to be simulated.
             Optional. Default is 0.01.
         :type frequencyResolutionStep: float (positive)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
         :return: None
         :rtype: NoneType
         '''
 
         #Check parameters
-        #No need to type check channelsList, initSample, endSample, and frequencyResolutionStep as
+        #No need to type check channelsList, initSample, endSample, frequencyResolutionStep and rng as
         #these are passed to method addPhysiologicalNoise.
 
         self.addPhysiologicalNoise(channelsList, initSample, endSample, \
                                   frequencyMean=0.22, frequencySD=0.07, \
-                                  frequencyResolutionStep=0.01)  # From paper (Elwell et al., 1999)
+                                  frequencyResolutionStep=0.01, rng=rng)  # From paper (Elwell et al., 1999)
 
         return
     #end addBreathingRateNoise(self, channelsList=list(), initSample=0, ... , frequencyResolutionStep = 0.01)
 
 
     def addVasomotionNoise(self, channelsList=list(), initSample=0, endSample=-1, \
-                           frequencyResolutionStep = 0.01):
+                           frequencyResolutionStep = 0.01, rng=None):
         '''
         Adds noise of vasomotion to the data tensor.
         The generated noise is added to the class :attr:`data`.
@@ -1074,15 +1069,18 @@ class fNIRSSignalGenerator(channelLocationMap):
             within the interval of frequencies of the noise to be simulated.
             Optional. Default is 0.01.
         :type frequencyResolutionStep: float (positive)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
         :return: None
         :rtype: NoneType
         '''
 
         #Check parameters
-        #No need to type check channelsList, initSample, endSample, and frequencyResolutionStep as
+        #No need to type check channelsList, initSample, endSample, frequencyResolutionStep and rng as
         #these are passed to method addPhysiologicalNoise.
 
-        self.addPhysiologicalNoise(channelsList, initSample, endSample, frequencyMean=0.082, frequencySD=0.016, frequencyResolutionStep=0.01)  # From paper (Elwell et al., 1999)
+        self.addPhysiologicalNoise(channelsList, initSample, endSample, frequencyMean=0.082, frequencySD=0.016, frequencyResolutionStep=0.01, rng=rng)  # From paper (Elwell et al., 1999)
 
         return
     #end addVasomotionNoise(self, channelsList=list(), initSample=0, ... , frequencyResolutionStep = 0.01)
@@ -1120,42 +1118,60 @@ class fNIRSSignalGenerator(channelLocationMap):
         
         
     
-    def process_datums(self, dataMat, distsVec, ppf, dpf):
+    def process_datums(self, dataMat, distsVec, ppf, dpf, wavelengths=(830, 690)):
+        '''
+        Converts raw intensities to concentration changes with the modified
+        Beer-Lambert law; all channels in one batched product with the cached
+        pseudo-inverse of the probe (see :func:`mbll.modifiedBeerLambert`).
+        :Parameters:
+        :param dataMat: The raw intensities <nSamples x nChannels x nWavelengths>.
+        :type dataMat: numpy.ndarray
+        :param distsVec: Source-detector distance [cm] of each channel <nChannels>.
+        :type distsVec: numpy.ndarray
+        :param ppf, dpf: Unused; the differential pathlength factor is :data:`mbll.DEFAULT_DPF`.
+        :param wavelengths: The wavelengths [nm] along the last dimension of
+            dataMat. Default is (830, 690).
+        :type wavelengths: tuple, list or numpy.ndarray
+        :return: The [HbO2, HHb] concentration changes [µM] <nSamples x nChannels x 2>.
+        :rtype: numpy.ndarray
+        '''
+
         #https://mail.nmr.mgh.harvard.edu/pipermail//homer-users/2006-July/000124.html
-        numCols = dataMat.shape[1]
-        extinctionCoeffs = np.array([[830,974,693.04],[690,276,2051.96]]) #https://omlc.org/spectra/hemoglobin/summary.html
-        for n in range(numCols):
-            currColHBO = np.array([dataMat[:,n,0]])
-            currColHBB = np.array([dataMat[:,n,1]])
-            #print(currColHBO.shape)
-            #print(currColHBB.shape)
-            meanHBO = np.mean(currColHBO)
-            meanHBB = np.mean(currColHBB)
-            currColHBO /= meanHBO
-            currColHBB /= meanHBB
-            currColHBO = np.log(currColHBO)
-            currColHBB = np.log(currColHBB)
-            currColHBO *= -1
-            currColHBB *= -1
-            currColHBO *=  6.25*distsVec[n]
-            currColHBB *=  6.25*distsVec[n]
-            OptDensMatT = np.concatenate((currColHBO,currColHBB),axis=0)
-            #OptDensMatT = np.transpose(OptDensMat)
-            #print(OptDensMatT.shape)
-            Extinction = extinctionCoeffs[:,1:]
-            ExtinctionT = np.transpose(Extinction)
-            ExtinctionInv = np.matmul(np.matmul(ExtinctionT,Extinction),ExtinctionT)
-            #print(ExtinctionInv.shape)
-            HBO_HBR = np.matmul(ExtinctionInv,OptDensMatT)
-            dataMat[:,n,0] = HBO_HBR[0,:]
-            dataMat[:,n,1] = HBO_HBR[1,:]
-        
-        return dataMat
+        dataMat = np.asarray(dataMat, dtype=float)
+        means = np.mean(dataMat, axis=0)
+        # Non-positive intensities yield NaN/inf here; such segments are
+        # discarded later by the noise bank screening (see noiseBank.screenSegments)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            opticalDensity = -np.log(dataMat / means)
+            HBO_HBR = mbll.modifiedBeerLambert(opticalDensity, distsVec, wavelengths)
+
+        return HBO_HBR
+    #end process_datums(self, dataMat, distsVec, ppf, dpf, wavelengths=(830, 690))
             
             
             
     
-    def import_datums(self, distsVecList, nSamples=100):
+    def import_datums(self, distsVecList, nSamples=100, cacheFile=None, filterBand=None):
+        '''
+        Builds the experimental noise bank from the resting state SNIRF
+        recordings, and its index (see :meth:`indexExperimentalNoise`), so
+        that only segments passing the quality screening are drawn.
+        :Parameters:
+        :param distsVecList: The source-detector distances of the two datasets.
+        :type distsVecList: list
+        :param nSamples: Number of samples per segment. Default is 100.
+        :type nSamples: int
+        :param cacheFile: File (.npz) where the index of the bank is cached.
+            Optional. Default is None (no caching).
+        :type cacheFile: str or NoneType
+        :param filterBand: Band [Hz] of the zero-phase filter applied to every
+            converted recording before resampling, e.g. :data:`signalFilters.FNIRS_BAND`;
+            see :func:`signalFilters.filtfilt`. Optional. Default is None (not filtered).
+        :type filterBand: float, tuple or NoneType
+        :return: The noise bank <nSamples x nSegments x 2>.
+        :rtype: numpy.ndarray
+        '''
+
         #np.set_printoptions(threshold=sys.maxsize)
         #nSamples = 3000
         print('nSamples', nSamples)
@@ -1176,201 +1192,110 @@ class fNIRSSignalGenerator(channelLocationMap):
         dhalf2= int(dists2.shape[0]/2)
         dists2 = dists2[0:dhalf2,:]
         
-        D = np.empty((nSamples,1,2))
+        #Segments are collected and concatenated once at the end
+        D = [np.empty((nSamples,1,2))]
         Added_counter = 0
         print("Dataset 1")
         print(Added_counter)
         for e in listo1:
             e_s = str(e)
             #print('subject'+e_s)
-            dat=h5py.File('resting'+e_s+'.snirf','r')
-            d=np.array(dat.get('/nirs/data1/dataTimeSeries'));
-            #print(d.shape)
-            d = np.delete(d, shortchans1, 1)
-            
-            l=int(d.shape[1])
-            #print(d.shape)
-            lhalf = int((l/2))
-            #print(lhalf)
-            nS = d.shape[0]
-            #print(nS)
-            d1 = d[:,0:lhalf]
-            d2 = d[:,lhalf:]
-            
-            d = np.dstack((d2,d1))
-            d = self.process_datums(d,dists1,ppf=1,dpf=1)
-            newSampling = int(math.floor(50/self.samplingRate))
-            #print("NEW SAMPLING",newSampling)
-            #TODO roll-over sampling so rational floats can be accepted as newSampling values
-            da = d[0::newSampling,:,:]
-            db = d[1::newSampling,:,:]
-            dc = d[2::newSampling,:,:]
-            dd = d[3::newSampling,:,:]
-            de = d[4::newSampling,:,:]
-            #print(da)
-            #print(db)
-            #print(dc)
-            #print(dd)
-            #print(de)
-            al = da.shape[0]
-            bl = db.shape[0]
-            cl = dc.shape[0]
-            dl = dd.shape[0]
-            el = de.shape[0]
-            #print(al)
-            #print(bl)
-            #print(cl)
-            #print(dl)
-            #print(el)
-            seq = [al,bl,cl,dl,el]
-            things = [da,db,dc,dd,de]
-            for i in range(5):
-                ell = seq[i]
-                daz = things[i]
-                #print(ell)
-                if ell>nSamples:
-                    #print(ell, "enough samples")
-                    excess = ell - nSamples
-                    #print('excess',excess)
-                    daz = daz[0:-excess,:,:]
-                    #print('new array', daz.shape)
-                    D = np.concatenate((D,daz),axis=1)
-                    Added_counter += 1
-                    print(Added_counter)
-                    #print('D',D.shape)
-                elif ell<nSamples:
-                    continue
-                    #print(ell, "NOT enough samples")
-                else:
-                    D = np.concatenate((D,daz),axis=1)
-                    Added_counter += 1
-                    print(Added_counter)
-                    #print('D',D.shape)
+            #Streaming MBLL conversion; the raw recording is never fully loaded
+            with h5py.File('resting'+e_s+'.snirf','r') as dat:
+                d = mbll.convertMBLL(dat['/nirs/data1/dataTimeSeries'], dists1, shortchans1, \
+                                     wavelengths=np.array(dat['/nirs/probe/wavelengths']))
+            if filterBand is not None:
+                d = signalFilters.filtfilt(d, filterBand, SNIRF_SAMPLING_RATE, axis=0)
+            #Anti-aliased resampling; every phase offset is an augmentation
+            phases = resampling.phaseAugmentations(d, SNIRF_SAMPLING_RATE, self.samplingRate, axis=0)
+            Added_counter = _appendSegments(D, phases, nSamples, Added_counter)
         print("Dataset 2")
         for e in listo2:
         
             e_s = str(e)
             #print('subject'+e_s)
-            dat=h5py.File('resting'+e_s+'.snirf','r')
-            d=np.array(dat.get('/nirs/data1/dataTimeSeries'));
-            #print(d.shape)
-            d = np.delete(d, shortchans2, 1)
-            l=int(d.shape[1])
-            #print(d.shape)
-            lhalf = int((l/2))
-            #print(lhalf)
+            with h5py.File('resting'+e_s+'.snirf','r') as dat:
+                d = mbll.convertMBLL(dat['/nirs/data1/dataTimeSeries'], dists2, shortchans2, \
+                                     wavelengths=np.array(dat['/nirs/probe/wavelengths']))
+            if filterBand is not None:
+                d = signalFilters.filtfilt(d, filterBand, SNIRF_SAMPLING_RATE, axis=0)
             nS = d.shape[0]
-            #print(nS)
-            d1 = d[:,0:lhalf]
-            d2 = d[:,lhalf:]
-            d = np.dstack((d2,d1))
-            d = self.process_datums(d,dists2,ppf=1,dpf=1)
-            newSampling = int(math.floor(50/self.samplingRate))
-            #print("NEW SAMPLING",newSampling)
-            #TODO roll-over sampling so rational floats can be accepted as newSampling values
             if nS < 30000:
-                d = d[0:15000,:,:]
-                da = d[0::newSampling,:,:]
-                db = d[1::newSampling,:,:]
-                dc = d[2::newSampling,:,:]
-                dd = d[3::newSampling,:,:]
-                de = d[4::newSampling,:,:]
-                #print(da)
-                #print(db)
-                #print(dc)
-                #print(dd)
-                #print(de)
-                al = da.shape[0]
-                bl = db.shape[0]
-                cl = dc.shape[0]
-                dl = dd.shape[0]
-                el = de.shape[0]
-                #print(al)
-                #print(bl)
-                #print(cl)
-                #print(dl)
-                #print(el)
-                seq = [al,bl,cl,dl,el]
-                things = [da,db,dc,dd,de]
-                for i in range(5):
-                    ell = seq[i]
-                    daz = things[i]
-                    #print(ell)
-                    if ell>nSamples:
-                        #print(ell, "enough samples")
-                        excess = ell - nSamples
-                        #print('excess',excess)
-                        daz = daz[0:-excess,:,:]
-                        #print('new array', daz.shape)
-                        D = np.concatenate((D,daz),axis=1)
-                        Added_counter += 1
-                        print(Added_counter)
-                        #print('D',D.shape)
-                    elif ell<nSamples:
-                        continue
-                        #print(ell, "NOT enough samples")
-                    else:
-                        D = np.concatenate((D,daz),axis=1)
-                        Added_counter += 1
-                        print(Added_counter)
-                        #print('D',D.shape)
+                G = [d[0:15000,:,:]]
             else:
-                g1 = d[0:15000,:,:]
-                g2 = d[15000:30000,:,:]
-                G = [g1,g2]
-                for j in G:
-                    ja = j[0::newSampling,:,:]
-                    jb = j[1::newSampling,:,:]
-                    jc = j[2::newSampling,:,:]
-                    jd = j[3::newSampling,:,:]
-                    je = j[4::newSampling,:,:]
-                    #print(da)
-                    #print(db)
-                    #print(dc)
-                    #print(dd)
-                    #print(de)
-                    al = ja.shape[0]
-                    bl = jb.shape[0]
-                    cl = jc.shape[0]
-                    dl = jd.shape[0]
-                    el = je.shape[0]
-                    #print(al)
-                    #print(bl)
-                    #print(cl)
-                    #print(dl)
-                    #print(el)
-                    seq = [al,bl,cl,dl,el]
-                    things = [ja,jb,jc,jd,je]
-                    for i in range(5):
-                        ell = seq[i]
-                        daz = things[i]
-                        #print(ell)
-                        if ell>nSamples:
-                            #print(ell, "enough samples")
-                            excess = ell - nSamples
-                            #print('excess',excess)
-                            daz = daz[0:-excess,:,:]
-                            #print('new array', daz.shape)
-                            D = np.concatenate((D,daz),axis=1)
-                            Added_counter += 1
-                            print(Added_counter)
-                            #print('D',D.shape)
-                        elif ell<nSamples:
-                            continue
-                            #print(ell, "NOT enough samples")
-                        else:
-                            D = np.concatenate((D,daz),axis=1)
-                            Added_counter += 1
-                            print(Added_counter)
-                            #print('D',D.shape)
+                G = [d[0:15000,:,:], d[15000:30000,:,:]]
+            for j in G:
+                phases = resampling.phaseAugmentations(j, SNIRF_SAMPLING_RATE, self.samplingRate, axis=0)
+                Added_counter = _appendSegments(D, phases, nSamples, Added_counter)
 
+        D = np.concatenate(D,axis=1)
         print('D',D.shape)
+        #The screening decision is kept with the bank
+        self.indexExperimentalNoise(D, cacheFile=cacheFile)
         return D
     #end import_datums
         
         
-    def addExperimentalNoise(self, imported_data, channelsList=list(),  initSample=0, endSample=-1, noise_ratio=1):
-        
+    def indexExperimentalNoise(self, imported_data, cacheFile=None):
+        '''
+        Builds (or loads) the feature index over an experimental noise bank.
+        The index also holds the quality screening of the segments.
+        The index is kept by the generator and used by :meth:`addExperimentalNoise`
+        to sample valid segments, optionally matching a target noise profile.
+        :Parameters:
+        :param imported_data: The noise bank as returned by :meth:`import_datums`.
+        :type imported_data: numpy.ndarray
+        :param cacheFile: File (.npz) where the index is cached next to the bank.
+            If the file exists and was built for the same bank, it is loaded
+            rather than rebuilt. Optional. Default is None (no caching).
+        :type cacheFile: str or NoneType
+        :return: The index.
+        :rtype: noiseBankIndex
+        '''
+
+        #Check parameters
+        if type(imported_data) is not np.ndarray or imported_data.ndim != 3:
+            msg = self.getClassName() + ':indexExperimentalNoise: Unexpected parameter type for parameter ''imported_data''.'
+            raise ValueError(msg)
+
+        self.__noiseIndex = noiseBankIndex.fromBank(imported_data, self.samplingRate, cacheFile=cacheFile)
+
+        return self.__noiseIndex
+    #end indexExperimentalNoise(self, imported_data, cacheFile=None)
+
+
+    def addExperimentalNoise(self, imported_data, channelsList=list(),  initSample=0, endSample=-1, noise_ratio=1, \
+                             targetProfile=None, rng=None):
+        '''
+        Adds experimental noise to the data tensor.
+        One segment of the noise bank is picked per channel, among the
+        segments that passed the quality screening of the bank index (see
+        :meth:`indexExperimentalNoise`; a bank not indexed yet is indexed on
+        first use). If a targetProfile is given,
+        segments are picked among the nearest ones to the profile in the
+        index built by :meth:`indexExperimentalNoise`.
+        :Parameters:
+        :param imported_data: The noise bank as returned by :meth:`import_datums`.
+        :type imported_data: numpy.ndarray
+        :param channelsList: List of channels affected. Default is the empty list.
+        :type channelsList: list
+        :param initSample: Initial temporal sample. Default is 0.
+        :type initSample: int (positive)
+        :param endSample: Last temporal sample. Default is -1.
+        :type endSample: int (positive or -1)
+        :param noise_ratio: Scaling factor of the added noise. Default is 1.
+        :type noise_ratio: float
+        :param targetProfile: Target noise profile; a dict mapping feature names
+            of :class:`noiseBankIndex` (e.g. 'cardiac', 'drift') to target values.
+            Optional. Default is None (uniform sampling among the valid segments).
+        :type targetProfile: dict or NoneType
+        :param rng: Random generator or seed. See module :mod:`rngStreams`.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :return: None
+        :rtype: NoneType
+        '''
+
         channelsList = list(set(channelsList))  # Unique and sort elements
         nChannels = len(channelsList)
         
@@ -1387,42 +1312,48 @@ class fNIRSSignalGenerator(channelLocationMap):
             print('incorrectly sampled data')
             return
         
-        m = imported_data.shape[1]
-        sampled = np.random.randint(m, size = nChannels)
-        #print(sampled)
-        
-        Noise_tensor = np.empty((nSamples,nChannels,2))
-        scaledNoise_tensor = np.empty((nSamples,nChannels,2))
-        
-        for i in range(nChannels):
-            Noise_tensor[:,i,:] = imported_data[:,sampled[i],:]
-            
-        #scaledNoise_tensor[:,:,0] = preprocessing.scale(Noise_tensor[:,:,0])
-        #scaledNoise_tensor[:,:,1] = preprocessing.scale(Noise_tensor[:,:,1])
-#         print("Noise_tensor")
-#         print(Noise_tensor[1:5,:,1])
-        
-#         print("Small_Noise_tensor")
-#         new_noise = noise_ratio*Noise_tensor
-#         print(new_noise[1:5,:,1])
-        
-        self.__data[0:nSamples,channelsList,:] = self.__data[0:nSamples,channelsList,:] + noise_ratio*Noise_tensor
-        
+        if self.__noiseIndex is None or not self.__noiseIndex.matches(imported_data):
+            self.indexExperimentalNoise(imported_data)
+        noiseIndex = self.__noiseIndex
+
+        Noise_tensor = fNIRSSynthesis.experimentalNoise(imported_data, nChannels, rng=rng, \
+                                                        noiseIndex=noiseIndex, targetProfile=targetProfile)
+
+        np.multiply(Noise_tensor, noise_ratio, out=Noise_tensor)
+        fNIRSSynthesis.accumulate(self.__data, Noise_tensor, channelsList, initSample)
+
     #end addExperimentalNoise
 
 
-    def execute(self, imported_datas=np.empty((3000,4,2)), Exertion = 0, boxVar=0, chanVar=0, type3 = 0, indv = 0, session = 0, Breath=0, Vaso=0, Heart=0, Gauss=0, Experi=0, Plot=0):
+    def execute(self, imported_datas=np.empty((3000,4,2)), Exertion = 0, boxVar=0, chanVar=0, type3 = 0, indv = 0, session = 0, Breath=0, Vaso=0, Heart=0, Gauss=0, Experi=0, Plot=0, noiseProfile=None, rng=None, eventOnsets=None, eventAmp=None):
         '''
         Generates the synthetic fNIRS data from the properties
         information.
-        This method calls :meth:`generateStimulusResult` for generating
-        the new synthetic data.
+        This method draws the block and channel amplitudes and builds a
+        :class:`fNIRSSynthesis.fNIRSConfig`; the data is generated by the
+        compiled (and cached) :class:`fNIRSSynthesis.fNIRSPlan`.
+        :param noiseProfile: Target profile for the experimental noise segments.
+            See :meth:`addExperimentalNoise`. Optional. Default is None (uniform sampling among the valid segments).
+        :type noiseProfile: dict or NoneType
+        :param rng: Random generator or seed. One independent child stream is
+            derived per amplitude and noise source (see :data:`rngStreams.FNIRS_SOURCES`),
+            so each source is reproducible regardless of which other sources are enabled.
+            Optional. Default is None (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :param eventOnsets: Onsets [s] of brief events added to the block design
+            (see :meth:`addEventResponse`). Optional. Default is None (no events).
+        :type eventOnsets: list, numpy.ndarray or NoneType
+        :param eventAmp: Event amplitudes. Optional. Default is None (all 1).
+        :type eventAmp: list, numpy.ndarray or NoneType
         :return: A 3D data tensor
         :rtype: np.ndarray
         '''
 
         channelsList = list(range(0, self.nChannels))
 
+        root = seedSequence(rng)
+        streams = sourceGenerators(root)
+
         enableHbO2Channels = np.ones(self.nChannels, dtype=int) # every channel enabled to simulate  Oxy
 
         enableHHbChannels = np.ones(self.nChannels, dtype=int) # every channel enabled to simulate  Deoxy 
@@ -1448,7 +1379,7 @@ class fNIRSSignalGenerator(channelLocationMap):
         if type3 == 0:
             if Exertion == 2:
                 if boxVar == 1:
-                    bx1 = np.random.normal(1,0.3, 4)
+                    bx1 = streams['boxcar'].normal(1,0.3, 4)
                     bx1[bx1<0]=0
                     bx1=bx1.tolist()
                     boxcar_amp = bx1
@@ -1456,7 +1387,7 @@ class fNIRSSignalGenerator(channelLocationMap):
                     boxcar_amp = [1]
             elif Exertion == 1:
                 if boxVar == 1:
-                    bx2 = np.random.normal(0.5,0.1, 4)
+                    bx2 = streams['boxcar'].normal(0.5,0.1, 4)
                     bx2[bx2<0]=0
                     bx2=bx2.tolist()
                     boxcar_amp = bx2
@@ -1468,7 +1399,7 @@ class fNIRSSignalGenerator(channelLocationMap):
         
         
             if chanVar == 1:
-                ch1 = np.random.normal(1,0.1, 4)
+                ch1 = streams['channel'].normal(1,0.1, 4)
                 ch1[ch1<0]=0
                 ch1=ch1.tolist()
                 channel_amp = ch1
@@ -1486,14 +1417,14 @@ class fNIRSSignalGenerator(channelLocationMap):
             Round_scores = Scores[:,session]
             Ind_scr = Round_scores[indv]
 
-            a = np.random.normal(0,0.06)
-            b = np.random.normal(0.1,0.06)
-            c = np.random.normal(0.2,0.06)
-            d = np.random.normal(0.3,0.06)
+            a = streams['boxcar'].normal(0,0.06)
+            b = streams['boxcar'].normal(0.1,0.06)
+            c = streams['boxcar'].normal(0.2,0.06)
+            d = streams['boxcar'].normal(0.3,0.06)
             A = np.array([a,b,c,d])
             #print(A.shape)
 
-            e = np.random.normal(Ind_scr/10, 0.06)
+            e = streams['channel'].normal(Ind_scr/10, 0.06)
             E = np.array([e, -e, -e, e])
             #print(E.shape)
             if indv<= 9:
@@ -1507,95 +1438,35 @@ class fNIRSSignalGenerator(channelLocationMap):
                 ch = np.add(experts_dists_chan,E)
                 channel_amp = ch.tolist()
         
-        resetData = np.zeros((3000,4,2))
-        
-        self.data = resetData
-        
-        #if isHRF==0:
-        self.addStimulusResult(channelsList, boxCarList,
-                               initSample=0, endSample=-1,
-                               tau_p=6, tau_d=10,
-                               amplitudeScalingFactor=6,
-                               enableHbO2Channels=enableHbO2Channels,
-                               enableHHbChannels=enableHHbChannels,
-                               enableHbO2Blocks=enableHbO2Blocks,
-                               enableHHbBlocks=enableHHbBlocks, boxcar_amp = boxcar_amp, channel_amp=channel_amp)
-                               
-
-        # elif isHRF==1:
-            # Breath=0 
-            # Vaso=0 
-            # Heart=0 
-            # Gauss=0 
-            # Experi=0 
-            # Plot=0 
-            # boxcar_amp = [0,0,0,0] 
-            # channel_amp = [0,0,0,0]
-            # baselin = np.zeros((350,1))
-            # if Exertion == 0:
-                # timestam = np.arange(0,35,0.1,dtype = float)
-                # HRF1 = self.double_gamma_function(timestam, tau_p=6, tau_d=10, amplitudeScalingFactor=6)
-                # HRF1 = np.transpose([HRF1])
-                # HRF1 = HRF1*0
-                # HRF1 = np.concatenate((baselin,HRF1))
-                # HRF2 = -1/3*HRF1
-                # oneChannel= np.dstack((HRF1,HRF2))
-                # self.data = np.concatenate((oneChannel,oneChannel,oneChannel,oneChannel),axis=1)
-            # elif Exertion == 1:
-                # timestam = np.arange(0,35,0.1,dtype = float)
-                # HRF1 = self.double_gamma_function(timestam, tau_p=6, tau_d=10, amplitudeScalingFactor=6)
-                # HRF1 = np.transpose([HRF1])
-                # HRF1 = HRF1*1/2
-                # HRF1 = np.concatenate((baselin,HRF1))
-                # HRF2 = -1/3*HRF1
-                # oneChannel= np.dstack((HRF1,HRF2))
-                # self.data = np.concatenate((oneChannel,oneChannel,oneChannel,oneChannel),axis=1)
-            # elif Exertion == 2:
-                # timestam = np.arange(0,35,0.1,dtype = float)
-                # HRF1 = self.double_gamma_function(timestam, tau_p=6, tau_d=10, amplitudeScalingFactor=6)
-                # HRF1 = np.transpose([HRF1])
-                # HRF1 = np.concatenate((baselin,HRF1))
-                # HRF2 = -1/3*HRF1
-                # oneChannel= np.dstack((HRF1,HRF2))
-                # self.data = np.concatenate((oneChannel,oneChannel,oneChannel,oneChannel),axis=1)
-            
-
-        #plotSyntheticfNIRS(self.data, title='Synthetic fNIRS', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
-        
-        #if isHRF:
-            # block2 = self.data[915:1665,:,:]
-            # self.data = np.concatenate((block2,block2,block2,block2),axis=0)
-            
-        
-        if Breath == 1:
-
-            self.addBreathingRateNoise(channelsList, initSample=0, endSample=-1, frequencyResolutionStep = 0.01)
-        
-
-        #plotSyntheticfNIRS(self.data, title='Synthetic fNIRS + Breathing rate noise', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
-        
-        if Heart == 1:
-
-            self.addHeartRateNoise(channelsList, initSample=0, endSample=-1, frequencyResolutionStep = 0.01)
-
-        #plotSyntheticfNIRS(self.data, title='Synthetic fNIRS + Noises: Breathing rate and Heart rate', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
-        
-        if Vaso == 1:
-
-            self.addVasomotionNoise(channelsList, initSample=0, endSample=-1, frequencyResolutionStep = 0.01)
-
-        #plotSyntheticfNIRS(self.data, title='Synthetic fNIRS + Noises: Vasomotion', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
-        
-        if Gauss ==1:
-
-            self.addGaussianNoise(channelsList, initSample=0, endSample=-1)
+        experimental = Experi == 1
+        if experimental and imported_datas.shape[0] != 3000:
+            print('incorrectly sampled data')
+            experimental = False
+
+        #The plan is compiled once per set of enabled sources and then reused;
+        #the block and channel amplitudes are passed at run time.
+        config = fNIRSConfig(nSamples=3000, nChannels=4, samplingRate=self.samplingRate,
+                             channelsList=channelsList, initSample=0, endSample=-1,
+                             boxCarList=boxCarList, eventOnsets=() if eventOnsets is None else eventOnsets,
+                             enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels,
+                             enableHbO2Blocks=enableHbO2Blocks, enableHHbBlocks=enableHHbBlocks,
+                             tau_p=6, tau_d=10, amplitudeScalingFactor=6.0,
+                             breathing=Breath == 1, heart=Heart == 1, vasomotion=Vaso == 1,
+                             gaussian=Gauss == 1, experimental=experimental,
+                             frequencyResolutionStep=0.01, noiseRatio=3.0)
+        plan = fNIRSSynthesis.compile(config)
+
+        noiseIndex = None
+        if experimental:
+            #Only screened segments are drawn; a bank not indexed yet is indexed once
+            if self.__noiseIndex is None or not self.__noiseIndex.matches(imported_datas):
+                self.indexExperimentalNoise(imported_datas)
+            noiseIndex = self.__noiseIndex
+
+        #The generation itself is stateless; see fNIRSSynthesis.fNIRSPlan
+        self.data = plan.run(root, boxcarAmp=boxcar_amp, channelAmp=channel_amp, imported_data=imported_datas, \
+                             noiseIndex=noiseIndex, targetProfile=noiseProfile, eventAmp=eventAmp)
 
-        #plotSyntheticfNIRS(self.data, title='Synthetic fNIRS + Gaussian Noise', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
-        
-        if Experi ==1:
-        
-            self.addExperimentalNoise(imported_datas, channelsList, initSample=0, endSample=-1, noise_ratio=3)
-            
         if Plot ==1:
             if Experi==1:
                 plotSyntheticfNIRS(self.data, title='SemiSynthetic fNIRS', enableHbO2Channels=enableHbO2Channels, enableHHbChannels=enableHHbChannels)
@@ -1613,10 +1484,169 @@ class fNIRSSignalGenerator(channelLocationMap):
     #end execute(self)
 
 
+    def fitGLM(self, boxCarList=list(), data=None, eventOnsets=(), driftOrder=0, \
+               tau_p=6, tau_d=10, amplitudeScalingFactor=6):
+        '''
+        Fits a GLM with the known paradigm to validate generated data.
+        The design matrix is built and factorized once per paradigm and
+        shared (see :func:`fNIRSGLM.glmFor`), and all channels, both
+        chromophores and all subjects are solved at once.
+        :Parameters:
+        :param boxCarList: List of tuples (xi, yi) [s] of the blocks. Default is the empty list.
+        :type boxCarList: list
+        :param data: The data <nSamples x nChannels x 2>, or a stack of subjects
+            <nSubjects x nSamples x nChannels x 2>. Optional. Default is None (:attr:`data`).
+        :type data: numpy.ndarray or NoneType
+        :param eventOnsets: Onsets [s] of brief events. Default is () (no events).
+        :type eventOnsets: tuple, list or numpy.ndarray
+        :param driftOrder: Order of the polynomial drift regressors. Default is 0 (intercept).
+        :type driftOrder: int
+        :param tau_p, tau_d, amplitudeScalingFactor: HRF parameters. See :meth:`addStimulusResult`.
+        :return: The betas, t-values and recovered boxcar_amp and channel_amp.
+        :rtype: fNIRSGLM.glmResult
+        '''
+
+        #Check parameters
+        if type(boxCarList) is not list:
+            msg = self.getClassName() + ':fitGLM: Unexpected parameter type for parameter ''boxCarList''.'
+            raise ValueError(msg)
+        if data is None:
+            data = self.data
+
+        glm = fNIRSGLM.glmFor(boxCarList, np.shape(data)[-3], self.samplingRate, \
+                              tau_p=tau_p, tau_d=tau_d, amplitudeScalingFactor=amplitudeScalingFactor, \
+                              eventOnsets=eventOnsets, driftOrder=driftOrder)
+
+        return glm.fit(data)
+    #end fitGLM(self, boxCarList=list(), data=None, ...)
+
+
+    def rawIntensities(self, data=None, wavelengths=(760, 850), baseline=1.0, \
+                       lengthScale=1.0, dpf=mbll.DEFAULT_DPF, opticalDensity=False):
+        '''
+        Converts concentration changes to raw light intensities per
+        wavelength, as found in SNIRF dataTimeSeries, with the inverse
+        modified Beer-Lambert law. The source-detector distances are taken
+        from :attr:`pairings` and :attr:`optodesLocations`; all channels and
+        subjects are converted in one batched product (see
+        :func:`mbll.inverseModifiedBeerLambert`).
+        :Parameters:
+        :param data: The [HbO2, HHb] concentration changes [µM] <nSamples x nChannels x 2>,
+            or a stack of subjects <nSubjects x nSamples x nChannels x 2>.
+            Optional. Default is None (:attr:`data`).
+        :type data: numpy.ndarray or NoneType
+        :param wavelengths: The wavelengths [nm]. Default is (760, 850).
+        :type wavelengths: tuple, list or numpy.ndarray
+        :param baseline: Mean intensity; a scalar or an array <nChannels x nWavelengths>. Default is 1.
+        :type baseline: float or numpy.ndarray
+        :param lengthScale: Centimeters per unit of :attr:`optodesLocations`. Default is 1.
+        :type lengthScale: float (positive)
+        :param dpf: The differential pathlength factor. Default is :data:`mbll.DEFAULT_DPF`.
+        :type dpf: float (positive)
+        :param opticalDensity: Return the optical densities rather than the intensities. Default is False.
+        :type opticalDensity: bool
+        :return: The intensities (or optical densities) <... x nSamples x nChannels x nWavelengths>.
+        :rtype: numpy.ndarray
+        '''
+
+        #Check parameters
+        if lengthScale <= 0:
+            msg = self.getClassName() + ':rawIntensities: Unexpected parameter value for parameter ''lengthScale''.'
+            raise ValueError(msg)
+        if data is None:
+            data = self.data
+        data = np.asarray(data, dtype=float)
+        if data.ndim < 3 or data.shape[-2] != self.nChannels or data.shape[-1] != 2:
+            msg = self.getClassName() + ':rawIntensities: Unexpected parameter value for parameter ''data''.'
+            raise ValueError(msg)
+
+        distances = lengthScale * mbll.channelDistances(self.pairings, self.optodesLocations)
+        od = mbll.inverseModifiedBeerLambert(data, distances, wavelengths, dpf)
+        if opticalDensity:
+            return od
+
+        return mbll.opticalDensityToIntensity(od, baseline, out=od)
+    #end rawIntensities(self, data=None, wavelengths=(760, 850), ...)
+
+
+    def filterData(self, band=signalFilters.FNIRS_BAND, order=4, btype=None):
+        '''
+        Zero-phase filters the data tensor along time, all channels and
+        both chromophores at once. See :func:`signalFilters.filtfilt`.
+        :Parameters:
+        :param band: Cut-off frequency [Hz], or (low, high) for a band.
+            Default is :data:`signalFilters.FNIRS_BAND`.
+        :type band: float or tuple
+        :param order: The filter order. Default is 4.
+        :type order: int (positive)
+        :param btype: The filter type. Optional. See :func:`signalFilters.designFilter`.
+        :type btype: str or NoneType
+        :return: The filtered data tensor (also stored in :attr:`data`).
+        :rtype: numpy.ndarray
+        '''
+
+        self.data = signalFilters.filtfilt(self.data, band, self.samplingRate, order=order, btype=btype)
+
+        return self.data
+    #end filterData(self, band=signalFilters.FNIRS_BAND, order=4, btype=None)
+
+
+    def streamChunks(self, chunkSize=10, nRecordings=None, rng=None, **kwargs):
+        '''
+        Generates synthetic fNIRS data in streaming mode; back to back
+        recordings, each synthesized by :meth:`execute` from a fresh child
+        stream of rng, and yielded in chunks of chunkSize samples.
+        :Parameters:
+        :param chunkSize: Number of samples per chunk; the last chunk of a
+            recording may be shorter. Default is 10.
+        :type chunkSize: int (positive)
+        :param nRecordings: Number of recordings. Optional. Default is None (endless).
+        :type nRecordings: int or NoneType
+        :param rng: Random generator or seed. Optional. Default is None
+            (fresh unpredictable stream).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :param kwargs: Other parameters of :meth:`execute`.
+        :return: An iterator of chunks <chunkSize x nChannels x 2>.
+        :rtype: generator
+        '''
+
+        #Check parameters
+        if type(chunkSize) is not int or chunkSize <= 0:
+            msg = self.getClassName() + ':streamChunks: Unexpected parameter value for parameter ''chunkSize''.'
+            raise ValueError(msg)
+
+        seeds = seedSequence(rng)
+        nDone = 0
+        while nRecordings is None or nDone < nRecordings:
+            recording = self.execute(rng=seeds.spawn(1)[0], **kwargs)[0]
+            for start in range(0, recording.shape[0], chunkSize):
+                yield recording[start:start + chunkSize]
+            nDone += 1
+    #end streamChunks(self, chunkSize=10, nRecordings=None, rng=None, **kwargs)
+
+
 
 #class fNIRSSignalGenerator
 
 
+def _appendSegments(segments, phases, nSamples, counter):
+    '''
+    Appends the phases <nPhases x temporal x segment x signal> long enough
+    for nSamples samples, trimmed to nSamples, to the list of segments.
+    Returns the updated count of added phases (the progress of the import).
+    '''
+
+    for daz in phases:
+        ell = daz.shape[0]
+        if ell < nSamples:
+            continue
+        segments.append(daz[0:nSamples,:,:])
+        counter += 1
+
+    return counter
+#end _appendSegments(segments, phases, nSamples, counter)
+
+
 def plotSyntheticfNIRS(tensor, title='', enableHbO2Channels=np.ones(1, dtype=int), enableHHbChannels=np.ones(1, dtype=int)):
     '''
     Quick rendering of the synthetic fNIRS data tensor.
@@ -1744,11 +1774,20 @@ def dataloading():
 #end dataloading()
 
 
-def score_dists(Scores=np.empty([20,2])):
+def score_dists(Scores=np.empty([20,2]), rng=None):
+    '''
+    Draws the boxcar and channel amplitude vectors of the type3 expert/novice
+    model for every individual and session of the score table.
+    Each (session, individual) cell draws from its own stream derived from rng
+    (see :func:`rngStreams.cellSeedSequence`), so any cell can be regenerated
+    in isolation. For score tables of any size, see :mod:`fNIRSCohort`.
+    '''
+    root = seedSequence(rng)
     Round1 = np.empty([40,4])
     Round2 = np.empty([40,4])
     for j in range(2):
         for i in range(20):
+            cellRng = np.random.default_rng(cellSeedSequence(root, j, i))
             experts_dists_box = np.array([[1,1,1,1]])
             experts_dists_chan = np.array([[1,0.5,0.5,1]])
             novices_dists_box = np.array([[1,1,1,1]])
@@ -1758,14 +1797,14 @@ def score_dists(Scores=np.empty([20,2])):
             Round_scores = Scores[:,j]
             Ind_scr = Round_scores[i]
 
-            a = np.random.normal(0,0.06)
-            b = np.random.normal(0.1,0.06)
-            c = np.random.normal(0.2,0.06)
-            d = np.random.normal(0.3,0.06)
+            a = cellRng.normal(0,0.06)
+            b = cellRng.normal(0.1,0.06)
+            c = cellRng.normal(0.2,0.06)
+            d = cellRng.normal(0.3,0.06)
             A = np.array([[a,b,c,d]])
             #print(A.shape)
 
-            e = np.random.normal(Ind_scr/10, 0.06)
+            e = cellRng.normal(Ind_scr/10, 0.06)
             E = np.array([[e, -e, -e, e]])
             #print(E.shape)
             if i<= 9:
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+#
+#File: mbll.py
+#
+'''
+Module ***mbll***
+
+Modified Beer-Lambert law (MBLL) conversion of raw SNIRF intensities, for
+any number of wavelengths, and out-of-core for large recordings.
+
+For a channel of source-detector distance d measured at N wavelengths,
+
+* OD = -log(I / mean(I)) (per wavelength)
+* [HbO2, HHb] = pinv(E) @ OD / (DPF * d)
+
+where E <N x 2> are the molar extinction coefficients at the wavelengths,
+interpolated from an internal table (:data:`EXTINCTION_TABLE`), and DPF
+is the differential pathlength factor (6.25 as in
+:meth:`fNIRSSignalGenerator.process_datums`). The concentration changes are
+in µM for distances in cm. The pseudo-inverse and the path scaling are
+computed once per probe (wavelengths and distances) and cached; all the
+channels are then converted with a single batched product
+(:func:`modifiedBeerLambert`). The inverse (:func:`inverseModifiedBeerLambert`
+and :func:`opticalDensityToIntensity`) synthesizes raw intensities from
+generated concentration changes.
+
+Recordings (/nirs/data1/dataTimeSeries, <nSamples x nMeasurements>) are
+converted without loading them (:func:`convertMBLL`): the h5py dataset is
+read in chunks of rows, twice. The first pass accumulates the mean
+intensity of every measurement (:func:`channelMeans`); the second writes
+the optical density and the hemoglobin concentrations of each chunk into
+preallocated, possibly memory-mapped, outputs. Short channels are dropped
+by index selection of the chunk columns, so memory use is bounded by the
+chunk size, not by the length of the recording.
+'''
+
+from functools import lru_cache
+
+import numpy as np
+
+
+DEFAULT_CHUNK_SIZE = 8192 # [samples]
+DEFAULT_DPF = 6.25
+
+# Wavelength [nm], HbO2 and HHb molar extinction [cm-1/M]
+# https://omlc.org/spectra/hemoglobin/summary.html
+EXTINCTION_TABLE = np.array([
+    [650, 368, 3750.12], [660, 319.6, 3226.56], [670, 294, 2795.12],
+    [680, 277.6, 2407.92], [690, 276, 2051.96], [700, 290, 1794.28],
+    [710, 314, 1540.48], [720, 348, 1325.88], [730, 390, 1102.2],
+    [740, 446, 1115.88], [750, 518, 1405.24], [760, 586, 1548.52],
+    [770, 650, 1311.88], [780, 710, 1075.44], [790, 756, 890.8],
+    [800, 816, 761.72], [810, 864, 717.08], [820, 916, 693.76],
+    [830, 974, 693.04], [840, 1022, 692.36], [850, 1058, 691.32],
+    [860, 1092, 694.32], [870, 1128, 705.84], [880, 1154, 726.44],
+    [890, 1178, 743.6], [900, 1198, 761.84], [910, 1214, 774.56],
+    [920, 1224, 777.36], [930, 1222, 763.84], [940, 1214, 693.44],
+    [950, 1204, 602.24]])
+EXTINCTION_TABLE.flags.writeable = False
+
+# Wavelengths [nm] of the two halves of the measurements in import_datums
+LEGACY_WAVELENGTHS = (690, 830)
+
+
+def extinctionCoefficients(wavelengths):
+    '''
+    Gets the molar extinction coefficients of HbO2 and HHb, linearly
+    interpolated from :data:`EXTINCTION_TABLE`.
+
+    :param wavelengths: The wavelengths [nm] (650 to 950).
+    :type wavelengths: list, tuple or numpy.ndarray
+    :return: The coefficients [cm-1/M] <nWavelengths x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    wavelengths = np.asarray(wavelengths, dtype=float).ravel()
+    if wavelengths.size == 0 or np.any(wavelengths < EXTINCTION_TABLE[0, 0]) or \
+            np.any(wavelengths > EXTINCTION_TABLE[-1, 0]):
+        msg = 'extinctionCoefficients: Unexpected parameter value for parameter ''wavelengths''. Expected 650 to 950 nm.'
+        raise ValueError(msg)
+
+    return np.column_stack([np.interp(wavelengths, EXTINCTION_TABLE[:, 0], EXTINCTION_TABLE[:, k]) for k in (1, 2)])
+#end extinctionCoefficients(wavelengths)
+
+
+@lru_cache(maxsize=16)
+def _pinvExtinction(wavelengths):
+    E = extinctionCoefficients(wavelengths)
+    if np.linalg.matrix_rank(E) < 2:
+        msg = 'conversionMatrix: Unexpected parameter value for parameter ''wavelengths''. At least 2 distinct wavelengths are required.'
+        raise ValueError(msg)
+    pinvE = np.linalg.pinv(E) * 1e6 # [M] to [µM]
+    pinvE.flags.writeable = False
+    return pinvE
+#end _pinvExtinction(wavelengths)
+
+
+def conversionMatrix(wavelengths):
+    '''
+    Gets the (cached, read only) pseudo-inverse (E'E)^-1 E' of the
+    extinction coefficients of the wavelengths, in µM.
+
+    :param wavelengths: The wavelengths [nm].
+    :type wavelengths: list, tuple or numpy.ndarray
+    :return: The conversion matrix <2 x nWavelengths>.
+    :rtype: numpy.ndarray
+    '''
+
+    return _pinvExtinction(tuple(np.asarray(wavelengths, dtype=float).ravel().tolist()))
+#end conversionMatrix(wavelengths)
+
+
+@lru_cache(maxsize=16)
+def _probeConversion(wavelengths, distances, dpf):
+    inversePath = 1.0 / (dpf * np.array(distances))
+    inversePath.flags.writeable = False
+    return _pinvExtinction(wavelengths), inversePath
+#end _probeConversion(wavelengths, distances, dpf)
+
+
+def probeConversion(wavelengths, distances, dpf=DEFAULT_DPF):
+    '''
+    Gets the (cached, read only) conversion of a probe; the pseudo-inverse
+    of the extinction coefficients and the inverse path length of each
+    channel.
+
+    :param wavelengths: The wavelengths [nm].
+    :type wavelengths: list, tuple or numpy.ndarray
+    :param distances: Source-detector distance [cm] of each channel <nChannels>.
+    :type distances: numpy.ndarray
+    :param dpf: The differential pathlength factor. Default is :data:`DEFAULT_DPF`.
+    :type dpf: float (positive)
+    :return: The conversion matrix <2 x nWavelengths> and the inverse path
+        lengths <nChannels>.
+    :rtype: tuple
+    '''
+
+    distances = np.asarray(distances, dtype=float).ravel()
+    if dpf <= 0 or np.any(distances <= 0):
+        msg = 'probeConversion: Unexpected parameter value for parameters ''distances'' or ''dpf''.'
+        raise ValueError(msg)
+
+    return _probeConversion(tuple(np.asarray(wavelengths, dtype=float).ravel().tolist()), \
+                            tuple(distances.tolist()), float(dpf))
+#end probeConversion(wavelengths, distances, dpf=DEFAULT_DPF)
+
+
+def modifiedBeerLambert(opticalDensity, distances, wavelengths, dpf=DEFAULT_DPF, out=None):
+    '''
+    Converts optical densities to concentration changes; all channels and
+    samples in one batched product.
+
+    :param opticalDensity: The optical densities <... x nChannels x nWavelengths>.
+    :type opticalDensity: numpy.ndarray
+    :param distances: Source-detector distance [cm] of each channel <nChannels>.
+    :type distances: numpy.ndarray
+    :param wavelengths: The wavelengths [nm] <nWavelengths>.
+    :type wavelengths: list, tuple or numpy.ndarray
+    :param dpf: The differential pathlength factor. Default is :data:`DEFAULT_DPF`.
+    :type dpf: float (positive)
+    :param out: Output <... x nChannels x 2>. Optional. Default is None.
+    :type out: numpy.ndarray or NoneType
+    :return: The [HbO2, HHb] concentration changes [µM] <... x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    pinvE, inversePath = probeConversion(wavelengths, distances, dpf)
+    if opticalDensity.shape[-2:] != (len(inversePath), pinvE.shape[1]):
+        msg = 'modifiedBeerLambert: Unexpected parameter value for parameter ''opticalDensity''. Expected <... x nChannels x nWavelengths>.'
+        raise ValueError(msg)
+
+    out = np.matmul(opticalDensity, pinvE.T, out=out)
+    out *= inversePath[:, None]
+
+    return out
+#end modifiedBeerLambert(opticalDensity, distances, wavelengths, dpf=DEFAULT_DPF, out=None)
+
+
+def channelPairs(nMeasurements, shortChannels=(), nWavelengths=2):
+    '''
+    Gets the measurement columns of each long channel. As in
+    :meth:`fNIRSSignalGenerator.import_datums`, the short channels are
+    dropped and the remaining columns are split into nWavelengths blocks,
+    block k holding wavelength k of every channel.
+
+    :param nMeasurements: Number of measurements (columns) of the recording.
+    :type nMeasurements: int (positive)
+    :param shortChannels: Columns of the short channels. Default is ().
+    :type shortChannels: list or tuple
+    :param nWavelengths: Number of wavelengths. Default is 2.
+    :type nWavelengths: int (positive)
+    :return: The columns <nChannels x nWavelengths>.
+    :rtype: numpy.ndarray
+    '''
+
+    longChannels = np.delete(np.arange(nMeasurements), list(shortChannels))
+    nChannels = len(longChannels) // nWavelengths
+
+    return longChannels[0:nChannels*nWavelengths].reshape(nWavelengths, nChannels).T
+#end channelPairs(nMeasurements, shortChannels=(), nWavelengths=2)
+
+
+def channelMeans(dataset, columns=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    First pass; the mean intensity of the measurements, reading dataset
+    in chunks of rows.
+
+    :param dataset: The raw intensities <nSamples x nMeasurements>, e.g.
+        an h5py.Dataset.
+    :type dataset: h5py.Dataset or numpy.ndarray
+    :param columns: Columns (any shape) whose means are needed. Optional.
+        Default is None (all).
+    :type columns: numpy.ndarray or NoneType
+    :param chunkSize: Number of rows per chunk. Default is :data:`DEFAULT_CHUNK_SIZE`.
+    :type chunkSize: int (positive)
+    :return: The means, shaped as columns.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if type(chunkSize) is not int or chunkSize <= 0:
+        msg = 'channelMeans: Unexpected parameter value for parameter ''chunkSize''.'
+        raise ValueError(msg)
+    nSamples, nMeasurements = dataset.shape
+    if columns is None:
+        columns = np.arange(nMeasurements)
+
+    total = np.zeros(np.shape(columns))
+    for start in range(0, nSamples, chunkSize):
+        chunk = np.asarray(dataset[start:start + chunkSize], dtype=float)
+        total += chunk[:, columns].sum(axis=0)
+
+    return total / nSamples
+#end channelMeans(dataset, columns=None, chunkSize=DEFAULT_CHUNK_SIZE)
+
+
+def convertMBLL(dataset, distances, shortChannels=(), wavelengths=LEGACY_WAVELENGTHS, \
+                out=None, opticalDensity=None, dpf=DEFAULT_DPF, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Converts raw intensities to hemoglobin concentrations, chunk by chunk.
+
+    :param dataset: The raw intensities <nSamples x nMeasurements>, e.g.
+        the h5py.Dataset /nirs/data1/dataTimeSeries of an open SNIRF file.
+    :type dataset: h5py.Dataset or numpy.ndarray
+    :param distances: Source-detector distance [cm] of each long channel <nChannels>.
+    :type distances: numpy.ndarray
+    :param shortChannels: Columns of the short channels. Default is ().
+    :type shortChannels: list or tuple
+    :param wavelengths: The wavelengths [nm] of the blocks of measurements
+        (see :func:`channelPairs`), e.g. /nirs/probe/wavelengths.
+        Default is :data:`LEGACY_WAVELENGTHS`.
+    :type wavelengths: list, tuple or numpy.ndarray
+    :param out: Output <nSamples x nChannels x 2>; an array (e.g. a np.memmap)
+        or the name of a .npy file to create and memory map. Optional.
+        Default is None (a new array).
+    :type out: numpy.ndarray, str or NoneType
+    :param opticalDensity: Output for the optical densities
+        <nSamples x nChannels x nWavelengths>, like out. Optional.
+        Default is None (not kept).
+    :type opticalDensity: numpy.ndarray, str or NoneType
+    :param dpf: The differential pathlength factor. Default is :data:`DEFAULT_DPF`.
+    :type dpf: float (positive)
+    :param chunkSize: Number of rows per chunk. Default is :data:`DEFAULT_CHUNK_SIZE`.
+    :type chunkSize: int (positive)
+    :return: The concentration changes [µM] <nSamples x nChannels x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    nSamples, nMeasurements = dataset.shape
+    nWavelengths = len(np.ravel(wavelengths))
+    pairs = channelPairs(nMeasurements, shortChannels, nWavelengths)
+    nChannels = pairs.shape[0]
+    distances = np.asarray(distances, dtype=float).ravel()
+    if distances.shape != (nChannels,):
+        msg = 'convertMBLL: Unexpected parameter value for parameter ''distances''. Expected ' + str(nChannels) + ' distances.'
+        raise ValueError(msg)
+    probeConversion(wavelengths, distances, dpf) #Validates and caches the probe
+    out = _output(out, (nSamples, nChannels, 2), 'out')
+    if opticalDensity is not None:
+        opticalDensity = _output(opticalDensity, (nSamples, nChannels, nWavelengths), 'opticalDensity')
+
+    means = channelMeans(dataset, pairs, chunkSize)
+    for start in range(0, nSamples, chunkSize):
+        chunk = np.asarray(dataset[start:start + chunkSize], dtype=float)
+        od = chunk[:, pairs] #<chunk x nChannels x nWavelengths>
+        od /= means
+        # Non-positive intensities yield NaN/inf here; such segments are
+        # discarded later by the noise bank screening (see noiseBank.screenSegments)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.log(od, out=od)
+            np.negative(od, out=od)
+            if opticalDensity is not None:
+                opticalDensity[start:start + chunkSize] = od
+            modifiedBeerLambert(od, distances, wavelengths, dpf, out=out[start:start + chunkSize])
+
+    return out
+#end convertMBLL(dataset, distances, shortChannels=(), wavelengths=LEGACY_WAVELENGTHS, ...)
+
+
+def _output(out, shape, name):
+    if out is None:
+        return np.empty(shape)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+    if out.shape != shape:
+        msg = 'convertMBLL: Unexpected parameter value for parameter ' + name + '. Expected shape ' + str(shape) + '.'
+        raise ValueError(msg)
+    return out
+#end _output(out, shape, name)
+
+
+@lru_cache(maxsize=16)
+def _extinction(wavelengths):
+    E = extinctionCoefficients(wavelengths) * 1e-6 # [cm-1/M] to [cm-1/µM]
+    E.flags.writeable = False
+    return E
+#end _extinction(wavelengths)
+
+
+def extinctionMatrix(wavelengths):
+    '''
+    Gets the (cached, read only) extinction coefficients of the
+    wavelengths, in cm-1/µM; the forward model of :func:`conversionMatrix`.
+
+    :param wavelengths: The wavelengths [nm].
+    :type wavelengths: list, tuple or numpy.ndarray
+    :return: The extinction matrix <nWavelengths x 2>.
+    :rtype: numpy.ndarray
+    '''
+
+    return _extinction(tuple(np.asarray(wavelengths, dtype=float).ravel().tolist()))
+#end extinctionMatrix(wavelengths)
+
+
+def inverseModifiedBeerLambert(concentrations, distances, wavelengths, dpf=DEFAULT_DPF, out=None):
+    '''
+    Converts concentration changes to optical densities; the inverse of
+    :func:`modifiedBeerLambert`, for all channels and subjects in one
+    batched product.
+
+    :param concentrations: The [HbO2, HHb] concentration changes [µM]
+        <... x nChannels x 2>.
+    :type concentrations: numpy.ndarray
+    :param distances: Source-detector distance [cm] of each channel <nChannels>.
+    :type distances: numpy.ndarray
+    :param wavelengths: The wavelengths [nm] <nWavelengths>.
+    :type wavelengths: list, tuple or numpy.ndarray
+    :param dpf: The differential pathlength factor. Default is :data:`DEFAULT_DPF`.
+    :type dpf: float (positive)
+    :param out: Output <... x nChannels x nWavelengths>. Optional. Default is None.
+    :type out: numpy.ndarray or NoneType
+    :return: The optical densities <... x nChannels x nWavelengths>.
+    :rtype: numpy.ndarray
+    '''
+
+    E = extinctionMatrix(wavelengths)
+    inversePath = probeConversion(wavelengths, distances, dpf)[1]
+    if concentrations.shape[-2:] != (len(inversePath), 2):
+        msg = 'inverseModifiedBeerLambert: Unexpected parameter value for parameter ''concentrations''. Expected <... x nChannels x 2>.'
+        raise ValueError(msg)
+
+    out = np.matmul(concentrations, E.T, out=out)
+    out /= inversePath[:, None]
+
+    return out
+#end inverseModifiedBeerLambert(concentrations, distances, wavelengths, dpf=DEFAULT_DPF, out=None)
+
+
+def opticalDensityToIntensity(opticalDensity, baseline=1.0, out=None):
+    '''
+    Converts optical densities to raw intensities, I = baseline * exp(-OD).
+
+    :param opticalDensity: The optical densities <... x nChannels x nWavelengths>.
+    :type opticalDensity: numpy.ndarray
+    :param baseline: Mean intensity; a scalar or an array broadcasting to
+        <nChannels x nWavelengths>. Default is 1.
+    :type baseline: float or numpy.ndarray
+    :param out: Output, may be opticalDensity. Optional. Default is None.
+    :type out: numpy.ndarray or NoneType
+    :return: The intensities.
+    :rtype: numpy.ndarray
+    '''
+
+    out = np.negative(opticalDensity, out=out)
+    np.exp(out, out=out)
+    out *= baseline
+
+    return out
+#end opticalDensityToIntensity(opticalDensity, baseline=1.0, out=None)
+
+
+def channelDistances(pairings, optodesLocations):
+    '''
+    Gets the source-detector distance of every channel of a channel
+    location map.
+
+    :param pairings: The (source, detector) optodes of each channel
+        <nChannels x 2>; see :attr:`channelLocationMap.pairings`.
+    :type pairings: numpy.ndarray
+    :param optodesLocations: The optodes locations <nOptodes x 3>; see
+        :attr:`channelLocationMap.optodesLocations`.
+    :type optodesLocations: numpy.ndarray
+    :return: The distances <nChannels>, in the units of optodesLocations.
+    :rtype: numpy.ndarray
+    '''
+
+    pairings = np.asarray(pairings, dtype=float)
+    optodesLocations = np.asarray(optodesLocations, dtype=float)
+    if pairings.ndim != 2 or pairings.shape[1] != 2 or np.any(np.isnan(pairings)) or \
+            np.any(pairings >= optodesLocations.shape[0]):
+        msg = 'channelDistances: Unexpected parameter value for parameter ''pairings''. All channels must pair known optodes.'
+        raise ValueError(msg)
+    pairings = pairings.astype(int)
+
+    return np.linalg.norm(optodesLocations[pairings[:, 0]] - optodesLocations[pairings[:, 1]], axis=-1)
+#end channelDistances(pairings, optodesLocations)
@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+#
+#File: noiseBank.py
+#
+'''
+Module ***noiseBank***
+
+This module implements the class :class:`noiseBankIndex <noiseBankIndex>`.
+
+A noise bank is the tensor returned by
+:meth:`fNIRSSignalGenerator.import_datums`, i.e. a
+<temporal, segment, signal> array where every column along the second
+dimension is a resting-state segment that can be added to a synthetic
+channel as experimental noise.
+
+The index summarises each segment by a small set of spectral and
+temporal features so that :meth:`fNIRSSignalGenerator.addExperimentalNoise`
+can pick segments matching a target noise profile instead of picking them
+uniformly at random. Alongside the features, the index keeps per-segment
+quality metrics and a validity mask (see :func:`screenSegments`) so that
+flat, saturated, motion-corrupted or non-finite segments are never drawn.
+The index is computed once per bank and can be cached on disk next to
+the bank; the cache is keyed by the bank fingerprint and the screening
+thresholds.
+'''
+
+import os
+import warnings
+import zlib
+
+import numpy as np
+
+from rngStreams import getGenerator
+
+
+# Default thresholds of screenSegments
+SCREENING_DEFAULTS = {'flatThreshold': 1e-12, 'saturationThreshold': 0.05, 'motionThreshold': 20.0}
+
+# Version of the quality metrics of screenSegments; cached indices with other metrics are rebuilt
+METRICS_VERSION = 2
+
+
+class noiseBankIndex:
+    '''
+    A precomputed feature index over a noise bank.
+
+    Features are stored in a compact float32 array of shape
+    <segment, signal, feature>. The features are, in order,
+    :attr:`FEATURE_NAMES`:
+
+    * cardiac: log10 band power in the cardiac band
+    * respiratory: log10 band power in the respiratory band
+    * mayer: log10 band power in the Mayer wave band
+    * variance: log10 variance of the segment
+    * drift: linear drift slope [units/s]
+
+    Quality metrics are stored in a float32 array of shape <segment, metric>
+    with the metrics :attr:`METRIC_NAMES` (worst case over signals), and
+    the screening decision in a boolean vector :attr:`valid`.
+    '''
+
+    FEATURE_NAMES = ('cardiac', 'respiratory', 'mayer', 'variance', 'drift')
+
+    # Frequency bands in [Hz]
+    FREQUENCY_BANDS = {'cardiac':     (0.80, 1.60),
+                       'respiratory': (0.15, 0.40),
+                       'mayer':       (0.05, 0.15)}
+
+    METRIC_NAMES = ('nonFinite', 'std', 'saturation', 'motion')
+
+    def __init__(self, features, samplingRate, fingerprint='', metrics=None, valid=None, screening=None):
+        '''
+        Class constructor.
+
+        Normally, indexes are not constructed directly but through
+        :meth:`build` or :meth:`fromBank`.
+
+        :Parameters:
+
+        :param features: The feature array <segment, signal, feature>.
+        :type features: numpy.ndarray
+        :param samplingRate: Sampling rate of the indexed bank [Hz].
+        :type samplingRate: float (positive)
+        :param fingerprint: Fingerprint of the indexed bank. See :func:`bankFingerprint`.
+        :type fingerprint: str
+        :param metrics: The quality metrics <segment, metric>. Optional.
+            Default is None (not screened).
+        :type metrics: numpy.ndarray or NoneType
+        :param valid: The screening decision, one per segment. Optional.
+            Default is None (all segments valid).
+        :type valid: numpy.ndarray or NoneType
+        :param screening: The thresholds of :func:`screenSegments` behind
+            valid. Optional. Default is None (not screened).
+        :type screening: dict or NoneType
+        '''
+
+        #Check parameters
+        if type(features) is not np.ndarray:
+            msg = self.getClassName() + ':__init__: Unexpected parameter type for parameter ''features''.'
+            raise ValueError(msg)
+        if features.ndim != 3 or features.shape[2] != len(self.FEATURE_NAMES):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''features''.'
+            raise ValueError(msg)
+        if samplingRate <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''samplingRate''.'
+            raise ValueError(msg)
+
+        self.__features = np.ascontiguousarray(features, dtype=np.float32)
+        self.__features.flags.writeable = False
+        self.__samplingRate = float(samplingRate)
+        self.__fingerprint = str(fingerprint)
+
+        nSegments = self.__features.shape[0]
+        if metrics is None:
+            metrics = np.full((nSegments, len(self.METRIC_NAMES)), np.nan, dtype=np.float32)
+        if valid is None:
+            valid = np.ones(nSegments, dtype=bool)
+        if metrics.shape != (nSegments, len(self.METRIC_NAMES)):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''metrics''.'
+            raise ValueError(msg)
+        if valid.shape != (nSegments,):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''valid''.'
+            raise ValueError(msg)
+        self.__metrics = np.ascontiguousarray(metrics, dtype=np.float32)
+        self.__metrics.flags.writeable = False
+        self.__valid = np.ascontiguousarray(valid, dtype=bool)
+        self.__valid.flags.writeable = False
+        self.__validSegments = np.flatnonzero(self.__valid)
+        self.__screening = None if screening is None else resolveScreening(**screening)
+
+        # Feature-wise standardization used by the nearest neighbour lookup.
+        finite = np.where(np.isfinite(self.__features), self.__features, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN features
+            self.__scale = np.nanstd(finite, axis=0)
+        self.__scale[~(self.__scale > 0)] = 1
+
+        return
+    #end __init__(self, features, samplingRate, fingerprint='')
+
+
+    @property
+    def features(self): #features getter
+        '''
+        The feature array <segment, signal, feature>.
+        This is a read-only property.
+
+        :getter: Gets the (read-only) feature array.
+        :type: numpy.ndarray
+        '''
+
+        return self.__features
+    #end features(self)
+
+    @property
+    def nSegments(self): #nSegments getter
+        '''
+        Number of indexed segments.
+
+        :getter: Gets the number of indexed segments.
+        :type: int
+        '''
+
+        return self.__features.shape[0]
+    #end nSegments(self)
+
+    @property
+    def metrics(self): #metrics getter
+        '''
+        The quality metrics <segment, metric>. See :func:`screenSegments`.
+        This is a read-only property.
+
+        :getter: Gets the (read-only) metrics array.
+        :type: numpy.ndarray
+        '''
+
+        return self.__metrics
+    #end metrics(self)
+
+    @property
+    def valid(self): #valid getter
+        '''
+        The screening decision; True for segments that can be used as noise.
+        This is a read-only property.
+
+        :getter: Gets the (read-only) validity mask.
+        :type: numpy.ndarray of bool
+        '''
+
+        return self.__valid
+    #end valid(self)
+
+    @property
+    def validSegments(self): #validSegments getter
+        '''
+        Indexes of the valid segments.
+
+        :getter: Gets the indexes of the valid segments.
+        :type: numpy.ndarray of int
+        '''
+
+        return self.__validSegments
+    #end validSegments(self)
+
+    @property
+    def screening(self): #screening getter
+        '''
+        The thresholds of :func:`screenSegments` behind :attr:`valid`; None
+        if the segments were not screened.
+
+        :getter: Gets the thresholds.
+        :type: dict or NoneType
+        '''
+
+        return None if self.__screening is None else dict(self.__screening)
+    #end screening(self)
+
+    @property
+    def samplingRate(self): #samplingRate getter
+        '''
+        Sampling rate of the indexed bank [Hz].
+
+        :getter: Gets the sampling rate.
+        :type: float
+        '''
+
+        return self.__samplingRate
+    #end samplingRate(self)
+
+    @property
+    def fingerprint(self): #fingerprint getter
+        '''
+        Fingerprint of the indexed bank.
+
+        :getter: Gets the fingerprint.
+        :type: str
+        '''
+
+        return self.__fingerprint
+    #end fingerprint(self)
+
+
+    def getClassName(self):
+        '''Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    @classmethod
+    def build(cls, bank, samplingRate, **screeningOptions):
+        '''
+        Builds the index of a noise bank.
+
+        Features and quality metrics are computed for the whole bank
+        in one pass.
+
+        :Parameters:
+
+        :param bank: The noise bank <temporal, segment, signal>.
+        :type bank: numpy.ndarray
+        :param samplingRate: Sampling rate of the bank [Hz].
+        :type samplingRate: float (positive)
+        :param screeningOptions: Thresholds passed to :func:`screenSegments`.
+
+        :return: The index.
+        :rtype: noiseBankIndex
+        '''
+
+        features = computeSegmentFeatures(bank, samplingRate)
+        metrics, valid = screenSegments(bank, **screeningOptions)
+
+        return cls(features, samplingRate, fingerprint=bankFingerprint(bank, samplingRate),
+                   metrics=metrics, valid=valid, screening=resolveScreening(**screeningOptions))
+    #end build(cls, bank, samplingRate, **screeningOptions)
+
+
+    @classmethod
+    def load(cls, fileName):
+        '''
+        Loads an index previously saved with :meth:`save`.
+
+        :param fileName: The index file (.npz).
+        :type fileName: str
+        :return: The index.
+        :rtype: noiseBankIndex
+        '''
+
+        with np.load(fileName, allow_pickle=False) as f:
+            screening = None
+            #Caches saved before the thresholds were stored, or with other metrics, have no screening
+            metricsVersion = int(f['metricsVersion']) if 'metricsVersion' in f.files else 1
+            if metricsVersion == METRICS_VERSION and 'screening' in f.files \
+                    and f['screening'].size == len(SCREENING_DEFAULTS):
+                screening = dict(zip(SCREENING_DEFAULTS, f['screening'].tolist()))
+            return cls(f['features'], float(f['samplingRate']), fingerprint=str(f['fingerprint']),
+                       metrics=f['metrics'], valid=f['valid'], screening=screening)
+    #end load(cls, fileName)
+
+
+    def save(self, fileName):
+        '''
+        Saves the index to a .npz file.
+
+        :param fileName: The index file.
+        :type fileName: str
+        :return: None
+        :rtype: NoneType
+        '''
+
+        screening = np.empty(0) if self.__screening is None else \
+            np.array([self.__screening[key] for key in SCREENING_DEFAULTS], dtype=float)
+        np.savez(fileName, features=self.__features, samplingRate=self.__samplingRate,
+                 fingerprint=self.__fingerprint, metrics=self.__metrics, valid=self.__valid,
+                 screening=screening, metricsVersion=METRICS_VERSION)
+
+        return
+    #end save(self, fileName)
+
+
+    @classmethod
+    def fromBank(cls, bank, samplingRate, cacheFile=None, **screeningOptions):
+        '''
+        Gets the index of a noise bank, reusing a cached index when possible.
+
+        If cacheFile exists and was built for the same bank (same
+        fingerprint), it is loaded; if it was screened with other thresholds,
+        the segments are re-screened from its stored metrics. Otherwise the
+        index is built. A new or re-screened index is saved to cacheFile, if
+        given.
+
+        :Parameters:
+
+        :param bank: The noise bank <temporal, segment, signal>.
+        :type bank: numpy.ndarray
+        :param samplingRate: Sampling rate of the bank [Hz].
+        :type samplingRate: float (positive)
+        :param cacheFile: The index cache file (.npz). Optional. Default is None (no caching).
+        :type cacheFile: str or NoneType
+        :param screeningOptions: Thresholds passed to :func:`screenSegments`.
+
+        :return: The index.
+        :rtype: noiseBankIndex
+        '''
+
+        screeningOptions = resolveScreening(**screeningOptions)
+        fingerprint = bankFingerprint(bank, samplingRate)
+        if cacheFile is not None and os.path.isfile(cacheFile):
+            index = cls.load(cacheFile)
+            if index.fingerprint == fingerprint:
+                if index.screening == screeningOptions:
+                    return index
+                if index.screening is not None:
+                    index = index.rescreen(**screeningOptions)
+                    index.save(cacheFile)
+                    return index
+
+        index = cls.build(bank, samplingRate, **screeningOptions)
+        if cacheFile is not None:
+            index.save(cacheFile)
+
+        return index
+    #end fromBank(cls, bank, samplingRate, cacheFile=None, **screeningOptions)
+
+
+    def matches(self, bank):
+        '''
+        Checks whether the index was built for the given bank.
+
+        :param bank: The noise bank <temporal, segment, signal>.
+        :type bank: numpy.ndarray
+        :return: True if the bank fingerprint matches the index fingerprint.
+        :rtype: bool
+        '''
+
+        return self.__fingerprint == bankFingerprint(bank, self.__samplingRate)
+    #end matches(self, bank)
+
+
+    def rescreen(self, **screeningOptions):
+        '''
+        Re-screens the segments with other thresholds, from the stored
+        quality metrics (the bank is not needed).
+
+        :param screeningOptions: Thresholds of :func:`screenSegments`.
+        :return: The index with the new screening decision.
+        :rtype: noiseBankIndex
+        '''
+
+        if self.__screening is None:
+            msg = self.getClassName() + ':rescreen: The index holds no quality metrics.'
+            raise ValueError(msg)
+
+        return type(self)(self.__features, self.__samplingRate, fingerprint=self.__fingerprint,
+                          metrics=self.__metrics, valid=validMask(self.__metrics, **screeningOptions),
+                          screening=screeningOptions)
+    #end rescreen(self, **screeningOptions)
+
+
+    def compact(self, bank):
+        '''
+        Drops the invalid segments from a noise bank.
+
+        :param bank: The noise bank the index was built for.
+        :type bank: numpy.ndarray
+        :return: The bank with the valid segments only, and its index.
+        :rtype: tuple (numpy.ndarray, noiseBankIndex)
+        '''
+
+        if bank.shape[1] != self.nSegments:
+            msg = self.getClassName() + ':compact: Unexpected parameter value for parameter ''bank''.'
+            raise ValueError(msg)
+
+        keep = self.__validSegments
+        newBank = np.ascontiguousarray(bank[:, keep, :])
+        newIndex = type(self)(self.__features[keep], self.__samplingRate,
+                              fingerprint=bankFingerprint(newBank, self.__samplingRate),
+                              metrics=self.__metrics[keep], valid=self.__valid[keep],
+                              screening=self.__screening)
+
+        return newBank, newIndex
+    #end compact(self, bank)
+
+
+    def sample(self, size=1, rng=None):
+        '''
+        Draws valid segments uniformly at random.
+
+        :param size: Number of segments to draw. Default is 1.
+        :type size: int (positive)
+        :param rng: Random generator or seed. See module :mod:`rngStreams`. Optional. Default is None.
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :return: The indexes of the sampled segments.
+        :rtype: numpy.ndarray
+        '''
+
+        if len(self.__validSegments) == 0:
+            msg = self.getClassName() + ':sample: No valid segments in the noise bank.'
+            raise ValueError(msg)
+
+        rng = getGenerator(rng)
+
+        return self.__validSegments[rng.integers(len(self.__validSegments), size=size)]
+    #end sample(self, size=1, rng=None)
+
+
+    def targetVector(self, targetProfile):
+        '''
+        Converts a target profile to a <signal, feature> array.
+
+        Features not specified in the profile are set to NaN and are
+        ignored by :meth:`query`.
+
+        :param targetProfile: Either a dict mapping feature names to
+            target values (applied to both signals), or an array
+            broadcastable to <signal, feature>.
+        :type targetProfile: dict or numpy.ndarray
+        :return: The target array.
+        :rtype: numpy.ndarray
+        '''
+
+        if type(targetProfile) is dict:
+            target = np.full((self.__features.shape[1], len(self.FEATURE_NAMES)), np.nan)
+            for key, value in targetProfile.items():
+                if key not in self.FEATURE_NAMES:
+                    msg = self.getClassName() + ':targetVector: Unexpected parameter value for parameter ''targetProfile''.'
+                    raise ValueError(msg)
+                target[:, self.FEATURE_NAMES.index(key)] = value
+            return target
+
+        target = np.asarray(targetProfile, dtype=float)
+        try:
+            target = np.broadcast_to(target, self.__features.shape[1:])
+        except ValueError:
+            msg = self.getClassName() + ':targetVector: Unexpected parameter value for parameter ''targetProfile''.'
+            raise ValueError(msg)
+
+        return target
+    #end targetVector(self, targetProfile)
+
+
+    def distances(self, targetProfile):
+        '''
+        Standardized Euclidean distance of every segment to a target profile.
+
+        :param targetProfile: The target profile. See :meth:`targetVector`.
+        :type targetProfile: dict or numpy.ndarray
+        :return: A vector of distances, one per segment. Invalid segments
+            are at infinite distance.
+        :rtype: numpy.ndarray
+        '''
+
+        target = self.targetVector(targetProfile)
+        used = np.isfinite(target)
+        if not used.any():
+            return np.where(self.__valid, 0.0, np.inf)
+
+        diff = (self.__features - target) / self.__scale
+        diff = np.where(used, diff, 0)
+        diff[~np.isfinite(diff)] = np.inf  # Segments with undefined features never match
+
+        d = np.sqrt(np.sum(diff * diff, axis=(1, 2)))
+        d[~self.__valid] = np.inf
+
+        return d
+    #end distances(self, targetProfile)
+
+
+    def query(self, targetProfile, size=1, k=None, rng=None):
+        '''
+        Samples segments whose features match a target profile.
+
+        The k nearest segments to the target profile are found with a single
+        vectorized distance computation, and size segments are drawn
+        (with replacement) uniformly among them.
+
+        :Parameters:
+
+        :param targetProfile: The target profile. See :meth:`targetVector`.
+        :type targetProfile: dict or numpy.ndarray
+        :param size: Number of segments to draw. Default is 1.
+        :type size: int (positive)
+        :param k: Size of the neighbourhood. Optional. Default is None,
+            which uses max(size, 1% of the bank).
+        :type k: int (positive) or NoneType
+        :param rng: Random generator or seed. See module :mod:`rngStreams`. Optional. Default is None.
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+
+        :return: The indexes of the sampled segments.
+        :rtype: numpy.ndarray
+        '''
+
+        if k is None:
+            k = max(size, self.nSegments // 100)
+        if len(self.__validSegments) == 0:
+            msg = self.getClassName() + ':query: No valid segments in the noise bank.'
+            raise ValueError(msg)
+        k = int(min(max(k, 1), len(self.__validSegments)))
+
+        d = self.distances(targetProfile)
+        if k < self.nSegments:
+            candidates = np.argpartition(d, k - 1)[0:k]
+        else:
+            candidates = self.__validSegments
+
+        rng = getGenerator(rng)
+
+        return candidates[rng.integers(len(candidates), size=size)]
+    #end query(self, targetProfile, size=1, k=None, rng=None)
+
+#class noiseBankIndex
+
+
+def bankFingerprint(bank, samplingRate):
+    '''
+    A cheap fingerprint of a noise bank.
+
+    The fingerprint combines the shape, the sampling rate and a checksum
+    of a strided subsample of the bank, so it can be checked on every
+    generation without hashing the whole bank.
+
+    :param bank: The noise bank <temporal, segment, signal>.
+    :type bank: numpy.ndarray
+    :param samplingRate: Sampling rate of the bank [Hz].
+    :type samplingRate: float
+    :return: The fingerprint.
+    :rtype: str
+    '''
+
+    sample = np.ascontiguousarray(bank[::97, :, :])
+    checksum = zlib.crc32(sample.tobytes())
+
+    return '{}:{}:{}'.format('x'.join(str(n) for n in bank.shape), float(samplingRate), checksum)
+#end bankFingerprint(bank, samplingRate)
+
+
+def computeSegmentFeatures(bank, samplingRate):
+    '''
+    Computes the features of every segment of a noise bank in one pass.
+
+    :param bank: The noise bank <temporal, segment, signal>.
+    :type bank: numpy.ndarray
+    :param samplingRate: Sampling rate of the bank [Hz].
+    :type samplingRate: float (positive)
+    :return: The feature array <segment, signal, feature>. See :class:`noiseBankIndex`.
+    :rtype: numpy.ndarray
+    '''
+
+    if type(bank) is not np.ndarray or bank.ndim != 3:
+        msg = 'computeSegmentFeatures: Unexpected parameter value for parameter ''bank''.'
+        raise ValueError(msg)
+
+    nSamples = bank.shape[0]
+    x = np.nan_to_num(bank.astype(float), nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Drift as the least squares slope against centered time
+    t = np.arange(nSamples) / samplingRate
+    t = t - t.mean()
+    tt = np.dot(t, t)
+    slope = np.einsum('t,tsc->sc', t, x) / tt if tt > 0 else np.zeros(x.shape[1:])
+
+    # Band powers on the detrended segments
+    mean = x.mean(axis=0)
+    x = x - mean - t[:, None, None] * slope
+    spectrum = np.abs(np.fft.rfft(x, axis=0)) ** 2 / nSamples
+    freqs = np.fft.rfftfreq(nSamples, d=1 / samplingRate)
+
+    nSegments, nSignals = bank.shape[1], bank.shape[2]
+    features = np.empty((nSegments, nSignals, len(noiseBankIndex.FEATURE_NAMES)), dtype=np.float32)
+    with np.errstate(divide='ignore'):
+        for i, name in enumerate(('cardiac', 'respiratory', 'mayer')):
+            low, high = noiseBankIndex.FREQUENCY_BANDS[name]
+            band = (freqs >= low) & (freqs < high)
+            features[:, :, i] = np.log10(spectrum[band].sum(axis=0))
+        features[:, :, 3] = np.log10(x.var(axis=0))
+    features[:, :, 4] = slope
+
+    return features
+#end computeSegmentFeatures(bank, samplingRate)
+
+
+def resolveScreening(**screeningOptions):
+    '''
+    Completes thresholds of :func:`screenSegments` with the defaults.
+
+    :param screeningOptions: Thresholds; see :data:`SCREENING_DEFAULTS`.
+    :return: All the thresholds.
+    :rtype: dict
+    '''
+
+    options = dict(SCREENING_DEFAULTS)
+    for key, value in screeningOptions.items():
+        if key not in SCREENING_DEFAULTS:
+            msg = 'resolveScreening: Unexpected screening option ' + key + '.'
+            raise ValueError(msg)
+        options[key] = float(value)
+
+    return options
+#end resolveScreening(**screeningOptions)
+
+
+def validMask(metrics, flatThreshold=1e-12, saturationThreshold=0.05, motionThreshold=20.0):
+    '''
+    Decides which segments are valid from their quality metrics. See
+    :func:`screenSegments`.
+
+    :param metrics: The metrics <segment, metric> (see :attr:`noiseBankIndex.METRIC_NAMES`).
+    :type metrics: numpy.ndarray
+    :return: The validity mask <segment>.
+    :rtype: numpy.ndarray
+    '''
+
+    return (metrics[:, 0] == 0) & (metrics[:, 1] > flatThreshold) \
+           & (metrics[:, 2] <= saturationThreshold) & (metrics[:, 3] <= motionThreshold)
+#end validMask(metrics, flatThreshold=1e-12, ...)
+
+
+def screenSegments(bank, flatThreshold=1e-12, saturationThreshold=0.05, motionThreshold=20.0):
+    '''
+    Computes quality metrics of every segment of a noise bank in one pass,
+    and decides which segments are valid.
+
+    The metrics, per segment and signal, are:
+
+    * nonFinite: fraction of NaN/inf samples (e.g. from the log in
+      :meth:`fNIRSSignalGenerator.process_datums` on non-positive intensities)
+    * std: standard deviation; flat channels have (near) zero std
+    * saturation: fraction of samples stuck at the segment minimum or maximum
+    * motion: largest deviation of a sample-to-sample jump from the median
+      jump, in units of the robust (median absolute deviation) standard
+      deviation of the jumps; where the MAD is 0 (e.g. quantized or piecewise
+      linear segments) the smallest jump, the quantization step, is used
+      instead, and segments without jumps have motion 0
+
+    Each metric is reduced over signals by its worst case. A segment is
+    valid if it has no non-finite samples, std > flatThreshold,
+    saturation <= saturationThreshold and motion <= motionThreshold.
+
+    :Parameters:
+
+    :param bank: The noise bank <temporal, segment, signal>.
+    :type bank: numpy.ndarray
+    :param flatThreshold: Minimum std. Optional. Default is 1e-12.
+    :type flatThreshold: float
+    :param saturationThreshold: Maximum saturated fraction. Optional. Default is 0.05.
+    :type saturationThreshold: float
+    :param motionThreshold: Maximum jump in robust std units. Optional. Default is 20.
+    :type motionThreshold: float
+
+    :return: The metrics <segment, metric> (see :attr:`noiseBankIndex.METRIC_NAMES`)
+        and the validity mask <segment>.
+    :rtype: tuple (numpy.ndarray, numpy.ndarray)
+    '''
+
+    if type(bank) is not np.ndarray or bank.ndim != 3:
+        msg = 'screenSegments: Unexpected parameter value for parameter ''bank''.'
+        raise ValueError(msg)
+
+    nSamples = bank.shape[0]
+    finite = np.isfinite(bank)
+    nonFinite = 1 - finite.mean(axis=0)
+    x = np.where(finite, bank, 0.0)
+
+    std = x.std(axis=0)
+
+    # Saturation: samples pinned at the extremes of the segment
+    xMin = x.min(axis=0)
+    xMax = x.max(axis=0)
+    tol = 1e-9 * np.maximum(np.abs(xMax - xMin), 1e-300)
+    atMin = np.count_nonzero(np.abs(x - xMin) <= tol, axis=0)
+    atMax = np.count_nonzero(np.abs(x - xMax) <= tol, axis=0)
+    saturation = (np.maximum(atMin, atMax) - 1) / nSamples
+
+    # Motion: jumps of the first difference relative to its robust std. Quantized,
+    # flat or piecewise linear segments have MAD 0; their smallest jump (the
+    # quantization step) stands in, and a segment without jumps has no motion.
+    # Deviations below the rounding error of the samples are no jumps
+    dx = np.diff(x, axis=0)
+    deviation = np.abs(dx - np.median(dx, axis=0))
+    deviation[deviation <= 1e-9 * np.abs(x).max(axis=0)] = 0
+    mad = np.median(deviation, axis=0)
+    step = np.where(deviation > 0, deviation, np.inf).min(axis=0)
+    scale = np.where(mad > 0, 1.4826 * mad, 1.4826 * step)
+    jump = deviation.max(axis=0)
+    motion = np.zeros_like(jump)
+    np.divide(jump, scale, out=motion, where=jump > 0)
+
+    metrics = np.stack((nonFinite.max(axis=1), std.min(axis=1),
+                        saturation.max(axis=1), motion.max(axis=1)), axis=1).astype(np.float32)
+    valid = validMask(metrics, flatThreshold=flatThreshold, saturationThreshold=saturationThreshold,
+                      motionThreshold=motionThreshold)
+
+    return metrics, valid
+#end screenSegments(bank, flatThreshold=1e-12, saturationThreshold=0.05, motionThreshold=20.0)
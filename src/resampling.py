@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+#File: resampling.py
+#
+'''
+Module ***resampling***
+
+Anti-aliased polyphase resampling of data tensors between arbitrary
+rational rates.
+
+The rate change fromRate -> toRate is reduced to a ratio up/down (see
+:func:`rationalFactors`). The low-pass FIR of the ratio (the same Kaiser
+window design as scipy.signal.resample_poly) is built once and cached, and
+the whole tensor (all channels and signals) is resampled in one call along
+its time axis.
+
+:func:`phaseAugmentations` returns all the phase-offset versions of the
+resampled signal, i.e. the outputs starting at each of the down input
+samples of the upsampled grid, as one stacked tensor. The anti-alias filter
+runs only once; the phases are a strided view of its output.
+'''
+
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal
+
+
+@lru_cache(maxsize=32)
+def _antiAliasFilter(up, down):
+    maxRate = max(up, down)
+    halfLength = 10 * maxRate
+    taps = scipy.signal.firwin(2*halfLength + 1, 1.0/maxRate, window=('kaiser', 5.0))
+    taps.flags.writeable = False
+    return taps
+#end _antiAliasFilter(up, down)
+
+
+def rationalFactors(fromRate, toRate, maxDenominator=1000):
+    '''
+    Gets the up and down factors of a rate change.
+
+    :param fromRate: The original sampling rate [Hz].
+    :type fromRate: float (positive)
+    :param toRate: The new sampling rate [Hz].
+    :type toRate: float (positive)
+    :param maxDenominator: Largest factor considered when approximating
+        toRate/fromRate by a fraction. Default is 1000.
+    :type maxDenominator: int (positive)
+    :return: The factors (up, down).
+    :rtype: tuple
+    '''
+
+    #Check parameters
+    if fromRate <= 0 or toRate <= 0:
+        msg = 'rationalFactors: Unexpected parameter value for parameters ''fromRate'' or ''toRate''.'
+        raise ValueError(msg)
+
+    ratio = Fraction(toRate / fromRate).limit_denominator(maxDenominator)
+    if ratio.numerator == 0:
+        msg = 'rationalFactors: Rate change from ' + str(fromRate) + ' to ' + str(toRate) + ' Hz is too large.'
+        raise ValueError(msg)
+
+    return ratio.numerator, ratio.denominator
+#end rationalFactors(fromRate, toRate, maxDenominator=1000)
+
+
+def antiAliasFilter(fromRate, toRate):
+    '''
+    Gets the (cached, read only) low-pass FIR of a rate change.
+
+    :param fromRate: The original sampling rate [Hz].
+    :type fromRate: float (positive)
+    :param toRate: The new sampling rate [Hz].
+    :type toRate: float (positive)
+    :return: The filter taps.
+    :rtype: numpy.ndarray
+    '''
+
+    return _antiAliasFilter(*rationalFactors(fromRate, toRate))
+#end antiAliasFilter(fromRate, toRate)
+
+
+def resample(data, fromRate, toRate, axis=-3):
+    '''
+    Resamples a data tensor along its time axis.
+
+    :param data: The data, e.g. <nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param fromRate: The original sampling rate [Hz].
+    :type fromRate: float (positive)
+    :param toRate: The new sampling rate [Hz].
+    :type toRate: float (positive)
+    :param axis: The time axis. Default is -3.
+    :type axis: int
+    :return: The resampled data; ceil(nSamples*up/down) samples long.
+    :rtype: numpy.ndarray
+    '''
+
+    up, down = rationalFactors(fromRate, toRate)
+    data = np.asarray(data, dtype=float)
+    if up == down:
+        return data.copy()
+
+    return scipy.signal.resample_poly(data, up, down, axis=axis, window=_antiAliasFilter(up, down))
+#end resample(data, fromRate, toRate, axis=-3)
+
+
+def phaseAugmentations(data, fromRate, toRate, nPhases=None, axis=-3):
+    '''
+    Resamples a data tensor at every phase offset at once.
+
+    Phase k is the resampled signal starting k samples later on the
+    upsampled grid (for an integer decimation, k input samples later);
+    phase 0 is the output of :func:`resample`. All phases are trimmed to
+    floor(nSamples*up/down) samples.
+
+    :param data: The data, e.g. <nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param fromRate: The original sampling rate [Hz].
+    :type fromRate: float (positive)
+    :param toRate: The new sampling rate [Hz].
+    :type toRate: float (positive)
+    :param nPhases: Number of phases. Optional. Default is None (down; all of them).
+    :type nPhases: int (1 to down) or NoneType
+    :param axis: The time axis. Default is -3.
+    :type axis: int
+    :return: The (read only) phases <nPhases x ...>, the time axis of data
+        shifted by one.
+    :rtype: numpy.ndarray
+    '''
+
+    up, down = rationalFactors(fromRate, toRate)
+    if nPhases is None:
+        nPhases = down
+    if type(nPhases) is not int or not (1 <= nPhases <= down):
+        msg = 'phaseAugmentations: Unexpected parameter value for parameter ''nPhases''.'
+        raise ValueError(msg)
+
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, 0)
+    nSamples = data.shape[0]
+    nOut = (nSamples * up) // down
+    if up == down:
+        filtered = data.copy()
+    else:
+        #Anti-alias filter on the upsampled grid, compensating the filter delay
+        taps = _antiAliasFilter(up, down)
+        halfLength = (len(taps) - 1) // 2
+        filtered = scipy.signal.upfirdn(taps * up, data, up=up, down=1, axis=0)
+        filtered = filtered[halfLength:halfLength + nSamples*up]
+
+    #<nOut x down x ...>: [i, k] is sample i*down + k of the filtered signal
+    phases = filtered[0:nOut*down].reshape((nOut, down) + data.shape[1:])
+    phases = np.moveaxis(phases[:, 0:nPhases], 1, 0)
+    phases.flags.writeable = False
+
+    return np.moveaxis(phases, 1, axis % data.ndim + 1)
+#end phaseAugmentations(data, fromRate, toRate, nPhases=None, axis=-3)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+#File: rngStreams.py
+#
+'''
+Module ***rngStreams***
+
+Seeded, stream-splittable random number generation for the signal generators.
+
+All generators (:class:`fNIRSSignalGenerator`, :class:`EEGSignalGenerator`
+and the helper functions) accept an ``rng`` parameter which can be any of:
+
+* None: a fresh, unpredictable stream.
+* int: a root seed.
+* numpy.random.SeedSequence: a root seed sequence.
+* numpy.random.Generator: an existing stream. Child streams are spawned
+  from it, so consecutive calls get different (but reproducible) streams.
+
+Independent child streams are derived with :class:`numpy.random.SeedSequence`.
+Streams are addressed by keys (e.g. subject, session, noise source) rather
+than by spawn order, see :func:`cellSeedSequence`, so any cell of a large
+sweep can be regenerated in isolation on any worker with identical results.
+'''
+
+import zlib
+
+import numpy as np
+
+
+# Noise and amplitude sources of fNIRSSignalGenerator.execute. Each gets
+# its own stream so enabling or disabling one does not alter the others.
+FNIRS_SOURCES = ('boxcar', 'channel', 'breathing', 'heart', 'vasomotion', 'gaussian', 'experimental')
+
+# Sources of EEGSignalGenerator.execute
+EEG_SOURCES = ('background', 'alpha', 'theta', 'delta', 'gamma')
+
+
+def seedSequence(seed=None):
+    '''
+    Converts a seed to a :class:`numpy.random.SeedSequence`.
+
+    :param seed: The seed. See module documentation.
+    :type seed: None, int, numpy.random.SeedSequence or numpy.random.Generator
+    :return: The seed sequence.
+    :rtype: numpy.random.SeedSequence
+    '''
+
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        bitGenerator = seed.bit_generator
+        seedSeq = getattr(bitGenerator, 'seed_seq', None)
+        if seedSeq is None:
+            seedSeq = bitGenerator._seed_seq
+        return seedSeq.spawn(1)[0]
+    if seed is None or isinstance(seed, (int, np.integer)):
+        return np.random.SeedSequence(seed)
+
+    msg = 'seedSequence: Unexpected parameter type for parameter ''seed''.'
+    raise ValueError(msg)
+#end seedSequence(seed=None)
+
+
+def getGenerator(rng=None):
+    '''
+    Gets a :class:`numpy.random.Generator` from a seed.
+
+    Generators are returned unchanged, so that a caller-provided stream
+    is consumed as is.
+
+    :param rng: The seed or generator. See module documentation.
+    :type rng: None, int, numpy.random.SeedSequence or numpy.random.Generator
+    :return: The generator.
+    :rtype: numpy.random.Generator
+    '''
+
+    if isinstance(rng, np.random.Generator):
+        return rng
+
+    return np.random.default_rng(seedSequence(rng))
+#end getGenerator(rng=None)
+
+
+def _keyToInt(key):
+    '''
+    Converts a stream key to a non negative integer.
+    Strings are mapped with crc32 so that names are stable across runs and
+    platforms, and unlikely to clash with small integer keys.
+    '''
+
+    if isinstance(key, str):
+        return zlib.crc32(key.encode('utf-8')) + 2**32
+    if isinstance(key, (int, np.integer)) and key >= 0:
+        return int(key)
+
+    msg = 'cellSeedSequence: Unexpected parameter value for parameter ''key''.'
+    raise ValueError(msg)
+#end _keyToInt(key)
+
+
+def cellSeedSequence(root, *key):
+    '''
+    Gets the seed sequence of a cell addressed by a key.
+
+    The result only depends on the root entropy and the key, not on how
+    many streams were derived before; e.g. cellSeedSequence(1234, 3, 0, 2)
+    is the same on every worker.
+
+    :param root: The root seed. See module documentation.
+    :type root: None, int, numpy.random.SeedSequence or numpy.random.Generator
+    :param key: The cell key; non negative ints and/or str.
+    :return: The seed sequence of the cell.
+    :rtype: numpy.random.SeedSequence
+    '''
+
+    root = seedSequence(root)
+    spawnKey = tuple(root.spawn_key) + tuple(_keyToInt(k) for k in key)
+
+    return np.random.SeedSequence(root.entropy, spawn_key=spawnKey, pool_size=root.pool_size)
+#end cellSeedSequence(root, *key)
+
+
+def spawnGenerators(seed=None, n=1):
+    '''
+    Spawns n independent generators.
+
+    :param seed: The root seed. See module documentation.
+    :type seed: None, int, numpy.random.SeedSequence or numpy.random.Generator
+    :param n: Number of generators. Default is 1.
+    :type n: int (positive)
+    :return: The generators.
+    :rtype: list of numpy.random.Generator
+    '''
+
+    return [np.random.default_rng(s) for s in seedSequence(seed).spawn(n)]
+#end spawnGenerators(seed=None, n=1)
+
+
+def sourceGenerators(seed=None, sources=FNIRS_SOURCES):
+    '''
+    Gets one independent generator per named source.
+
+    :param seed: The root seed. See module documentation.
+    :type seed: None, int, numpy.random.SeedSequence or numpy.random.Generator
+    :param sources: The source names. Default is :data:`FNIRS_SOURCES`.
+    :type sources: tuple of str
+    :return: A dict mapping source names to generators.
+    :rtype: dict
+    '''
+
+    root = seedSequence(seed)
+
+    return {name: np.random.default_rng(cellSeedSequence(root, name)) for name in sources}
+#end sourceGenerators(seed=None, sources=FNIRS_SOURCES)
@@ -1,8 +1,6 @@
+import os
 import serial
-import time
-import struct
 
-import copy
 import numpy as np
 
 from EEGSignalGenerator import EEGSignalGenerator
@@ -11,6 +9,64 @@ from fNIRSSignalGenerator import fNIRSSignalGenerator
 
 from src.EEGSignalGenerator import plotSyntheticEEG
 
+from syntheticTextFormat import readSyntheticText
+
+from syntheticBinaryFormat import openSyntheticBinary
+
+
+REPLAY_BLOCK_SIZE = 1024 # [samples] sent per serial write
+
+
+def readReplayFile(fileName):
+    '''
+    Opens a replay file; the binary sidecar (.bin) if there is one, memory
+    mapped, otherwise the text file.
+
+    :param fileName: The text file.
+    :type fileName: str
+    :return: The data <nSamples x nChannels x nSignals> and the header text.
+    :rtype: tuple
+    '''
+
+    binaryFileName = fileName[:-4] + '.bin'
+    if os.path.exists(binaryFileName):
+        data, header = openSyntheticBinary(binaryFileName)
+        text = ''.join(key + ':\t' + str(value) + '\n' for key, value in header.items())
+        return data, text
+
+    data, header = readSyntheticText(fileName)
+    return data, header['text']
+#end readReplayFile(fileName)
+
+
+def sendData(ser, data, blockSize=REPLAY_BLOCK_SIZE):
+    '''
+    Sends data as float32, sample by sample and, within a sample, signal by
+    signal, the channels consecutive; one write per block of samples, so
+    memory mapped data are read block by block.
+
+    :param ser: The open serial port.
+    :type ser: serial.Serial
+    :param data: The data <nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param blockSize: Number of samples per write. Default is :data:`REPLAY_BLOCK_SIZE`.
+    :type blockSize: int (positive)
+    :return: Number of values not (completely) written.
+    :rtype: int
+    '''
+
+    numOfWrongSending = 0
+    for start in range(0, data.shape[0], blockSize):
+        block = np.ascontiguousarray(data[start:start + blockSize].transpose(0, 2, 1), dtype='<f4')
+        n = ser.write(block.tobytes())
+        if n is not None and n < block.nbytes:
+            print(block.nbytes - n, "Bytes no successfully written")
+            numOfWrongSending = numOfWrongSending + (block.nbytes - n + 3) // 4
+
+    return numOfWrongSending
+#end sendData(ser, data, blockSize=REPLAY_BLOCK_SIZE)
+
+
 def main():
     iD_Run = 1
     print(f'Run ID:       \t\t {iD_Run:03d}')
@@ -60,11 +116,10 @@ def main():
     print("File openning: ", fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime))
     print("-------------")
     print("")
-    fileIn = open(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime), "r")
+    eegData, header = readReplayFile(fileName.format(iD_Run, sgEEG.nChannels, sgEEG.samplingRate, samplingTime))
 
     print("File header:")
-    for i in range(6):
-        print(fileIn.readline(), end='')
+    print(header, end='')
     print("")
 
     if sgEEG.nSamples < sgfNIRS.nSamples:
@@ -75,17 +130,10 @@ def main():
     print("")
 
     print("File data:")
-    newData = np.zeros((sgEEG.nSamples, sgEEG.nChannels, 1),dtype=float)
-    for i in range(sgEEG.nSamples):
-        line = fileIn.readline()
-        line_list = line.split(", ")
-        newData[i, :, 0] = np.array(list( map(float, line_list) ))
-
-    fileIn.close()
-
-    sgEEG.data = copy.deepcopy(newData)
-    for i in range(sgEEG.nSamples):
-        print(sgEEG.data[i, :, 0])
+    #A slice; memory mapped data stay on disk
+    eegData = eegData[0:sgEEG.nSamples]
+    for i in range(eegData.shape[0]):
+        print(eegData[i, :, 0])
     print("")
     print("")
 
@@ -95,11 +143,10 @@ def main():
     print("File openning: ", fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime))
     print("-------------")
     print("")
-    fileIn = open(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime), "r")
+    fNIRSData, header = readReplayFile(fileName.format(iD_Run, sgfNIRS.nChannels, sgfNIRS.samplingRate, samplingTime))
 
     print("File header:")
-    for i in range(6):
-        print(fileIn.readline(), end='')
+    print(header, end='')
     print("")
 
     if sgfNIRS.nSamples < sgEEG.nSamples:
@@ -110,19 +157,10 @@ def main():
     print("")
 
     print("File data:")
-    newData = np.zeros((sgfNIRS.nSamples, sgfNIRS.nChannels, 2), dtype=float)
-    for i in range(sgfNIRS.nSamples):
+    fNIRSData = fNIRSData[0:sgfNIRS.nSamples]
+    for i in range(fNIRSData.shape[0]):
         for j in range(2):
-            line = fileIn.readline()
-            line_list = line.split(", ")
-            newData[i, :, j] = np.array(list( map(float, line_list) ))
-
-    fileIn.close()
-
-    sgfNIRS.data = copy.deepcopy(newData)
-    for i in range(sgfNIRS.nSamples):
-        for j in range(2):
-            print(sgfNIRS.data[i, :, j])
+            print(fNIRSData[i, :, j])
     print("")
     print("")
 
@@ -168,20 +206,7 @@ def main():
             # Send EEG data
             print("Send EEG data:")
             input("Press Enter to continue...")
-            numOfWrongSending = 0
-            for i in range(sgEEG.nSamples):
-                for j in range(sgEEG.nChannels):
-                    my_float = sgEEG.data[i, j, 0]
-                    my_data = struct.pack('f', my_float)
-                    #print(my_data, "Bytes of my data")
-
-                    n = ser.write(my_data)
-                    #print(n, "Bytes successfully written")
-                    if n < 4:
-                        print(4 - n, "Bytes no successfully written")
-                        numOfWrongSending = numOfWrongSending + 1
-
-                    time.sleep(0.0000005)  #give the serial port sometime to receive the data
+            numOfWrongSending = sendData(ser, eegData)
 
             print(f'Number of EEG data sent with loss of information: {numOfWrongSending}')
             input("Press Enter to continue...")
@@ -199,7 +224,7 @@ def main():
 
                 numOfData = numOfData + 1
 
-                if numOfData >= sgEEG.nSamples * sgEEG.nChannels:
+                if numOfData >= eegData.shape[0] * eegData.shape[1]:
                     break
 
             print(f'Number of EEG data: {numOfData}')
@@ -209,21 +234,7 @@ def main():
             # Send fNIRs data
             print("Send fNIRs data:")
             input("Press Enter to continue...")
-            numOfWrongSending = 0
-            for i in range(sgfNIRS.nSamples):
-                for k in range(2):
-                    for j in range(sgfNIRS.nChannels):
-                        my_float = sgfNIRS.data[i, j, k]
-                        my_data = struct.pack('f', my_float)
-                        #print(my_data, "Bytes of my data")
-
-                        n = ser.write(my_data)
-                        #print(n, "Bytes successfully written")
-                        if n < 4:
-                            print(4-n, "Bytes no successfully written")
-                            numOfWrongSending = numOfWrongSending + 1
-
-                        time.sleep(0.0000005)  # give the serial port sometime to receive the data
+            numOfWrongSending = sendData(ser, fNIRSData)
             print(f'Number of fNIRs data sent with loss of information: {numOfWrongSending}')
             input("Press Enter to continue...")
             print("")
@@ -240,7 +251,7 @@ def main():
 
                 numOfData = numOfData + 1
 
-                if numOfData >= sgfNIRS.nSamples * sgfNIRS.nChannels:
+                if numOfData >= fNIRSData.shape[0] * fNIRSData.shape[1]:
                     break
 
             print(f'Number of fNIRs data: {numOfData}')
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+#
+#File: sharedRingBuffer.py
+#
+'''
+Module ***sharedRingBuffer***
+
+Shared memory transport of synthetic EEG and fNIRS data for consumers on
+the same host (signal processing, visualization), without serial port or
+socket syscalls and copies.
+
+:class:`sharedRingBuffer` is a single-producer, multi-consumer ring buffer
+of samples <nChannels x nSignals> in a multiprocessing.shared_memory block.
+The producer (see :func:`streamToRing`) appends chunks, e.g. from
+:meth:`EEGSignalGenerator.streamChunks` or
+:meth:`fNIRSSignalGenerator.streamChunks`; any number of consumers attach
+to the block by name and read without locks.
+
+The ring is mirrored: sample s is stored at rows s % capacity and
+s % capacity + capacity of a buffer of 2*capacity rows, so any window of up
+to capacity consecutive samples is contiguous, and consumers get it as a
+(read only) numpy view, with no copy; see :meth:`sharedRingBuffer.latest`
+and :meth:`sharedRingBuffer.since`.
+
+Two sequence counters, the number of samples whose writing has started and
+the number of samples written, publish the progress of the producer.
+Samples are never locked; instead, a consumer checks after using a view
+whether the producer has since overwritten it (:meth:`sharedRingBuffer.isValid`),
+and :meth:`sharedRingBuffer.since` reports the samples a slow consumer
+missed. The counters are aligned 64-bit words, written with single stores.
+
+The block has a 64-byte header of 8 little-endian 64-bit words (magic,
+capacity, nChannels, nSignals, samples started, samples written, process
+ID of the resource tracker of the producer,
+sampling rate as float64), followed by the float64 data
+<2*capacity x nChannels x nSignals>.
+'''
+
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+RING_MAGIC = int.from_bytes(b'SYNSRING', 'little')
+HEADER_WORDS = 8
+HEADER_BYTES = 8 * HEADER_WORDS
+_CAPACITY, _NCHANNELS, _NSIGNALS, _STARTED, _WRITTEN, _TRACKER, _SAMPLINGRATE = 1, 2, 3, 4, 5, 6, 7
+
+
+def _trackerPID():
+    #Process ID of the resource tracker of this process, 0 if none
+    return getattr(resource_tracker._resource_tracker, '_pid', None) or 0
+#end _trackerPID()
+
+
+class sharedRingBuffer:
+    '''
+    Shared memory ring buffer of samples. The producer creates it
+    (create=True), consumers attach to it by name. Use as a context
+    manager, or call :meth:`close`.
+    '''
+
+    def __init__(self, name=None, create=False, capacity=None, nChannels=None, nSignals=1, samplingRate=1.0):
+        '''
+        :Parameters:
+        :param name: The shared memory block name. Optional when creating.
+            Default is None (a unique name; see :attr:`name`).
+        :type name: str or NoneType
+        :param create: Create the block (producer) rather than attach to
+            it (consumer). Default is False.
+        :type create: bool
+        :param capacity: Number of samples kept. Only when creating.
+        :type capacity: int (positive)
+        :param nChannels: Number of channels. Only when creating.
+        :type nChannels: int (positive)
+        :param nSignals: Number of signals; 1 for EEG and 2 for fNIRS. Only
+            when creating. Default is 1.
+        :type nSignals: int (positive)
+        :param samplingRate: The sampling rate [Hz]. Only when creating. Default is 1.
+        :type samplingRate: float
+        '''
+
+        if create:
+            #Check parameters
+            if type(capacity) is not int or capacity <= 0:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''capacity''.'
+                raise ValueError(msg)
+            if type(nChannels) is not int or nChannels <= 0:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nChannels''.'
+                raise ValueError(msg)
+            if type(nSignals) is not int or nSignals <= 0:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nSignals''.'
+                raise ValueError(msg)
+
+            size = HEADER_BYTES + 2 * capacity * nChannels * nSignals * 8
+            self.__memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.__header = np.ndarray((HEADER_WORDS,), dtype='<i8', buffer=self.__memory.buf)
+            self.__header[:] = 0
+            self.__header[_CAPACITY] = capacity
+            self.__header[_NCHANNELS] = nChannels
+            self.__header[_NSIGNALS] = nSignals
+            self.__header[_TRACKER] = _trackerPID()
+            self.__header[_SAMPLINGRATE:_SAMPLINGRATE + 1].view('<f8')[0] = samplingRate
+            self.__header[0] = RING_MAGIC
+        else:
+            if name is None:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''name''.'
+                raise ValueError(msg)
+            try:
+                self.__memory = shared_memory.SharedMemory(name=name, create=False, track=False)
+            except TypeError:
+                #Before Python 3.13 attaching registers the block with the resource
+                #tracker, which unlinks it on exit; only the producer owns it. A
+                #tracker shared with the producer (child processes) is left alone
+                self.__memory = shared_memory.SharedMemory(name=name, create=False)
+                header = np.ndarray((HEADER_WORDS,), dtype='<i8', buffer=self.__memory.buf)
+                if header[_TRACKER] != _trackerPID():
+                    resource_tracker.unregister(self.__memory._name, 'shared_memory')
+                del header
+            self.__header = np.ndarray((HEADER_WORDS,), dtype='<i8', buffer=self.__memory.buf)
+            if self.__header[0] != RING_MAGIC:
+                self.__header = None
+                self.__memory.close()
+                msg = self.getClassName() + ':__init__: ' + name + ' is not a shared ring buffer.'
+                raise ValueError(msg)
+
+        self.__owner = create
+        self.__capacity = int(self.__header[_CAPACITY])
+        shape = (2 * self.__capacity, int(self.__header[_NCHANNELS]), int(self.__header[_NSIGNALS]))
+        self.__data = np.ndarray(shape, dtype='<f8', buffer=self.__memory.buf, offset=HEADER_BYTES)
+    #end __init__(self, name=None, create=False, ...)
+
+
+    @property
+    def name(self): #name getter
+        '''
+        The shared memory block name, to attach consumers.
+
+        :getter: Gets the name.
+        :type: str
+        '''
+
+        return self.__memory.name
+    #end name(self)
+
+
+    @property
+    def capacity(self): #capacity getter
+        '''
+        Number of samples kept.
+
+        :getter: Gets the capacity.
+        :type: int
+        '''
+
+        return self.__capacity
+    #end capacity(self)
+
+
+    @property
+    def nChannels(self): #nChannels getter
+        '''
+        Number of channels.
+
+        :getter: Gets the number of channels.
+        :type: int
+        '''
+
+        return self.__data.shape[1]
+    #end nChannels(self)
+
+
+    @property
+    def nSignals(self): #nSignals getter
+        '''
+        Number of signals.
+
+        :getter: Gets the number of signals.
+        :type: int
+        '''
+
+        return self.__data.shape[2]
+    #end nSignals(self)
+
+
+    @property
+    def samplingRate(self): #samplingRate getter
+        '''
+        The sampling rate [Hz].
+
+        :getter: Gets the sampling rate.
+        :type: float
+        '''
+
+        return float(self.__header[_SAMPLINGRATE:_SAMPLINGRATE + 1].view('<f8')[0])
+    #end samplingRate(self)
+
+
+    @property
+    def sequence(self): #sequence getter
+        '''
+        Number of samples written so far, i.e. the sequence number of the
+        next sample.
+
+        :getter: Gets the number of samples.
+        :type: int
+        '''
+
+        return int(self.__header[_WRITTEN])
+    #end sequence(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def write(self, chunk):
+        '''
+        Appends a chunk of samples (producer only). Of a chunk longer than
+        the capacity, only the last capacity samples are kept.
+
+        :param chunk: The data <nSamples x nChannels x nSignals>.
+        :type chunk: numpy.ndarray
+        :return: The sequence number of the next sample.
+        :rtype: int
+        '''
+
+        #Check parameters
+        if not self.__owner:
+            msg = self.getClassName() + ':write: Only the producer (create=True) writes.'
+            raise ValueError(msg)
+        chunk = np.asarray(chunk)
+        if chunk.ndim != 3 or chunk.shape[1:] != self.__data.shape[1:]:
+            msg = self.getClassName() + ':write: Unexpected parameter value for parameter ''chunk''. Expected <nSamples x ' \
+                  + str(self.nChannels) + ' x ' + str(self.nSignals) + '>.'
+            raise ValueError(msg)
+
+        capacity = self.__capacity
+        start = int(self.__header[_WRITTEN])
+        end = start + chunk.shape[0]
+        if chunk.shape[0] > capacity:
+            chunk = chunk[-capacity:]
+            start = end - capacity
+
+        #Announce the samples first, so that readers of the rows about to be
+        #overwritten see their views invalidated
+        self.__header[_STARTED] = end
+        row = start % capacity
+        n = min(chunk.shape[0], capacity - row)
+        #Both mirrors; the wrapped part goes to the start of each
+        self.__data[row:row + n] = chunk[0:n]
+        self.__data[row + capacity:row + capacity + n] = chunk[0:n]
+        if n < chunk.shape[0]:
+            self.__data[0:chunk.shape[0] - n] = chunk[n:]
+            self.__data[capacity:capacity + chunk.shape[0] - n] = chunk[n:]
+        self.__header[_WRITTEN] = end
+
+        return end
+    #end write(self, chunk)
+
+
+    def __view(self, first, last):
+        #Samples [first, last), last - first <= capacity, as a contiguous view
+        row = first % self.__capacity
+        view = self.__data[row:row + last - first]
+        view.flags.writeable = False
+        return view
+    #end __view(self, first, last)
+
+
+    def latest(self, nSamples):
+        '''
+        Gets the latest samples, as a view of the shared memory (no copy).
+        The view is valid as long as :meth:`isValid` holds.
+
+        :param nSamples: Number of samples; fewer if fewer were written.
+        :type nSamples: int (0 to capacity)
+        :return: The view <nSamples x nChannels x nSignals> and the sequence
+            number of its first sample.
+        :rtype: tuple
+        '''
+
+        #Check parameters
+        if type(nSamples) is not int or not (0 <= nSamples <= self.__capacity):
+            msg = self.getClassName() + ':latest: Unexpected parameter value for parameter ''nSamples''.'
+            raise ValueError(msg)
+
+        last = int(self.__header[_WRITTEN])
+        first = max(0, last - nSamples)
+
+        return self.__view(first, last), first
+    #end latest(self, nSamples)
+
+
+    def since(self, sequence, maxSamples=None):
+        '''
+        Gets the samples written since a sequence number, as a view of the
+        shared memory (no copy). A consumer reading continuously passes the
+        sequence number following the last sample it read; if the returned
+        first sequence number is greater, samples were overwritten before
+        being read (an overrun) and the difference is the number missed.
+
+        :param sequence: Sequence number of the first sample wanted.
+        :type sequence: int
+        :param maxSamples: Maximum number of samples. Optional. Default is
+            None (up to the capacity).
+        :type maxSamples: int or NoneType
+        :return: The view <nSamples x nChannels x nSignals> and the sequence
+            number of its first sample.
+        :rtype: tuple
+        '''
+
+        if maxSamples is None or maxSamples > self.__capacity:
+            maxSamples = self.__capacity
+        written = int(self.__header[_WRITTEN])
+        #Samples that may already be being overwritten are skipped
+        oldest = int(self.__header[_STARTED]) - self.__capacity
+        first = max(sequence, oldest, 0)
+        last = min(written, first + maxSamples)
+        first = min(first, last)
+
+        return self.__view(first, last), first
+    #end since(self, sequence, maxSamples=None)
+
+
+    def isValid(self, first):
+        '''
+        Checks whether the samples from a sequence number on are still
+        intact, i.e. not (being) overwritten. Call it after using a view of
+        :meth:`latest` or :meth:`since` to validate what was read.
+
+        :param first: Sequence number of the first sample of the view.
+        :type first: int
+        :return: True if the view was not overwritten.
+        :rtype: bool
+        '''
+
+        return int(self.__header[_STARTED]) - first <= self.__capacity
+    #end isValid(self, first)
+
+
+    def copyLatest(self, nSamples, retries=3):
+        '''
+        Gets a consistent copy of the latest samples, retrying if the
+        producer overwrote them while being copied.
+
+        :param nSamples: Number of samples; fewer if fewer were written.
+        :type nSamples: int (0 to capacity)
+        :param retries: Number of attempts. Default is 3.
+        :type retries: int (positive)
+        :return: The data <nSamples x nChannels x nSignals> and the sequence
+            number of its first sample.
+        :rtype: tuple
+        '''
+
+        for attempt in range(retries):
+            view, first = self.latest(nSamples)
+            data = view.copy()
+            if self.isValid(first):
+                return data, first
+
+        msg = self.getClassName() + ':copyLatest: The producer overwrote the samples ' + str(retries) + ' times in a row.'
+        raise RuntimeError(msg)
+    #end copyLatest(self, nSamples, retries=3)
+
+
+    def close(self):
+        '''
+        Detaches from the shared memory and, for the producer, frees it.
+        Views obtained from the buffer must have been released.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__memory is not None:
+            self.__header = None
+            self.__data = None
+            self.__memory.close()
+            if self.__owner:
+                self.__memory.unlink()
+            self.__memory = None
+    #end close(self)
+
+
+    def __enter__(self):
+        return self
+    #end __enter__(self)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    #end __exit__(self, excType, excValue, traceback)
+
+#class sharedRingBuffer
+
+
+def streamToRing(generator, ring, chunkDuration=0.1, nRecordings=None, rng=None, realTime=True, **kwargs):
+    '''
+    Streams a generator into a ring buffer (producer side); see
+    :meth:`EEGSignalGenerator.streamChunks` and
+    :meth:`fNIRSSignalGenerator.streamChunks`.
+
+    :param generator: The generator.
+    :type generator: EEGSignalGenerator or fNIRSSignalGenerator
+    :param ring: The ring buffer, created with the number of channels and
+        signals of the chunks of the generator; note that
+        :meth:`fNIRSSignalGenerator.execute` always yields 4 channels.
+    :type ring: sharedRingBuffer
+    :param chunkDuration: Duration [s] of a chunk. Default is 0.1.
+    :type chunkDuration: float (positive)
+    :param nRecordings: Number of recordings. Optional. Default is None (endless).
+    :type nRecordings: int or NoneType
+    :param rng: Random generator or seed. Optional. Default is None
+        (fresh unpredictable stream).
+    :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+    :param realTime: Pace the chunks at the sampling rate; if False they are
+        written as fast as they are synthesized. Default is True.
+    :type realTime: bool
+    :param kwargs: Other parameters of the streamChunks method of the
+        generator, e.g. the noise sources of :meth:`fNIRSSignalGenerator.execute`.
+    :return: Number of samples written.
+    :rtype: int
+    :raises ValueError: If the chunks do not fit the samples of the ring.
+    '''
+
+    samplingRate = generator.samplingRate
+    chunkSize = max(1, int(round(samplingRate * chunkDuration)))
+    nWritten = 0
+    startTime = time.monotonic()
+    for chunk in generator.streamChunks(chunkSize=chunkSize, nRecordings=nRecordings, rng=rng, **kwargs):
+        if nWritten == 0 and chunk.shape[1:] != (ring.nChannels, ring.nSignals):
+            msg = 'streamToRing: The generator yields samples <' + ' x '.join(str(n) for n in chunk.shape[1:]) \
+                  + '> but the ring holds samples <' + str(ring.nChannels) + ' x ' + str(ring.nSignals) \
+                  + '>. Create the ring with nChannels=' + str(chunk.shape[1]) + ' and nSignals=' \
+                  + str(chunk.shape[2]) + '.'
+            raise ValueError(msg)
+        nWritten += chunk.shape[0]
+        if realTime:
+            #Written when its last sample is due, against the start so errors do not accumulate
+            delay = startTime + nWritten / samplingRate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        ring.write(chunk)
+
+    return nWritten
+#end streamToRing(generator, ring, chunkDuration=0.1, ...)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+#File: signalFilters.py
+#
+'''
+Module ***signalFilters***
+
+Zero-phase and streaming filters for fNIRS and EEG data tensors.
+
+Filters are designed as Butterworth second-order sections (SOS), which
+stay stable at the very low cut-off frequencies of fNIRS (e.g. 0.01 Hz at
+10 Hz), and are memoized by (order, band, samplingRate, btype); the
+designs are read only and shared.
+
+:func:`filtfilt` applies a zero-phase filter (scipy.signal.sosfiltfilt)
+along the time axis of a whole tensor <nSamples x nChannels x nSignals>
+or a batch <... x nSamples x nChannels x nSignals> in one call.
+:class:`streamFilter` filters a stream chunk by chunk, carrying the filter
+state over; being causal it is not zero-phase.
+'''
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal
+
+
+FNIRS_BAND = (0.01, 0.5) # [Hz] Removes the drift and the heart beat
+EEG_BAND = (0.5, 40.0) # [Hz] From delta to gamma
+
+
+@lru_cache(maxsize=32)
+def _design(order, band, samplingRate, btype):
+    sos = scipy.signal.butter(order, band, btype=btype, output='sos', fs=samplingRate)
+    sos.flags.writeable = False
+    return sos
+#end _design(order, band, samplingRate, btype)
+
+
+def designFilter(band, samplingRate, order=4, btype=None):
+    '''
+    Gets a Butterworth filter in second-order sections. Designs are cached.
+
+    :param band: Cut-off frequency [Hz], or (low, high) for a band.
+    :type band: float or tuple
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float (positive)
+    :param order: The filter order. Default is 4.
+    :type order: int (positive)
+    :param btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'.
+        Optional. Default is None ('lowpass' for a cut-off frequency and
+        'bandpass' for a band).
+    :type btype: str or NoneType
+    :return: The (read only) SOS <nSections x 6>.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if type(order) is not int or order <= 0:
+        msg = 'designFilter: Unexpected parameter value for parameter ''order''.'
+        raise ValueError(msg)
+    if samplingRate <= 0:
+        msg = 'designFilter: Unexpected parameter value for parameter ''samplingRate''.'
+        raise ValueError(msg)
+    band = tuple(float(f) for f in np.atleast_1d(band))
+    if len(band) not in (1, 2) or not all(0 < f < samplingRate/2 for f in band) or \
+            (len(band) == 2 and band[0] >= band[1]):
+        msg = 'designFilter: Unexpected parameter value for parameter ''band''. Frequencies must be increasing and below the Nyquist frequency.'
+        raise ValueError(msg)
+    if btype is None:
+        btype = 'lowpass' if len(band) == 1 else 'bandpass'
+    if btype not in ('lowpass', 'highpass', 'bandpass', 'bandstop') or \
+            (len(band) == 2) != (btype in ('bandpass', 'bandstop')):
+        msg = 'designFilter: Unexpected parameter value for parameter ''btype''.'
+        raise ValueError(msg)
+
+    return _design(order, band if len(band) == 2 else band[0], float(samplingRate), btype)
+#end designFilter(band, samplingRate, order=4, btype=None)
+
+
+def filtfilt(data, band, samplingRate, order=4, btype=None, axis=-3):
+    '''
+    Zero-phase filters a data tensor along its time axis.
+
+    :param data: The data, e.g. <nSamples x nChannels x nSignals> or
+        <nSubjects x nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param band, samplingRate, order, btype: The filter; see :func:`designFilter`.
+    :param axis: The time axis. Default is -3.
+    :type axis: int
+    :return: The filtered data (a new array).
+    :rtype: numpy.ndarray
+    '''
+
+    sos = designFilter(band, samplingRate, order, btype)
+    data = np.asarray(data, dtype=float)
+    #Same default padding as sosfiltfilt
+    padlen = 3 * (2*len(sos) + 1 - min(np.count_nonzero(sos[:, 2] == 0), np.count_nonzero(sos[:, 5] == 0)))
+    if data.shape[axis] <= padlen:
+        msg = 'filtfilt: Unexpected parameter value for parameter ''data''. At least ' + str(padlen+1) + ' samples are required.'
+        raise ValueError(msg)
+
+    #scipy needs a writeable copy of the (tiny) shared design
+    return scipy.signal.sosfiltfilt(sos.copy(), data, axis=axis)
+#end filtfilt(data, band, samplingRate, order=4, btype=None, axis=-3)
+
+
+class streamFilter:
+    '''
+    Causal filter of a stream of chunks <nSamples x nChannels x nSignals>
+    (or batches thereof). The filter state is carried over from chunk to
+    chunk, so the output is the same as filtering the whole stream at once
+    with scipy.signal.sosfilt. The state is initialized to the steady state
+    of the first sample.
+    '''
+
+    def __init__(self, band, samplingRate, order=4, btype=None, axis=-3):
+        '''
+        :Parameters:
+        :param band, samplingRate, order, btype: The filter; see :func:`designFilter`.
+        :param axis: The time axis of the chunks. Default is -3.
+        :type axis: int
+        '''
+
+        self.__sos = designFilter(band, samplingRate, order, btype).copy()
+        self.__axis = axis
+        self.__zi = None
+    #end __init__(self, band, samplingRate, order=4, btype=None, axis=-3)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def reset(self):
+        '''
+        Clears the filter state; the next chunk starts a new stream.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        self.__zi = None
+    #end reset(self)
+
+
+    def process(self, chunk):
+        '''
+        Filters the next chunk of the stream.
+
+        :param chunk: The chunk; all chunks must have the same shape but
+            along the time axis.
+        :type chunk: numpy.ndarray
+        :return: The filtered chunk.
+        :rtype: numpy.ndarray
+        '''
+
+        chunk = np.asarray(chunk, dtype=float)
+        axis = self.__axis % chunk.ndim
+        if chunk.shape[axis] == 0:
+            return chunk.copy()
+        if self.__zi is None:
+            shape = [1] * chunk.ndim
+            shape[axis] = 2
+            zi = scipy.signal.sosfilt_zi(self.__sos)
+            self.__zi = zi.reshape((zi.shape[0],) + tuple(shape)) * np.take(chunk, [0], axis=axis)[None]
+        elif self.__zi.shape[1:axis+1] + self.__zi.shape[axis+2:] != chunk.shape[:axis] + chunk.shape[axis+1:]:
+            msg = self.getClassName() + ':process: Unexpected parameter value for parameter ''chunk''. The shape changed.'
+            raise ValueError(msg)
+
+        filtered, self.__zi = scipy.signal.sosfilt(self.__sos, chunk, axis=axis, zi=self.__zi)
+
+        return filtered
+    #end process(self, chunk)
+
+#class streamFilter
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+#File: snirfWriter.py
+#
+'''
+Module ***snirfWriter***
+
+SNIRF export of synthetic fNIRS data.
+
+:class:`snirfWriter` creates a SNIRF file (HDF5) for a
+:class:`fNIRSSignalGenerator` (or any :class:`channelLocationMap`): the
+probe (/nirs/probe/sourcePos2D|3D, detectorPos2D|3D, wavelengths) and one
+/nirs/data1/measurementListK per channel and signal are filled from the
+channel location map geometry, and /nirs/data1/dataTimeSeries and time are
+chunked, compressed datasets that grow as chunks are appended. A recording
+can hence be written in streaming mode, chunk by chunk, in constant memory.
+
+Data tensors are <nSamples x nChannels x nSignals>. The signals are either
+the [HbO2, HHb] concentration changes of :meth:`fNIRSSignalGenerator.execute`
+(dataType 99999, processed) or the raw intensities per wavelength of
+:meth:`fNIRSSignalGenerator.rawIntensities` (dataType 1, continuous wave).
+Measurement k*nChannels + c holds signal k of channel c, i.e. the columns
+of dataTimeSeries are grouped by signal, as read by
+:meth:`fNIRSSignalGenerator.import_datums`.
+'''
+
+import datetime
+
+import h5py
+import numpy as np
+
+
+SNIRF_FORMAT_VERSION = '1.0'
+DATA_TYPE_CW_AMPLITUDE = 1
+DATA_TYPE_PROCESSED = 99999
+HEMOGLOBIN_LABELS = ('HbO', 'HbR')
+
+
+class snirfWriter:
+    '''
+    Streaming SNIRF writer. Use as a context manager, or call :meth:`close`.
+    '''
+
+    def __init__(self, fileName, channelMap, samplingRate, wavelengths=(760, 850), \
+                 hemoglobin=True, lengthUnit='cm', subjectID='synthetic', \
+                 chunkSize=1024, compression='gzip', compressionLevel=4):
+        '''
+        :Parameters:
+        :param fileName: The SNIRF file to create (overwritten).
+        :type fileName: str
+        :param channelMap: The channel location map; e.g. the generator.
+        :type channelMap: channelLocationMap
+        :param samplingRate: The sampling rate [Hz].
+        :type samplingRate: float (positive)
+        :param wavelengths: The wavelengths [nm] of the probe. Default is (760, 850).
+        :type wavelengths: tuple, list or numpy.ndarray
+        :param hemoglobin: True if the signals are [HbO2, HHb] concentration
+            changes [µM]; False if they are the raw intensities at each
+            wavelength. Default is True.
+        :type hemoglobin: bool
+        :param lengthUnit: Unit of the optodes locations. Default is 'cm'.
+        :type lengthUnit: str
+        :param subjectID: The SubjectID metadata tag. Default is 'synthetic'.
+        :type subjectID: str
+        :param chunkSize: Number of samples per HDF5 chunk. Default is 1024.
+        :type chunkSize: int (positive)
+        :param compression: HDF5 compression filter, or None. Default is 'gzip'.
+        :type compression: str or NoneType
+        :param compressionLevel: The gzip level. Default is 4.
+        :type compressionLevel: int
+        '''
+
+        #Check parameters
+        if samplingRate <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''samplingRate''.'
+            raise ValueError(msg)
+        if type(chunkSize) is not int or chunkSize <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''chunkSize''.'
+            raise ValueError(msg)
+        wavelengths = np.asarray(wavelengths, dtype=float).ravel()
+        if not hemoglobin and len(wavelengths) == 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''wavelengths''.'
+            raise ValueError(msg)
+        pairings = np.asarray(channelMap.pairings, dtype=float)
+        if np.any(np.isnan(pairings)):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''channelMap''. All channels must pair known optodes.'
+            raise ValueError(msg)
+        pairings = pairings.astype(int)
+
+        self.__samplingRate = float(samplingRate)
+        self.__nChannels = pairings.shape[0]
+        self.__nSignals = 2 if hemoglobin else len(wavelengths)
+        self.__nWritten = 0
+        nMeasurements = self.__nChannels * self.__nSignals
+
+        #Sources and detectors, numbered from 1 in order of optode
+        sources, sourceIndex = np.unique(pairings[:, 0], return_inverse=True)
+        detectors, detectorIndex = np.unique(pairings[:, 1], return_inverse=True)
+        locations = np.asarray(channelMap.optodesLocations, dtype=float)
+
+        self.__file = h5py.File(fileName, 'w')
+        try:
+            self.__file['formatVersion'] = SNIRF_FORMAT_VERSION
+            nirs = self.__file.create_group('nirs')
+            now = datetime.datetime.now()
+            meta = nirs.create_group('metaDataTags')
+            for tag, value in (('SubjectID', subjectID), ('MeasurementDate', now.strftime('%Y-%m-%d')), \
+                               ('MeasurementTime', now.strftime('%H:%M:%S')), ('LengthUnit', lengthUnit), \
+                               ('TimeUnit', 's'), ('FrequencyUnit', 'Hz')):
+                meta[tag] = value
+
+            probe = nirs.create_group('probe')
+            probe['wavelengths'] = wavelengths
+            probe['sourcePos3D'] = locations[sources]
+            probe['detectorPos3D'] = locations[detectors]
+            probe['sourcePos2D'] = locations[sources, 0:2]
+            probe['detectorPos2D'] = locations[detectors, 0:2]
+
+            data = nirs.create_group('data1')
+            self.__dataTimeSeries = data.create_dataset('dataTimeSeries', shape=(0, nMeasurements), \
+                                                        maxshape=(None, nMeasurements), dtype=float, \
+                                                        chunks=(chunkSize, nMeasurements), compression=compression, \
+                                                        compression_opts=compressionLevel if compression == 'gzip' else None, \
+                                                        shuffle=compression is not None)
+            self.__time = data.create_dataset('time', shape=(0,), maxshape=(None,), dtype=float, \
+                                              chunks=(chunkSize,), compression=compression, \
+                                              compression_opts=compressionLevel if compression == 'gzip' else None)
+            for k in range(self.__nSignals):
+                for c in range(self.__nChannels):
+                    measurement = data.create_group('measurementList' + str(k*self.__nChannels + c + 1))
+                    measurement['sourceIndex'] = int(sourceIndex[c] + 1)
+                    measurement['detectorIndex'] = int(detectorIndex[c] + 1)
+                    if hemoglobin:
+                        measurement['wavelengthIndex'] = 1
+                        measurement['dataType'] = DATA_TYPE_PROCESSED
+                        measurement['dataTypeLabel'] = HEMOGLOBIN_LABELS[k]
+                    else:
+                        measurement['wavelengthIndex'] = k + 1
+                        measurement['dataType'] = DATA_TYPE_CW_AMPLITUDE
+                    measurement['dataTypeIndex'] = 1
+        except BaseException:
+            self.__file.close()
+            raise
+    #end __init__(self, fileName, channelMap, samplingRate, ...)
+
+
+    @property
+    def nWritten(self): #nWritten getter
+        '''
+        Number of samples written so far.
+
+        :getter: Gets the number of samples.
+        :type: int
+        '''
+
+        return self.__nWritten
+    #end nWritten(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def append(self, chunk):
+        '''
+        Appends a chunk of samples.
+
+        :param chunk: The data <nSamples x nChannels x nSignals>.
+        :type chunk: numpy.ndarray
+        :return: None
+        :rtype: NoneType
+        '''
+
+        #Check parameters
+        if self.__file is None:
+            msg = self.getClassName() + ':append: The file is closed.'
+            raise ValueError(msg)
+        chunk = np.asarray(chunk, dtype=float)
+        if chunk.ndim != 3 or chunk.shape[1:] != (self.__nChannels, self.__nSignals):
+            msg = self.getClassName() + ':append: Unexpected parameter value for parameter ''chunk''. Expected <nSamples x ' \
+                  + str(self.__nChannels) + ' x ' + str(self.__nSignals) + '>.'
+            raise ValueError(msg)
+
+        n = chunk.shape[0]
+        start = self.__nWritten
+        #<nSamples x nSignals x nChannels>, flattened; the columns grouped by signal
+        rows = chunk.transpose(0, 2, 1).reshape(n, -1)
+        self.__dataTimeSeries.resize(start + n, axis=0)
+        self.__dataTimeSeries[start:start + n] = rows
+        self.__time.resize(start + n, axis=0)
+        self.__time[start:start + n] = np.arange(start, start + n) / self.__samplingRate
+        self.__nWritten = start + n
+    #end append(self, chunk)
+
+
+    def close(self):
+        '''
+        Flushes and closes the file.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+    #end close(self)
+
+
+    def __enter__(self):
+        return self
+    #end __enter__(self)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    #end __exit__(self, excType, excValue, traceback)
+
+#class snirfWriter
+
+
+def writeSnirf(fileName, generator, data=None, wavelengths=(760, 850), hemoglobin=True, **kwargs):
+    '''
+    Writes a whole data tensor of a generator to a SNIRF file. See
+    :class:`snirfWriter` for the other parameters.
+
+    :param fileName: The SNIRF file to create (overwritten).
+    :type fileName: str
+    :param generator: The generator; its geometry and sampling rate are written.
+    :type generator: fNIRSSignalGenerator
+    :param data: The data <nSamples x nChannels x nSignals>. Optional.
+        Default is None (generator.data).
+    :type data: numpy.ndarray or NoneType
+    :return: None
+    :rtype: NoneType
+    '''
+
+    if data is None:
+        data = generator.data
+    with snirfWriter(fileName, generator, generator.samplingRate, wavelengths=wavelengths, \
+                     hemoglobin=hemoglobin, **kwargs) as writer:
+        writer.append(data)
+#end writeSnirf(fileName, generator, data=None, ...)
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+#
+#File: streamingServer.py
+#
+'''
+Module ***streamingServer***
+
+Local TCP publish/subscribe server of live synthetic EEG and fNIRS data.
+
+:class:`streamingServer` runs the generators in streaming mode (see
+:meth:`EEGSignalGenerator.streamChunks` and
+:meth:`fNIRSSignalGenerator.streamChunks`) and broadcasts their chunks,
+paced at the true sampling rates, to every connected client. The synthesis
+runs in a worker thread so the event loop only moves bytes.
+
+Every chunk is encoded once as a frame, shared by all clients. A frame is a
+32-byte little-endian header::
+
+    magic                 4s   b'SYNS'
+    stream ID             u1   index of the generator in the server
+    number of signals     u1   1 for EEG, 2 (HbO2, HHb) for fNIRS
+    number of channels    u2
+    number of samples     u4   in this frame
+    sequence              u8   index of the first sample in the stream
+    sampling rate [Hz]    f8
+
+followed by the chunk <nSamples x nChannels x nSignals> in C order as
+little-endian float32 (as :mod:`syntheticBinaryFormat`).
+
+Each client has a bounded queue of frames. When a client does not keep up
+and its queue is full, the oldest frame is dropped (see
+:attr:`streamingServer.nDropped`); a slow client hence never delays the
+generators or the other clients. Gaps are visible to the client as jumps
+in the frame sequence numbers.
+
+:func:`subscribe` is a minimal client.
+'''
+
+import asyncio
+import struct
+
+import numpy as np
+
+from rngStreams import seedSequence
+
+from EEGSignalGenerator import EEGSignalGenerator
+
+from fNIRSdatagen import fNIRSSignalGenerator
+
+
+FRAME_MAGIC = b'SYNS'
+FRAME_HEADER = struct.Struct('<4sBBHIQd')
+FRAME_DTYPE = '<f4'
+DEFAULT_PORT = 5555
+DEFAULT_QUEUE_SIZE = 64 # [frames] per client
+DEFAULT_CHUNK_DURATION = 0.1 # [s] per frame
+PREFETCH_DURATION = 5.0 # [s] of data synthesized ahead of the broadcast
+SHUTDOWN_TIMEOUT = 1.0 # [s] to flush the queues of the clients on shutdown
+
+
+def encodeFrame(streamID, sequence, samplingRate, chunk):
+    '''
+    Encodes a chunk as a frame.
+
+    :param streamID: The stream identifier.
+    :type streamID: int (0 to 255)
+    :param sequence: Index of the first sample of the chunk in the stream.
+    :type sequence: int
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float
+    :param chunk: The data <nSamples x nChannels x nSignals>.
+    :type chunk: numpy.ndarray
+    :return: The frame.
+    :rtype: bytes
+    '''
+
+    nSamples, nChannels, nSignals = chunk.shape
+    header = FRAME_HEADER.pack(FRAME_MAGIC, streamID, nSignals, nChannels, nSamples, sequence, float(samplingRate))
+
+    return header + np.ascontiguousarray(chunk, dtype=FRAME_DTYPE).tobytes()
+#end encodeFrame(streamID, sequence, samplingRate, chunk)
+
+
+def decodeFrameHeader(header):
+    '''
+    Decodes the header of a frame.
+
+    :param header: The FRAME_HEADER.size bytes of the header.
+    :type header: bytes
+    :return: The stream ID, sequence, sampling rate and the shape of the
+        chunk (nSamples, nChannels, nSignals).
+    :rtype: tuple
+    '''
+
+    magic, streamID, nSignals, nChannels, nSamples, sequence, samplingRate = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        msg = 'decodeFrameHeader: Unexpected frame header.'
+        raise ValueError(msg)
+
+    return streamID, sequence, samplingRate, (nSamples, nChannels, nSignals)
+#end decodeFrameHeader(header)
+
+
+async def subscribe(host='127.0.0.1', port=DEFAULT_PORT):
+    '''
+    Connects to a :class:`streamingServer` and iterates over its frames.
+
+    :param host: The server host. Default is '127.0.0.1'.
+    :type host: str
+    :param port: The server port. Default is :data:`DEFAULT_PORT`.
+    :type port: int
+    :return: An asynchronous iterator of (streamID, sequence, samplingRate,
+        chunk <nSamples x nChannels x nSignals>).
+    :rtype: async_generator
+    '''
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                header = await reader.readexactly(FRAME_HEADER.size)
+            except asyncio.IncompleteReadError:
+                return
+            streamID, sequence, samplingRate, shape = decodeFrameHeader(header)
+            body = await reader.readexactly(int(np.prod(shape)) * np.dtype(FRAME_DTYPE).itemsize)
+            yield streamID, sequence, samplingRate, np.frombuffer(body, dtype=FRAME_DTYPE).reshape(shape)
+    finally:
+        writer.close()
+#end subscribe(host='127.0.0.1', port=DEFAULT_PORT)
+
+
+class streamingServer:
+    '''
+    Asyncio TCP server broadcasting the streams of synthetic data
+    generators. Run with :meth:`serve`, e.g. asyncio.run(server.serve()).
+    '''
+
+    def __init__(self, generators, host='127.0.0.1', port=DEFAULT_PORT, queueSize=DEFAULT_QUEUE_SIZE, \
+                 chunkDuration=DEFAULT_CHUNK_DURATION, rng=None, realTime=True, streamOptions=None):
+        '''
+        :Parameters:
+        :param generators: The generators; e.g. an EEGSignalGenerator and an
+            fNIRSSignalGenerator. The index of a generator is its stream ID.
+        :type generators: list or tuple
+        :param host: The interface to listen on. Default is '127.0.0.1' (local only).
+        :type host: str
+        :param port: The port; 0 for any free port (see :attr:`port`).
+            Default is :data:`DEFAULT_PORT`.
+        :type port: int
+        :param queueSize: Number of frames queued per client before dropping
+            the oldest. Default is :data:`DEFAULT_QUEUE_SIZE`.
+        :type queueSize: int (positive)
+        :param chunkDuration: Duration [s] of a frame. Default is :data:`DEFAULT_CHUNK_DURATION`.
+        :type chunkDuration: float (positive)
+        :param rng: Random generator or seed; one child stream per generator.
+            Optional. Default is None (fresh unpredictable streams).
+        :type rng: numpy.random.Generator, numpy.random.SeedSequence, int or NoneType
+        :param realTime: Pace the frames at the sampling rates; if False
+            they are broadcast as fast as they are synthesized. Default is True.
+        :type realTime: bool
+        :param streamOptions: Parameters of the streamChunks method of each
+            generator, e.g. the noise sources of :meth:`fNIRSSignalGenerator.execute`
+            (with none enabled the fNIRS data are zeros). One dict, or None, per
+            generator. Optional. Default is None (no parameters).
+        :type streamOptions: list, tuple or NoneType
+        '''
+
+        #Check parameters
+        if len(generators) == 0 or len(generators) > 256:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''generators''.'
+            raise ValueError(msg)
+        if type(queueSize) is not int or queueSize <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''queueSize''.'
+            raise ValueError(msg)
+        if chunkDuration <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''chunkDuration''.'
+            raise ValueError(msg)
+        if streamOptions is None:
+            streamOptions = [None] * len(generators)
+        if len(streamOptions) != len(generators) \
+                or not all(options is None or isinstance(options, dict) for options in streamOptions):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''streamOptions''.'
+            raise ValueError(msg)
+
+        self.__generators = list(generators)
+        self.__host = host
+        self.__port = port
+        self.__queueSize = queueSize
+        self.__chunkDuration = chunkDuration
+        self.__rng = rng
+        self.__realTime = realTime
+        self.__streamOptions = [dict() if options is None else dict(options) for options in streamOptions]
+        self.__clients = dict() # queue -> (task, writer) of the client
+        self.__nDropped = 0
+        self.__nFrames = 0
+        self.__server = None
+    #end __init__(self, generators, host='127.0.0.1', ...)
+
+
+    @property
+    def port(self): #port getter
+        '''
+        The port; once started (see :meth:`start`), the one actually bound.
+
+        :getter: Gets the port.
+        :type: int
+        '''
+
+        if self.__server is not None and self.__server.sockets:
+            return self.__server.sockets[0].getsockname()[1]
+        return self.__port
+    #end port(self)
+
+
+    @property
+    def nClients(self): #nClients getter
+        '''
+        Number of connected clients.
+
+        :getter: Gets the number of clients.
+        :type: int
+        '''
+
+        return len(self.__clients)
+    #end nClients(self)
+
+
+    @property
+    def nFrames(self): #nFrames getter
+        '''
+        Number of frames broadcast so far.
+
+        :getter: Gets the number of frames.
+        :type: int
+        '''
+
+        return self.__nFrames
+    #end nFrames(self)
+
+
+    @property
+    def nDropped(self): #nDropped getter
+        '''
+        Number of frames dropped so far, over all clients.
+
+        :getter: Gets the number of frames.
+        :type: int
+        '''
+
+        return self.__nDropped
+    #end nDropped(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def broadcast(self, frame):
+        '''
+        Queues a frame for every client, dropping the oldest frame of the
+        clients whose queue is full.
+
+        :param frame: The frame (see :func:`encodeFrame`).
+        :type frame: bytes
+        :return: None
+        :rtype: NoneType
+        '''
+
+        for queue in self.__clients:
+            self.__put(queue, frame)
+        self.__nFrames += 1
+    #end broadcast(self, frame)
+
+
+    def __put(self, queue, frame):
+        #Drop-oldest backpressure
+        if queue.full():
+            queue.get_nowait()
+            self.__nDropped += 1
+        queue.put_nowait(frame)
+    #end __put(self, queue, frame)
+
+
+    async def __handleClient(self, reader, writer):
+        queue = asyncio.Queue(maxsize=self.__queueSize)
+        self.__clients[queue] = (asyncio.current_task(), writer)
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    #Shutdown; the queue is flushed
+                    break
+                writer.write(frame)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.__clients[queue]
+            writer.close()
+    #end __handleClient(self, reader, writer)
+
+
+    async def __synthesize(self, chunks, prefetch):
+        loop = asyncio.get_running_loop()
+        while True:
+            #Off the event loop; a whole recording is synthesized every now and then
+            await prefetch.put(await loop.run_in_executor(None, next, chunks))
+    #end __synthesize(self, chunks, prefetch)
+
+
+    async def __nextChunk(self, streamID, prefetch, synthesis):
+        #The next prefetched chunk; if the synthesis fails, its exception is raised here
+        getter = asyncio.ensure_future(prefetch.get())
+        try:
+            done, pending = await asyncio.wait({synthesis, getter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not getter.done():
+                getter.cancel()
+        if getter in done:
+            return getter.result()
+        synthesis.result()
+        msg = self.getClassName() + ':serve: The synthesis of stream ' + str(streamID) + ' stopped.'
+        raise RuntimeError(msg)
+    #end __nextChunk(self, streamID, prefetch, synthesis)
+
+
+    async def __produce(self, streamID, generator, rng):
+        loop = asyncio.get_running_loop()
+        options = self.__streamOptions[streamID]
+        samplingRate = generator.samplingRate
+        chunkSize = max(1, int(round(samplingRate * self.__chunkDuration)))
+        #The synthesis runs ahead so that a new recording does not stall the stream
+        prefetch = asyncio.Queue(maxsize=max(1, int(np.ceil(PREFETCH_DURATION / self.__chunkDuration))))
+        chunks = generator.streamChunks(chunkSize=chunkSize, rng=rng, **options)
+        synthesis = asyncio.ensure_future(self.__synthesize(chunks, prefetch))
+        try:
+            sequence = 0
+            chunk = await self.__nextChunk(streamID, prefetch, synthesis)
+            startTime = loop.time()
+            while True:
+                frame = encodeFrame(streamID, sequence, samplingRate, chunk)
+                sequence += chunk.shape[0]
+                if self.__realTime:
+                    #Sent when its last sample is due, against the start so errors do not accumulate
+                    delay = startTime + sequence / samplingRate - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    await asyncio.sleep(0)
+                self.broadcast(frame)
+                chunk = await self.__nextChunk(streamID, prefetch, synthesis)
+        finally:
+            synthesis.cancel()
+    #end __produce(self, streamID, generator, rng)
+
+
+    async def start(self):
+        '''
+        Starts listening; the generators start on :meth:`serve`.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__server is None:
+            self.__server = await asyncio.start_server(self.__handleClient, self.__host, self.__port)
+    #end start(self)
+
+
+    async def serve(self, duration=None):
+        '''
+        Runs the server and the generators.
+
+        :param duration: Time [s] to serve. Optional. Default is None (until cancelled).
+        :type duration: float or NoneType
+        :return: None
+        :rtype: NoneType
+        :raises Exception: The exception of a generator whose synthesis
+            failed; the server is shut down first.
+        '''
+
+        await self.start()
+        seeds = seedSequence(self.__rng)
+        producers = [asyncio.ensure_future(self.__produce(streamID, generator, seed)) \
+                     for streamID, (generator, seed) in enumerate(zip(self.__generators, seeds.spawn(len(self.__generators))))]
+        try:
+            await asyncio.wait_for(asyncio.gather(*producers), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+            #Let the clients flush their queues, then abort those still stalled
+            clients = list(self.__clients.items())
+            for queue, (task, writer) in clients:
+                self.__put(queue, None)
+            if clients:
+                done, pending = await asyncio.wait([task for queue, (task, writer) in clients], timeout=SHUTDOWN_TIMEOUT)
+                for queue, (task, writer) in clients:
+                    if task in pending:
+                        writer.transport.abort()
+                await asyncio.gather(*pending, return_exceptions=True)
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+    #end serve(self, duration=None)
+
+#class streamingServer
+
+
+def main():
+    samplingTime = 200   # time in secs
+
+    sgEEG = EEGSignalGenerator()
+    sgEEG.samplingRate = 128
+    sgEEG.nSamples = int(sgEEG.samplingRate * samplingTime)
+    sgEEG.nChannels = 6
+
+    sgfNIRS = fNIRSSignalGenerator()
+    sgfNIRS.samplingRate = 10
+    sgfNIRS.nSamples = int(sgfNIRS.samplingRate * samplingTime)
+    sgfNIRS.nChannels = 4
+
+    # Physiological noise and measurement noise; the experimental noise needs imported data (see fNIRSSignalGenerator.import_datums)
+    fNIRSOptions = dict(Breath=1, Vaso=1, Heart=1, Gauss=1)
+
+    server = streamingServer([sgEEG, sgfNIRS], streamOptions=[None, fNIRSOptions])
+    print("Streaming EEG (stream 0) and fNIRS (stream 1) on port", server.port)
+    asyncio.run(server.serve())
+# end main()
+
+
+if __name__ == '__main__':
+    main()
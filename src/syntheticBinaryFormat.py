@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+#File: syntheticBinaryFormat.py
+#
+'''
+Module ***syntheticBinaryFormat***
+
+Binary sidecar of the synthetic text format (see :mod:`syntheticTextFormat`),
+written next to each synthetic{id}_..._secs.txt file as
+synthetic{id}_..._secs.bin by :func:`EEGSignal_fNIRSSignal_Generator.main`
+and replayed by :func:`serialWriting.main`.
+
+A file has a fixed 64-byte little-endian header::
+
+    magic                 4s   b'SYNB'
+    version               u2   1
+    run ID                u4
+    number of channels    u4
+    number of signals     u4   1 for EEG, 2 (HbO2, HHb) for fNIRS
+    number of samples     u8
+    sampling rate [Hz]    f8
+    sampling time [s]     f8
+    dtype                 8s   b'<f4', the numpy dtype of the body
+    (zero padding)
+
+followed by the body, the data <nSamples x nChannels x nSignals> in C order
+as little-endian float32.
+
+:func:`openSyntheticBinary` maps the body with numpy.memmap, so a recording
+of any size can be replayed in slices without loading it in memory.
+:class:`syntheticBinaryWriter` writes a recording chunk by chunk; the
+number of samples in the header is patched on :meth:`syntheticBinaryWriter.close`.
+'''
+
+import struct
+
+import numpy as np
+
+
+BINARY_MAGIC = b'SYNB'
+BINARY_VERSION = 1
+BINARY_DTYPE = '<f4'
+HEADER_FORMAT = '<4sHIIIQdd8s'
+HEADER_BYTES = 64
+_NSAMPLES_OFFSET = struct.calcsize('<4sHIII')
+
+
+def readBinaryHeader(fileName):
+    '''
+    Reads the header of a binary sidecar.
+
+    :param fileName: The file.
+    :type fileName: str
+    :return: The metadata; fileName, runID, nChannels, nSignals, nSamples,
+        samplingRate, samplingTime and dtype.
+    :rtype: dict
+    '''
+
+    with open(fileName, 'rb') as fileIn:
+        raw = fileIn.read(HEADER_BYTES)
+    if len(raw) != HEADER_BYTES:
+        msg = 'readBinaryHeader: Unexpected header in ' + fileName + '.'
+        raise ValueError(msg)
+    magic, version, runID, nChannels, nSignals, nSamples, samplingRate, samplingTime, dtype = \
+        struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        msg = 'readBinaryHeader: ' + fileName + ' is not a synthetic binary file (version ' + str(BINARY_VERSION) + ').'
+        raise ValueError(msg)
+
+    header = dict()
+    header['fileName'] = fileName
+    header['runID'] = runID
+    header['nChannels'] = nChannels
+    header['nSignals'] = nSignals
+    header['nSamples'] = nSamples
+    header['samplingRate'] = samplingRate
+    header['samplingTime'] = int(samplingTime) if samplingTime.is_integer() else samplingTime
+    header['dtype'] = dtype.rstrip(b'\0').decode('ascii')
+
+    return header
+#end readBinaryHeader(fileName)
+
+
+def openSyntheticBinary(fileName):
+    '''
+    Maps a binary sidecar (read only).
+
+    :param fileName: The file.
+    :type fileName: str
+    :return: The data <nSamples x nChannels x nSignals> (numpy.memmap) and
+        the header (see :func:`readBinaryHeader`).
+    :rtype: tuple
+    '''
+
+    header = readBinaryHeader(fileName)
+    shape = (header['nSamples'], header['nChannels'], header['nSignals'])
+    if header['nSamples'] == 0:
+        #numpy.memmap cannot map an empty body
+        return np.empty(shape, dtype=header['dtype']), header
+
+    data = np.memmap(fileName, dtype=header['dtype'], mode='r', offset=HEADER_BYTES, shape=shape)
+
+    return data, header
+#end openSyntheticBinary(fileName)
+
+
+class syntheticBinaryWriter:
+    '''
+    Writer of the binary sidecar. The data are appended in chunks
+    <nSamples x nChannels x nSignals>. Use as a context manager, or call
+    :meth:`close`.
+    '''
+
+    def __init__(self, fileName, runID, nChannels, nSignals, samplingRate, samplingTime):
+        '''
+        :Parameters:
+        :param fileName: The file to create (overwritten).
+        :type fileName: str
+        :param runID: The run identifier.
+        :type runID: int
+        :param nChannels: Number of channels.
+        :type nChannels: int (positive)
+        :param nSignals: Number of signals; 1 for EEG and 2 for fNIRS.
+        :type nSignals: int (positive)
+        :param samplingRate: The sampling rate [Hz].
+        :type samplingRate: float
+        :param samplingTime: The sampling time [s].
+        :type samplingTime: int or float
+        '''
+
+        #Check parameters
+        if type(nChannels) is not int or nChannels <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nChannels''.'
+            raise ValueError(msg)
+        if type(nSignals) is not int or nSignals <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nSignals''.'
+            raise ValueError(msg)
+
+        self.__nChannels = nChannels
+        self.__nSignals = nSignals
+        self.__nWritten = 0
+        self.__file = open(fileName, 'wb')
+        header = struct.pack(HEADER_FORMAT, BINARY_MAGIC, BINARY_VERSION, runID, nChannels, nSignals, 0, \
+                             float(samplingRate), float(samplingTime), BINARY_DTYPE.encode('ascii'))
+        self.__file.write(header.ljust(HEADER_BYTES, b'\0'))
+    #end __init__(self, fileName, runID, nChannels, ...)
+
+
+    @property
+    def nWritten(self): #nWritten getter
+        '''
+        Number of samples written so far.
+
+        :getter: Gets the number of samples.
+        :type: int
+        '''
+
+        return self.__nWritten
+    #end nWritten(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def append(self, chunk):
+        '''
+        Appends a chunk of samples.
+
+        :param chunk: The data <nSamples x nChannels x nSignals>.
+        :type chunk: numpy.ndarray
+        :return: None
+        :rtype: NoneType
+        '''
+
+        #Check parameters
+        if self.__file is None:
+            msg = self.getClassName() + ':append: The file is closed.'
+            raise ValueError(msg)
+        chunk = np.asarray(chunk)
+        if chunk.ndim != 3 or chunk.shape[1:] != (self.__nChannels, self.__nSignals):
+            msg = self.getClassName() + ':append: Unexpected parameter value for parameter ''chunk''. Expected <nSamples x ' \
+                  + str(self.__nChannels) + ' x ' + str(self.__nSignals) + '>.'
+            raise ValueError(msg)
+
+        self.__file.write(np.ascontiguousarray(chunk, dtype=BINARY_DTYPE).tobytes())
+        self.__nWritten += chunk.shape[0]
+    #end append(self, chunk)
+
+
+    def close(self):
+        '''
+        Patches the number of samples in the header and closes the file.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__file is not None:
+            self.__file.seek(_NSAMPLES_OFFSET)
+            self.__file.write(struct.pack('<Q', self.__nWritten))
+            self.__file.close()
+            self.__file = None
+    #end close(self)
+
+
+    def __enter__(self):
+        return self
+    #end __enter__(self)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    #end __exit__(self, excType, excValue, traceback)
+
+#class syntheticBinaryWriter
+
+
+def writeSyntheticBinary(fileName, data, runID, samplingRate, samplingTime):
+    '''
+    Writes a whole data tensor as a binary sidecar.
+
+    :param fileName: The file to create (overwritten).
+    :type fileName: str
+    :param data: The data <nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param runID, samplingRate, samplingTime: The header; see
+        :class:`syntheticBinaryWriter`.
+    :return: None
+    :rtype: NoneType
+    '''
+
+    with syntheticBinaryWriter(fileName, runID, data.shape[1], data.shape[2], samplingRate, samplingTime) as writer:
+        writer.append(data)
+#end writeSyntheticBinary(fileName, data, runID, ...)
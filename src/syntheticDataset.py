@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+#File: syntheticDataset.py
+#
+'''
+Module ***syntheticDataset***
+
+Seed-addressed virtual dataset of synthetic fNIRS subjects.
+
+:class:`SyntheticfNIRSDataset` has the layout of the directory tree written
+by :func:`Create_Data.Create_Data` (noise type x iteration x variability x
+session x subject), but nothing is stored on disk: each index is mapped
+deterministically to a seed (see :func:`rngStreams.cellSeedSequence`) and
+the subject is generated with :meth:`fNIRSSignalGenerator.execute` on read.
+A bounded LRU cache keeps the most recently read subjects.
+'''
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from Create_Data import NOISE_TYPES, VARIABILITIES, createGenerator
+from rngStreams import cellSeedSequence, seedSequence
+
+
+class SyntheticfNIRSDataset:
+    '''
+    Virtual dataset; dataset[m, l, k, j, i] (or dataset[flatIndex]) is the
+    tuple (data, boxcar_amp, channel_amp) of subject i in session j
+    (Exertion=j), variability k, iteration l and noise type m, as in
+    :func:`Create_Data.Create_Data`. The returned data tensors are read only.
+    '''
+
+    def __init__(self, seed=0, iterations=1, nSessions=3, nSubjects=10, \
+                 noiseTypes=None, variabilities=VARIABILITIES, \
+                 generator=None, imported_data=None, cacheSize=64):
+        '''
+        :Parameters:
+        :param seed: The root seed of the dataset. Default is 0.
+        :type seed: int or numpy.random.SeedSequence
+        :param iterations: Number of iterations. Default is 1.
+        :type iterations: int (positive)
+        :param nSessions: Number of sessions; session j has Exertion=j. Default is 3.
+        :type nSessions: int (1 to 3)
+        :param nSubjects: Number of subjects per session. Default is 10.
+        :type nSubjects: int (positive)
+        :param noiseTypes: Noise sources per noise type, as [Breath, Vaso, Heart, Gauss, Experi].
+            Optional. Default is None (:data:`Create_Data.NOISE_TYPES`; without
+            the experimental noise types if imported_data is None).
+        :type noiseTypes: list or NoneType
+        :param variabilities: [boxVar, chanVar] per variability.
+            Default is :data:`Create_Data.VARIABILITIES`.
+        :type variabilities: list
+        :param generator: The generator. Optional. Default is None
+            (:func:`Create_Data.createGenerator`).
+        :type generator: fNIRSSignalGenerator or NoneType
+        :param imported_data: The experimental noise bank; required if any
+            noise type has experimental noise. Optional. Default is None.
+        :type imported_data: numpy.ndarray or NoneType
+        :param cacheSize: Maximum number of subjects kept in memory. Default is 64.
+        :type cacheSize: int (non negative)
+        '''
+
+        if noiseTypes is None:
+            noiseTypes = [elem for elem in NOISE_TYPES if imported_data is not None or elem[4] == 0]
+
+        #Check parameters
+        if type(iterations) is not int or iterations <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''iterations''.'
+            raise ValueError(msg)
+        if type(nSubjects) is not int or nSubjects <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nSubjects''.'
+            raise ValueError(msg)
+        if type(nSessions) is not int or not (1 <= nSessions <= 3):
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nSessions''.'
+            raise ValueError(msg)
+        if type(cacheSize) is not int or cacheSize < 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''cacheSize''.'
+            raise ValueError(msg)
+        for elem in noiseTypes:
+            if len(elem) != 5:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''noiseTypes''.'
+                raise ValueError(msg)
+            if elem[4] == 1 and imported_data is None:
+                msg = self.getClassName() + ':__init__: Parameter ''imported_data'' is required for experimental noise.'
+                raise ValueError(msg)
+        for elem in variabilities:
+            if len(elem) != 2:
+                msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''variabilities''.'
+                raise ValueError(msg)
+
+        self.__root = seedSequence(seed)
+        self.__noiseTypes = [list(elem) for elem in noiseTypes]
+        self.__variabilities = [list(elem) for elem in variabilities]
+        self.__shape = (len(self.__noiseTypes), iterations, len(self.__variabilities), nSessions, nSubjects)
+        self.__generator = createGenerator() if generator is None else generator
+        self.__importedData = imported_data
+        self.__cacheSize = cacheSize
+        self.__cache = OrderedDict()
+        #The generator keeps its data tensor; reads are serialized
+        self.__lock = threading.Lock()
+    #end __init__(self, seed=0, ...)
+
+
+    @property
+    def shape(self): #shape getter
+        '''
+        The shape of the dataset (noise types, iterations, variabilities,
+        sessions, subjects).
+
+        :getter: Gets the shape.
+        :type: tuple
+        '''
+
+        return self.__shape
+    #end shape(self)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def __len__(self):
+        return int(np.prod(self.__shape))
+    #end __len__(self)
+
+
+    def index(self, key):
+        '''
+        Normalizes a key to the tuple (noiseType, iteration, var, session, subject).
+
+        :param key: A flat index or a tuple of 5 indices; negative indices
+            count from the end.
+        :type key: int or tuple
+        :return: The index.
+        :rtype: tuple
+        '''
+
+        try:
+            if isinstance(key, (int, np.integer)):
+                key = np.unravel_index(int(key) % len(self) if key < 0 else int(key), self.__shape)
+            if len(key) != len(self.__shape):
+                raise IndexError
+            return tuple(int(np.arange(n)[k]) for k, n in zip(key, self.__shape))
+        except (IndexError, TypeError, ValueError):
+            msg = self.getClassName() + ':index: Unexpected index ' + str(key) + '.'
+            raise IndexError(msg)
+    #end index(self, key)
+
+
+    def seedFor(self, key):
+        '''
+        Gets the seed sequence of a subject. It only depends on the root seed
+        of the dataset and the index.
+
+        :param key: A flat index or a tuple of 5 indices.
+        :type key: int or tuple
+        :return: The seed sequence.
+        :rtype: numpy.random.SeedSequence
+        '''
+
+        return cellSeedSequence(self.__root, *self.index(key))
+    #end seedFor(self, key)
+
+
+    def __getitem__(self, key):
+        index = self.index(key)
+        with self.__lock:
+            if index in self.__cache:
+                self.__cache.move_to_end(index)
+                return self.__cache[index]
+
+            m, l, k, j, i = index
+            noise = self.__noiseTypes[m]
+            variability = self.__variabilities[k]
+            importedData = self.__importedData if self.__importedData is not None else np.empty((3000, 4, 2))
+            result = self.__generator.execute(importedData, Exertion=j, \
+                                              boxVar=variability[0], chanVar=variability[1], \
+                                              Breath=noise[0], Vaso=noise[1], Heart=noise[2], \
+                                              Gauss=noise[3], Experi=noise[4], \
+                                              rng=cellSeedSequence(self.__root, *index))
+            data = result[0]
+            data.flags.writeable = False
+            item = (data, result[1], result[2])
+
+            if self.__cacheSize > 0:
+                self.__cache[index] = item
+                if len(self.__cache) > self.__cacheSize:
+                    self.__cache.popitem(last=False)
+
+        return item
+    #end __getitem__(self, key)
+
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+    #end __iter__(self)
+
+
+    def clearCache(self):
+        '''
+        Empties the cache of subjects.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        with self.__lock:
+            self.__cache.clear()
+    #end clearCache(self)
+
+#class SyntheticfNIRSDataset
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+#
+#File: syntheticTextFormat.py
+#
+'''
+Module ***syntheticTextFormat***
+
+The synthetic{id}_EEG_...txt and synthetic{id}_fNIRs_...txt text format of
+:func:`EEGSignal_fNIRSSignal_Generator.main`, replayed by
+:func:`serialWriting.main`.
+
+A file has a 6-line header::
+
+    File: <fileName>
+    Run ID:       \\t\\t<id, 3 digits>
+    Number of samples:\\t<n>[ \\tNumber of samples after interpolation:\\t<m>]
+    Number of channels:\\t<nChannels>
+    Sampling rate:\\t\\t<samplingRate> Hz
+    Sampling time:\\t\\t<samplingTime> secs
+
+followed by one row per sample (EEG) or two interleaved rows per sample,
+HbO2 then HHb (fNIRS), of comma and space separated values, written as
+Python prints floats (shortest round-trip repr).
+
+:class:`syntheticTextWriter` produces exactly the same bytes as the former
+per-value writes, but formats whole blocks of rows with a single
+%-formatting operation and writes each block once to a buffered stream.
+:func:`readSyntheticText` parses the body back in large blocks.
+'''
+
+import io
+import warnings
+
+import numpy as np
+
+
+DEFAULT_BLOCK_SIZE = 4096 # [rows]
+
+
+def formatHeader(fileName, runID, nSamples, nChannels, samplingRate, samplingTime, nSamplesInterpolated=None):
+    '''
+    Formats the 6-line header.
+
+    :param fileName: The file name written in the header.
+    :type fileName: str
+    :param runID: The run identifier.
+    :type runID: int
+    :param nSamples: Number of samples.
+    :type nSamples: int
+    :param nChannels: Number of channels.
+    :type nChannels: int
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float
+    :param samplingTime: The sampling time [s].
+    :type samplingTime: int or float
+    :param nSamplesInterpolated: Number of samples after interpolation, if
+        the data were interpolated. Optional. Default is None.
+    :type nSamplesInterpolated: int or NoneType
+    :return: The header.
+    :rtype: str
+    '''
+
+    samplesLine = f'Number of samples:\t{nSamples}'
+    if nSamplesInterpolated is not None:
+        samplesLine += f' \tNumber of samples after interpolation:\t{nSamplesInterpolated}'
+
+    return f'File: {fileName}\n' \
+           f'Run ID:       \t\t{runID:03d}\n' \
+           f'{samplesLine}\n' \
+           f'Number of channels:\t{nChannels}\n' \
+           f'Sampling rate:\t\t{samplingRate:.0f} Hz\n' \
+           f'Sampling time:\t\t{samplingTime} secs\n'
+#end formatHeader(fileName, runID, nSamples, ...)
+
+
+def formatRows(rows):
+    '''
+    Formats a block of rows, values separated by ', ', in one operation.
+
+    :param rows: The rows <nRows x nColumns>.
+    :type rows: numpy.ndarray
+    :return: The text.
+    :rtype: str
+    '''
+
+    nRows, nColumns = rows.shape
+    if nRows == 0:
+        return ''
+    rowFormat = ', '.join(['%r'] * nColumns) + '\n'
+    #tolist() yields Python floats, whose %r is the repr printed by f'{x}'
+    return (rowFormat * nRows) % tuple(rows.ravel().tolist())
+#end formatRows(rows)
+
+
+class syntheticTextWriter:
+    '''
+    Buffered writer of the synthetic text format. The header is written on
+    creation and the data appended in chunks <nSamples x nChannels x nSignals>;
+    nSignals is 1 for EEG and 2 (HbO2 and HHb rows interleaved) for fNIRS.
+    Use as a context manager, or call :meth:`close`.
+    '''
+
+    def __init__(self, fileName, runID, nSamples, nChannels, samplingRate, samplingTime, \
+                 nSamplesInterpolated=None, blockSize=DEFAULT_BLOCK_SIZE):
+        '''
+        :Parameters:
+        :param fileName: The file to create (overwritten); also written in the header.
+        :type fileName: str
+        :param runID, nSamples, nChannels, samplingRate, samplingTime, nSamplesInterpolated:
+            The header; see :func:`formatHeader`.
+        :param blockSize: Number of rows formatted at once. Default is :data:`DEFAULT_BLOCK_SIZE`.
+        :type blockSize: int (positive)
+        '''
+
+        #Check parameters
+        if type(nChannels) is not int or nChannels <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''nChannels''.'
+            raise ValueError(msg)
+        if type(blockSize) is not int or blockSize <= 0:
+            msg = self.getClassName() + ':__init__: Unexpected parameter value for parameter ''blockSize''.'
+            raise ValueError(msg)
+
+        self.__nChannels = nChannels
+        self.__blockSize = blockSize
+        self.__file = io.open(fileName, 'w', buffering=1 << 20)
+        self.__file.write(formatHeader(fileName, runID, nSamples, nChannels, samplingRate, samplingTime, \
+                                       nSamplesInterpolated))
+    #end __init__(self, fileName, runID, nSamples, ...)
+
+
+    def getClassName(self):
+        '''
+        Gets the class name.
+
+        :return: The class name
+        :rtype: str
+        '''
+
+        return type(self).__name__
+    #end getClassName(self)
+
+
+    def append(self, chunk):
+        '''
+        Appends a chunk of samples.
+
+        :param chunk: The data <nSamples x nChannels x nSignals>.
+        :type chunk: numpy.ndarray
+        :return: None
+        :rtype: NoneType
+        '''
+
+        #Check parameters
+        if self.__file is None:
+            msg = self.getClassName() + ':append: The file is closed.'
+            raise ValueError(msg)
+        chunk = np.asarray(chunk, dtype=float)
+        if chunk.ndim != 3 or chunk.shape[1] != self.__nChannels:
+            msg = self.getClassName() + ':append: Unexpected parameter value for parameter ''chunk''.'
+            raise ValueError(msg)
+
+        #One row per sample and signal, the signals of a sample consecutive
+        rows = chunk.transpose(0, 2, 1).reshape(-1, self.__nChannels)
+        for start in range(0, rows.shape[0], self.__blockSize):
+            self.__file.write(formatRows(rows[start:start + self.__blockSize]))
+    #end append(self, chunk)
+
+
+    def close(self):
+        '''
+        Flushes and closes the file.
+
+        :return: None
+        :rtype: NoneType
+        '''
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+    #end close(self)
+
+
+    def __enter__(self):
+        return self
+    #end __enter__(self)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    #end __exit__(self, excType, excValue, traceback)
+
+#class syntheticTextWriter
+
+
+def writeSyntheticText(fileName, data, runID, samplingRate, samplingTime, nSamples=None, nSamplesInterpolated=None):
+    '''
+    Writes a whole data tensor in the synthetic text format.
+
+    :param fileName: The file to create (overwritten).
+    :type fileName: str
+    :param data: The data <nSamples x nChannels x nSignals>.
+    :type data: numpy.ndarray
+    :param runID, samplingRate, samplingTime, nSamplesInterpolated: The header;
+        see :func:`formatHeader`.
+    :param nSamples: Number of samples in the header. Optional. Default is
+        None (the number of samples of data).
+    :type nSamples: int or NoneType
+    :return: None
+    :rtype: NoneType
+    '''
+
+    if nSamples is None:
+        nSamples = data.shape[0]
+    with syntheticTextWriter(fileName, runID, nSamples, data.shape[1], samplingRate, samplingTime, \
+                             nSamplesInterpolated) as writer:
+        writer.append(data)
+#end writeSyntheticText(fileName, data, runID, ...)
+
+
+def parseHeader(lines):
+    '''
+    Parses the 6-line header.
+
+    :param lines: The 6 header lines.
+    :type lines: list of str
+    :return: The metadata; fileName, runID, nSamples, nSamplesInterpolated
+        (None if absent), nChannels, samplingRate, samplingTime and text (the
+        raw header).
+    :rtype: dict
+    '''
+
+    if len(lines) != 6 or not lines[0].startswith('File: '):
+        msg = 'parseHeader: Unexpected header. Expected the 6 lines of the synthetic text format.'
+        raise ValueError(msg)
+    try:
+        fields = [line.rstrip('\r\n').split('\t') for line in lines]
+        samplingTime = float(fields[5][-1].split()[0])
+        header = dict()
+        header['text'] = ''.join(lines)
+        header['fileName'] = lines[0].rstrip('\r\n')[len('File: '):]
+        header['runID'] = int(fields[1][-1])
+        header['nSamples'] = int(fields[2][1])
+        header['nSamplesInterpolated'] = int(fields[2][3]) if len(fields[2]) > 3 else None
+        header['nChannels'] = int(fields[3][-1])
+        header['samplingRate'] = float(fields[4][-1].split()[0])
+        header['samplingTime'] = int(samplingTime) if samplingTime.is_integer() else samplingTime
+    except (IndexError, ValueError):
+        msg = 'parseHeader: Unexpected header. Expected the 6 lines of the synthetic text format.'
+        raise ValueError(msg)
+
+    return header
+#end parseHeader(lines)
+
+
+def _parseRows(text, nRows, nChannels, fileName):
+    #Parses nRows full rows; np.fromstring stops silently at the first bad token
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = np.fromstring(text.replace(',', ' '), sep=' ')
+    if values.size != nRows * nChannels:
+        msg = 'readSyntheticText: Malformed rows in ' + fileName + '. Expected ' + str(nRows * nChannels) \
+              + ' values, parsed ' + str(values.size) + '.'
+        raise ValueError(msg)
+    return values
+#end _parseRows(text, nRows, nChannels, fileName)
+
+
+def readSyntheticText(fileName, nSignals=None, blockBytes=1 << 24):
+    '''
+    Reads a file of the synthetic text format.
+
+    The body is parsed in blocks of about blockBytes characters, each in a
+    single call (np.fromstring) rather than value by value; the interleaved
+    rows are then viewed as <nSamples x nChannels x nSignals> (a stride
+    view, not a copy).
+
+    :param fileName: The file.
+    :type fileName: str
+    :param nSignals: Number of rows per sample; 1 for EEG and 2 for fNIRS.
+        Optional. Default is None (2 if the file name has '_fNIRs_', else 1).
+    :type nSignals: int or NoneType
+    :param blockBytes: Approximate size of the blocks. Default is 16 MB.
+    :type blockBytes: int (positive)
+    :return: The data <nSamples x nChannels x nSignals> and the header (see
+        :func:`parseHeader`).
+    :rtype: tuple
+    :raises ValueError: If a row is malformed or the number of samples
+        differs from the header (nSamplesInterpolated if given, else nSamples).
+    '''
+
+    if nSignals is None:
+        nSignals = 2 if '_fNIRs_' in fileName else 1
+    if type(nSignals) is not int or nSignals <= 0:
+        msg = 'readSyntheticText: Unexpected parameter value for parameter ''nSignals''.'
+        raise ValueError(msg)
+
+    with open(fileName, 'r') as fileIn:
+        header = parseHeader([fileIn.readline() for i in range(6)])
+        nChannels = header['nChannels']
+        blocks = list()
+        tail = ''
+        while True:
+            text = fileIn.read(blockBytes)
+            if not text:
+                break
+            #Parse up to the last full row; the rest is carried over
+            text = tail + text
+            cut = text.rfind('\n') + 1
+            tail = text[cut:]
+            if cut > 0:
+                blocks.append(_parseRows(text[0:cut], text.count('\n', 0, cut), nChannels, fileName))
+        if tail.strip():
+            blocks.append(_parseRows(tail, 1, nChannels, fileName))
+
+    values = np.concatenate(blocks) if len(blocks) > 0 else np.empty(0)
+    nRows = values.size // nChannels
+    expected = header['nSamples'] if header['nSamplesInterpolated'] is None else header['nSamplesInterpolated']
+    if nRows % nSignals != 0 or nRows // nSignals != expected:
+        msg = 'readSyntheticText: Unexpected number of rows in ' + fileName + '. Expected ' + str(expected) \
+              + ' samples of ' + str(nSignals) + ' rows, read ' + str(nRows) + ' rows.'
+        raise ValueError(msg)
+
+    #<nSamples x nSignals x nChannels> viewed as <nSamples x nChannels x nSignals>
+    data = values.reshape(-1, nSignals, nChannels).transpose(0, 2, 1)
+
+    return data, header
+#end readSyntheticText(fileName, nSignals=None, blockBytes=1 << 24)
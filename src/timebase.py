@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+#File: timebase.py
+#
+'''
+Module ***timebase***
+
+Shared cache of the sampling timebases used by the sinusoid-based generators.
+
+The generators (:class:`fNIRSSignalGenerator`, :class:`EEGSignalGenerator`
+and :mod:`fNIRSSynthesis`) need the vector of timestamps [s] of the samples
+on every call. :func:`timebase` returns it from a small LRU cache keyed by
+(nSamples, samplingRate). The vectors are 1-D and read only; callers
+broadcast against them (e.g. timebase(n, fs)[:, None]) rather than tiling
+them to <nSamples x nChannels>.
+
+Timestamps are computed as i/samplingRate for i in 0..nSamples-1. Unlike
+np.arange(0, nSamples/samplingRate, 1/samplingRate), the length is always
+exactly nSamples; the floating point step of np.arange may yield one sample
+more or less.
+'''
+
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=32)
+def _timebase(nSamples, samplingRate):
+    timestamps = np.arange(nSamples, dtype=float) / samplingRate
+    timestamps.flags.writeable = False
+    return timestamps
+#end _timebase(nSamples, samplingRate)
+
+
+def timebase(nSamples, samplingRate):
+    '''
+    Gets the timestamps [s] of nSamples samples at samplingRate.
+
+    :param nSamples: Number of temporal samples.
+    :type nSamples: int (positive)
+    :param samplingRate: The sampling rate [Hz].
+    :type samplingRate: float (positive)
+    :return: The read only vector of timestamps <nSamples>.
+    :rtype: numpy.ndarray
+    '''
+
+    #Check parameters
+    if not isinstance(nSamples, (int, np.integer)) or nSamples <= 0:
+        msg = 'timebase: Unexpected parameter value for parameter ''nSamples''.'
+        raise ValueError(msg)
+    if samplingRate <= 0:
+        msg = 'timebase: Unexpected parameter value for parameter ''samplingRate''.'
+        raise ValueError(msg)
+
+    return _timebase(int(nSamples), float(samplingRate))
+#end timebase(nSamples, samplingRate)
+
+
+def cacheInfo():
+    '''
+    Gets the hits, misses and size of the timebase cache.
+
+    :return: The cache statistics.
+    :rtype: functools._CacheInfo
+    '''
+
+    return _timebase.cache_info()
+#end cacheInfo()
+
+
+def clearCache():
+    '''
+    Empties the timebase cache.
+
+    :return: None
+    :rtype: NoneType
+    '''
+
+    _timebase.cache_clear()
+#end clearCache()
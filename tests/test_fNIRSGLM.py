@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#
+#File: test_fNIRSGLM.py
+#
+'''
+Tests of :mod:`fNIRSGLM` on data with known betas and noise.
+'''
+
+import numpy as np
+
+from fNIRSGLM import glmFor
+
+
+BOXCARLIST = ((35, 55), (105, 125), (175, 195), (245, 265))
+
+
+def test_tValues():
+    glm = glmFor(BOXCARLIST, 3000, driftOrder=1)
+    X = glm.designMatrix
+    rng = np.random.default_rng(1)
+    nSubjects, nChannels, sd = 200, 4, 1e-3
+    #Strong responses on a large offset, so that the fit explains almost all the data
+    betas = rng.uniform(1, 2, (nSubjects, X.shape[1], nChannels, 2))
+    betas[:, -2] = 1e6
+    data = np.einsum('ir,krcs->kics', X, betas) + rng.normal(0, sd, (nSubjects, 3000, nChannels, 2))
+
+    result = glm.fit(data)
+
+    #Expected t-values with the known noise: beta / (sd * sqrt(diag((X'X)^-1)))
+    standardErrors = sd * np.sqrt(np.diag(np.linalg.inv(X.T @ X)))
+    expected = result.betas / standardErrors[:, None, None]
+    ratio = result.tValues / expected
+    assert np.all(np.isfinite(result.tValues))
+    assert abs(np.mean(ratio) - 1) < 0.01
+    assert np.all(np.abs(ratio - 1) < 0.15)
+    #The t-values of the betas minus the true ones follow a t distribution
+    z = (result.betas - betas) / (result.betas / result.tValues)
+    assert abs(np.std(z) - 1) < 0.05
+    assert abs(np.mean(z)) < 0.05
+#end test_tValues()
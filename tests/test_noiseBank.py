@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+#File: test_noiseBank.py
+#
+'''
+Tests of the screening of :mod:`noiseBank`.
+'''
+
+import numpy as np
+
+from noiseBank import noiseBankIndex, screenSegments
+
+
+def makeBank(nSamples=3001):
+    #Segments <temporal, segment, signal>: noise, quantized, ramp, staircase, flat, spike
+    rng = np.random.default_rng(1)
+    t = np.arange(nSamples) / 10.0
+    noise = rng.normal(0, 1, nSamples)
+    segments = [noise,
+                np.round(noise / 4) * 4,
+                0.01 * t,
+                np.floor(t / 5),
+                np.zeros(nSamples),
+                noise + 100 * (np.arange(nSamples) == 1500)]
+    return np.stack([np.stack((segment, -segment / 3), axis=1) for segment in segments], axis=1)
+#end makeBank(nSamples=3001)
+
+
+def test_screenSegments():
+    metrics, valid = screenSegments(makeBank())
+
+    assert np.all(np.isfinite(metrics))
+    #Quantized, linear and piecewise constant segments are clean; the flat one
+    #is screened by its std, the spike by its motion
+    assert valid.tolist() == [True, True, True, True, False, False]
+    assert metrics[2, 3] == 0
+    assert metrics[5, 3] > 20
+#end test_screenSegments()
+
+
+def test_lowVarianceBank():
+    #A bank of quantized segments only can be drawn from
+    bank = makeBank()[:, [1, 2, 3], :]
+    index = noiseBankIndex.fromBank(bank, 10.0)
+    assert len(index.validSegments) == 3
+    assert np.all(index.sample(size=10, rng=1) < 3)
+#end test_lowVarianceBank()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+#File: test_sharedRingBuffer.py
+#
+'''
+Tests of :mod:`sharedRingBuffer`. The samples written encode their
+sequence number, so that any view can be checked against its position.
+'''
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from fNIRSdatagen import fNIRSSignalGenerator
+from sharedRingBuffer import sharedRingBuffer, streamToRing
+
+
+def samples(first, n, nChannels=4, nSignals=2):
+    return np.broadcast_to(np.arange(first, first + n, dtype=float)[:, None, None], (n, nChannels, nSignals))
+#end samples(first, n, nChannels=4, nSignals=2)
+
+
+def consumer(name, results):
+    #Attaches by name from another process
+    ring = sharedRingBuffer(name)
+    view, first = ring.since(0)
+    results.put((ring.capacity, ring.nChannels, ring.nSignals, ring.samplingRate, first, view.copy(), ring.isValid(first)))
+    del view
+    try:
+        ring.write(samples(0, 1))
+        results.put('written')
+    except ValueError:
+        results.put('refused')
+    ring.close()
+#end consumer(name, results)
+
+
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+def test_crossProcessAttach(method):
+    context = multiprocessing.get_context(method)
+    with sharedRingBuffer(create=True, capacity=100, nChannels=4, nSignals=2, samplingRate=10.0) as ring:
+        ring.write(samples(0, 130))
+        results = context.Queue()
+        process = context.Process(target=consumer, args=(ring.name, results))
+        process.start()
+        capacity, nChannels, nSignals, samplingRate, first, data, valid = results.get(timeout=30)
+        refused = results.get(timeout=30)
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+        assert (capacity, nChannels, nSignals, samplingRate) == (100, 4, 2, 10.0)
+        assert first == 30
+        assert np.array_equal(data, samples(30, 100))
+        assert valid
+        assert refused == 'refused'
+
+        #The consumer exiting leaves the block to the producer
+        with sharedRingBuffer(ring.name) as attached:
+            view, first = attached.latest(5)
+            assert first == 125
+            assert np.array_equal(view, samples(125, 5))
+            del view
+#end test_crossProcessAttach(method)
+
+
+def test_overrun():
+    with sharedRingBuffer(create=True, capacity=100, nChannels=4, nSignals=2) as ring:
+        ring.write(samples(0, 50))
+        view, first = ring.since(0)
+        assert first == 0 and view.shape[0] == 50
+        sequence = first + view.shape[0]
+        del view
+
+        #Nothing new
+        view, first = ring.since(sequence)
+        assert first == sequence and view.shape[0] == 0
+        del view
+
+        #The consumer falls behind by more than the capacity
+        for start in range(50, 300, 30):
+            ring.write(samples(start, min(30, 300 - start)))
+        view, first = ring.since(sequence)
+        assert first == 200
+        assert first - sequence == 150 # missed
+        assert np.array_equal(view, samples(200, 100))
+        del view
+
+        #A chunk longer than the capacity keeps its last samples
+        ring.write(samples(300, 250))
+        view, first = ring.since(300, maxSamples=10)
+        assert first == 450
+        assert np.array_equal(view, samples(450, 10))
+        del view
+#end test_overrun()
+
+
+def test_isValid():
+    with sharedRingBuffer(create=True, capacity=100, nChannels=4, nSignals=2) as ring:
+        ring.write(samples(0, 300))
+        view, first = ring.latest(10)
+        assert first == 290
+        assert not view.flags.writeable
+        assert ring.isValid(first)
+
+        #Up to the capacity after the first sample of the view, it is intact
+        ring.write(samples(300, 90))
+        assert ring.isValid(first)
+        assert np.array_equal(view, samples(290, 10))
+
+        #The next sample overwrites it
+        ring.write(samples(390, 1))
+        assert not ring.isValid(first)
+        del view
+
+        data, first = ring.copyLatest(10)
+        assert first == 381
+        assert np.array_equal(data, samples(381, 10))
+#end test_isValid()
+
+
+def test_streamToRing():
+    generator = fNIRSSignalGenerator()
+    generator.nChannels = 1
+    #The fNIRS data always have 4 channels
+    with sharedRingBuffer(create=True, capacity=100, nChannels=1, nSignals=2) as ring:
+        with pytest.raises(ValueError):
+            streamToRing(generator, ring, nRecordings=1, rng=1, realTime=False, Gauss=1)
+        assert ring.sequence == 0
+    #The parameters reach the generator
+    with sharedRingBuffer(create=True, capacity=5000, nChannels=4, nSignals=2) as ring:
+        assert streamToRing(generator, ring, nRecordings=1, rng=1, realTime=False, Gauss=1) == 3000
+        data, first = ring.copyLatest(3000)
+        assert first == 0
+        assert np.any(data != 0)
+#end test_streamToRing()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+#File: test_streamingServer.py
+#
+'''
+Tests of :mod:`streamingServer`; the server runs on a free port with
+realTime=False, the clients in the same event loop.
+'''
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from EEGSignalGenerator import EEGSignalGenerator
+from fNIRSdatagen import fNIRSSignalGenerator
+from streamingServer import streamingServer, subscribe
+
+
+N_CLIENTS = 30
+N_STALLED_FRAMES = 2000
+
+
+def makeEEG():
+    sgEEG = EEGSignalGenerator(nSamples=1280, nChannels=4, chLocations=np.array([[1, 2, 0], [0, 1, 0], [2, 1, 0], [1, 0, 0]]),
+                               referencePoints=dict({'Nz': np.array([0, -18.5, 0]), 'Iz': np.array([0, 18.5, 0]),
+                                                     'LPA': np.array([17.5, 0, 0]), 'RPA': np.array([-17.5, 0, 0]),
+                                                     'Cz': np.array([0, 0, 0])}),
+                               chSurfacePositions=('Fz', 'C3', 'C4', 'Cz'), chOptodeArrays=np.array([0, 0, 0, 0]))
+    sgEEG.samplingRate = 128
+    return sgEEG
+#end makeEEG()
+
+
+class constantGenerator:
+    '''
+    High bandwidth stand-in of a generator; endless chunks of ones.
+    '''
+
+    def __init__(self, samplingRate=1000, nChannels=64):
+        self.samplingRate = samplingRate
+        self.nChannels = nChannels
+
+    def streamChunks(self, chunkSize=1, rng=None):
+        chunk = np.ones((chunkSize, self.nChannels, 1))
+        while True:
+            yield chunk
+
+#class constantGenerator
+
+
+async def collect(port, frames):
+    async for streamID, sequence, samplingRate, chunk in subscribe(port=port):
+        frames.append((streamID, sequence, samplingRate, chunk))
+#end collect(port, frames)
+
+
+async def waitFor(condition, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+#end waitFor(condition, timeout=5.0)
+
+
+def checkSequences(frames, streamID):
+    #Strictly increasing, without overlaps; returns the number of samples missed
+    expected = 0
+    nMissed = 0
+    for frameStreamID, sequence, samplingRate, chunk in frames:
+        if frameStreamID != streamID:
+            continue
+        assert sequence >= expected
+        nMissed += sequence - expected
+        expected = sequence + chunk.shape[0]
+    return nMissed
+#end checkSequences(frames, streamID)
+
+
+def test_broadcast():
+    sgEEG = makeEEG()
+    sgfNIRS = fNIRSSignalGenerator()
+    sgfNIRS.samplingRate = 10
+
+    async def run():
+        server = streamingServer([sgEEG, sgfNIRS], port=0, rng=1, realTime=False, \
+                                 streamOptions=[None, dict(Gauss=1)])
+        await server.start()
+        assert server.port != 0
+        frames = [list() for i in range(N_CLIENTS)]
+        clients = [asyncio.ensure_future(collect(server.port, frames[i])) for i in range(N_CLIENTS)]
+        await waitFor(lambda: server.nClients == N_CLIENTS)
+        await server.serve(duration=1.0)
+        #The clients are flushed and disconnected
+        await asyncio.wait_for(asyncio.gather(*clients), 5.0)
+        assert server.nClients == 0
+        return server, frames
+
+    server, frames = asyncio.run(run())
+
+    assert server.nFrames > 0
+    nMissed = 0
+    for clientFrames in frames:
+        assert len(clientFrames) > 0
+        for streamID, sequence, samplingRate, chunk in clientFrames:
+            if streamID == 0:
+                assert samplingRate == 128
+                assert chunk.shape[1:] == (4, 1)
+                assert 1 <= chunk.shape[0] <= 13
+            else:
+                assert streamID == 1
+                assert samplingRate == 10
+                assert chunk.shape == (1, 4, 2)
+        nMissed += checkSequences(clientFrames, 0) + checkSequences(clientFrames, 1)
+    #The stream options reach the generator; fNIRS data are not all zeros
+    fNIRSChunks = [chunk for streamID, sequence, samplingRate, chunk in frames[0] if streamID == 1]
+    assert len(fNIRSChunks) > 0
+    assert np.any(np.concatenate(fNIRSChunks) != 0)
+    if server.nDropped == 0:
+        assert nMissed == 0
+#end test_broadcast()
+
+
+def test_dropOldest():
+    chunkSize = 100 # 1000 Hz x 0.1 s
+    generator = constantGenerator()
+
+    async def run():
+        server = streamingServer([generator], port=0, rng=1, realTime=False, queueSize=4)
+        await server.start()
+        frames = [list() for i in range(N_CLIENTS)]
+        clients = [asyncio.ensure_future(collect(server.port, frames[i])) for i in range(N_CLIENTS - 1)]
+
+        resumed = asyncio.Event()
+
+        async def slow():
+            #Stops reading after the first frame until far more frames than
+            #its queue and socket buffers hold were broadcast, then reads to the end
+            async for frame in subscribe(port=server.port):
+                frames[-1].append(frame)
+                if len(frames[-1]) == 1:
+                    await waitFor(lambda: server.nFrames >= N_STALLED_FRAMES, timeout=60.0)
+                    resumed.set()
+
+        clients.append(asyncio.ensure_future(slow()))
+        await waitFor(lambda: server.nClients == N_CLIENTS)
+        serving = asyncio.ensure_future(server.serve())
+        await asyncio.wait_for(resumed.wait(), 60.0)
+        nFrames = server.nFrames
+        await waitFor(lambda: server.nFrames >= nFrames + 100, timeout=60.0)
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        await asyncio.wait_for(asyncio.gather(*clients), 5.0)
+        assert server.nClients == 0
+        return server, frames
+
+    server, frames = asyncio.run(run())
+
+    assert server.nDropped > 0
+    #Every frame dropped is a gap in the sequence numbers of its client
+    nMissed = [checkSequences(clientFrames, 0) for clientFrames in frames]
+    assert all(n % chunkSize == 0 for n in nMissed)
+    assert sum(nMissed) // chunkSize == server.nDropped
+    assert nMissed[-1] > 0
+    assert all(len(clientFrames) > 0 for clientFrames in frames)
+#end test_dropOldest()
+
+
+def test_synthesisError():
+    #An unknown parameter of execute fails in the worker thread
+    sgfNIRS = fNIRSSignalGenerator()
+
+    async def run():
+        server = streamingServer([makeEEG(), sgfNIRS], port=0, rng=1, realTime=False, \
+                                 streamOptions=[None, dict(ExpNoise=1)])
+        await server.start()
+        frames = list()
+        client = asyncio.ensure_future(collect(server.port, frames))
+        await waitFor(lambda: server.nClients == 1)
+        with pytest.raises(TypeError):
+            await asyncio.wait_for(server.serve(), 10.0)
+        await asyncio.wait_for(client, 5.0)
+        assert server.nClients == 0
+        return frames
+
+    frames = asyncio.run(run())
+
+    assert all(streamID == 0 for streamID, sequence, samplingRate, chunk in frames)
+#end test_synthesisError()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#
+#File: test_syntheticDataset.py
+#
+'''
+Tests of :mod:`syntheticDataset`.
+'''
+
+import numpy as np
+import pytest
+
+from Create_Data import NOISE_TYPES
+from syntheticDataset import SyntheticfNIRSDataset
+
+
+def test_defaults():
+    #Without a noise bank, the experimental noise types are left out
+    dataset = SyntheticfNIRSDataset(nSubjects=2)
+    nTypes = sum(1 for elem in NOISE_TYPES if elem[4] == 0)
+    assert dataset.shape == (nTypes, 1, 4, 3, 2)
+    data, boxcarAmp, channelAmp = dataset[-1]
+    assert data.shape == (3000, 4, 2)
+    assert not data.flags.writeable
+    assert np.array_equal(SyntheticfNIRSDataset(nSubjects=2, cacheSize=0)[-1][0], data)
+#end test_defaults()
+
+
+def test_experimentalNoiseNeedsBank():
+    with pytest.raises(ValueError):
+        SyntheticfNIRSDataset(noiseTypes=NOISE_TYPES)
+#end test_experimentalNoiseNeedsBank()